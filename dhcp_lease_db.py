@@ -14,26 +14,26 @@
 #    License for the specific language governing permissions and limitations
 #    under the License..
 
-import os
-import sys
-from time import sleep
+import binascii
+import heapq
+import re
+import socket
 
-import ovs.dirs
 import ovs.db.idl
 import ovs.vlog
+from ovsdb_client import OVSDBClient
+from ovsdb_client import OVSDBClientError
 
 vlog = ovs.vlog.Vlog("dhcp_lease_db")
 
-# ovs definitions
-idl = None
-
 # OPS_TODO: Need to pull this from the build env
 def_db = 'unix:/var/run/openvswitch/db.sock'
 
 # OPS_TODO: Need to pull this from the build env
 dhcp_lease_db_schema = '/usr/share/openvswitch/dhcp_leases.ovsschema'
 
-# DHCP lease tabe names
+# DHCP lease db and table names
+DHCP_LEASES_DB = "dhcp_leases"
 DHCP_LEASES_TABLE = "DHCP_Lease"
 
 # DHCP lease db column names
@@ -43,93 +43,384 @@ IP_ADDR = "ip_address"
 CLIENT_HOSTNAME = "client_hostname"
 CLIENT_ID = "client_id"
 
+DHCP_LEASE_COLUMNS = [EXPIRY_TIME, MAC_ADDR, IP_ADDR, CLIENT_HOSTNAME,
+                      CLIENT_ID]
+
+# Value of the missing lease fields in the DB and in the script output
+DHCP_LEASE_NO_VALUE = "*"
+
+MAC_ADDR_RE = re.compile(r'^([0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}$')
+
+
+def parse_lease_value(value):
+    if value is None or value == "" or value == DHCP_LEASE_NO_VALUE:
+        return None
+
+    return value
+
+
+def parse_expiry_time(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_mac_addr(value):
+    '''
+    Returns a MAC address as 6 bytes. Other client identifiers, such as
+    DHCPv6 DUIDs, are kept as they are.
+    '''
+    value = parse_lease_value(value)
+    if value is not None and MAC_ADDR_RE.match(value):
+        return binascii.unhexlify(value.replace(":", ""))
+
+    return value
+
+
+def format_mac_addr(mac):
+    # A MAC address in text form is never 6 characters long
+    if mac is not None and len(mac) == 6:
+        return ":".join("%02x" % ord(c) for c in mac)
+
+    return mac
+
+
+def parse_ip_addr(value):
+    '''
+    Returns an IPv4 or IPv6 address packed in 4 or 16 bytes, or None if
+    the value is not an IP address.
+    '''
+    value = parse_lease_value(value)
+    if value is None:
+        return None
+
+    family = socket.AF_INET6 if ":" in value else socket.AF_INET
+    try:
+        return socket.inet_pton(family, str(value))
+    except socket.error:
+        return None
+
+
+def format_ip_addr(ip):
+    if ip is None:
+        return None
+
+    family = socket.AF_INET if len(ip) == 4 else socket.AF_INET6
+    return socket.inet_ntop(family, ip)
+
+
+class DHCPLease(object):
+    '''
+    Lease record shared by the leases script, the lease service and the
+    lease DB. The expiry time is an int, a MAC address is stored in 6
+    bytes and the IP address is packed. Missing values are None.
+    '''
+    __slots__ = ('expiry_time', 'mac', 'ip', 'client_hostname', 'client_id')
+
+    def __init__(self, expiry_time=None, mac=None, ip=None,
+                 client_hostname=None, client_id=None):
+        self.expiry_time = expiry_time
+        self.mac = mac
+        self.ip = ip
+        self.client_hostname = client_hostname
+        self.client_id = client_id
+
+    @property
+    def mac_address(self):
+        return format_mac_addr(self.mac)
+
+    @property
+    def ip_address(self):
+        return format_ip_addr(self.ip)
+
+    def __eq__(self, other):
+        return isinstance(other, DHCPLease) and \
+            all(getattr(self, field) == getattr(other, field)
+                for field in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+def dhcp_lease_from_values(expiry_time, mac_address, ip_address,
+                           client_hostname, client_id):
+    '''
+    Returns the lease of the text values of the lease fields, as passed
+    by dnsmasq or stored in the lease DB.
+    '''
+    return DHCPLease(parse_expiry_time(expiry_time),
+                     parse_mac_addr(mac_address),
+                     parse_ip_addr(ip_address),
+                     parse_lease_value(client_hostname),
+                     parse_lease_value(client_id))
+
+
+def dhcp_lease_from_row(ovs_rec):
+    '''
+    Returns the lease of a lease table IDL row.
+    '''
+    return dhcp_lease_from_values(
+        ovs_rec.expiry_time, ovs_rec.mac_address, ovs_rec.ip_address,
+        ovs_rec.client_hostname[0] if ovs_rec.client_hostname else None,
+        ovs_rec.client_id[0] if ovs_rec.client_id else None)
+
+
+def _json_value(value):
+    # Optional columns are sets in the JSON-RPC rows
+    if isinstance(value, list) and value[0] == "set":
+        return value[1][0] if value[1] else None
+
+    return value
+
+
+def dhcp_lease_from_json(row):
+    '''
+    Returns the lease of a lease table row selected over JSON-RPC.
+    '''
+    return dhcp_lease_from_values(
+        *[_json_value(row.get(column)) for column in DHCP_LEASE_COLUMNS])
+
+
+def _row_value(value):
+    if value is None:
+        return DHCP_LEASE_NO_VALUE
+
+    return value
+
+
+def dhcp_lease_row(dhcp_lease):
+    '''
+    Returns the OVSDB row of a lease, as used in insert and update
+    operations. Missing values are stored as "*".
+    '''
+    expiry_time = dhcp_lease.expiry_time
+    if expiry_time is not None:
+        expiry_time = str(expiry_time)
+
+    return {EXPIRY_TIME: _row_value(expiry_time),
+            MAC_ADDR: _row_value(dhcp_lease.mac_address),
+            IP_ADDR: _row_value(dhcp_lease.ip_address),
+            CLIENT_HOSTNAME: _row_value(dhcp_lease.client_hostname),
+            CLIENT_ID: _row_value(dhcp_lease.client_id)}
+
+
+def lease_expiry_time(value):
+    '''
+    Returns the expiry time (secs since the epoch) of a lease, or None
+    for a lease which doesn't expire or has no valid expiry time.
+    '''
+    try:
+        expiry_time = int(value)
+    except (TypeError, ValueError):
+        return None
+
+    # dnsmasq reports infinite leases with a zero expiry time
+    if expiry_time <= 0:
+        return None
+
+    return expiry_time
+
+
+def dhcp_lease_insert_op(dhcp_lease):
+    return {"op": "insert", "table": DHCP_LEASES_TABLE,
+            "row": dhcp_lease_row(dhcp_lease)}
+
+
+class DHCPLeaseIdl(ovs.db.idl.Idl):
+    '''
+    IDL of the DHCP lease DB which keeps hash indexes from the MAC
+    address, IP address and client id of the leases to their rows.
+    The indexes are maintained from the IDL change notifications, so
+    lookups don't walk the lease table.
+
+    expiry_heap is a min-heap of (expiry time, row uuid) of the leases.
+    Entries are only pushed, an entry is stale if its row was deleted
+    or has another expiry time since.
+
+    row_listener, if set, is called with the event and the row of every
+    lease table change once the indexes are updated.
+    '''
+    def __init__(self, remote, schema_helper, row_listener=None):
+        super(DHCPLeaseIdl, self).__init__(remote, schema_helper)
+        self.row_listener = row_listener
+        self.row_keys = {}
+        self.index = {MAC_ADDR: {}, IP_ADDR: {}, CLIENT_ID: {}}
+        self.expiry_heap = []
+
+    def __index_remove(self, row_uuid):
+        keys = self.row_keys.pop(row_uuid, None)
+        if keys is None:
+            return
+
+        for column, key in keys:
+            row_uuids = self.index[column].get(key)
+            if row_uuids is not None:
+                row_uuids.discard(row_uuid)
+                if not row_uuids:
+                    del self.index[column][key]
+
+    def __index_add(self, row):
+        keys = [(MAC_ADDR, row.mac_address), (IP_ADDR, row.ip_address)]
+        if row.client_id:
+            keys.append((CLIENT_ID, row.client_id[0]))
+
+        for column, key in keys:
+            self.index[column].setdefault(key, set()).add(row.uuid)
+
+        self.row_keys[row.uuid] = keys
+
+        expiry_time = lease_expiry_time(row.expiry_time)
+        if expiry_time is not None:
+            heapq.heappush(self.expiry_heap, (expiry_time, row.uuid))
+
+    def notify(self, event, row, updates=None):
+        self.__index_remove(row.uuid)
+        if event != ovs.db.idl.ROW_DELETE:
+            self.__index_add(row)
+
+        if self.row_listener is not None:
+            self.row_listener(event, row)
+
+    def find_rows(self, column, key):
+        '''
+        Returns the rows of the lease table whose indexed column has
+        the given value.
+        '''
+        rows = self.tables[DHCP_LEASES_TABLE].rows
+        return [rows[row_uuid]
+                for row_uuid in self.index[column].get(key, ())
+                if row_uuid in rows]
+
 
 class DHCPLeaseDB(object):
-    def __init__(self, location=None):
+    def __init__(self, location=None, row_listener=None):
         '''
-        Create a IDL connection to the DHCP lease DB and register all the
-        columns with schema helper.
+        Create a connection to the DHCP lease DB. Transactions are sent
+        with a JSON-RPC client and only touch the rows they target. The
+        IDL, which downloads the whole lease table, is only created when
+        the table has to be read through the idl attribute. It is synced
+        by run() and wait() from the daemon's poll loop.
+        row_listener is passed to the IDL.
         '''
-        self.idl = None
-        self.txn = None
+        self._idl = None
+        self.row_listener = row_listener
         self.schema_helper = ovs.db.idl.SchemaHelper(
             location=dhcp_lease_db_schema)
         self.schema_helper.register_table(DHCP_LEASES_TABLE)
 
-        self.idl = ovs.db.idl.Idl(def_db, self.schema_helper)
+        self.client = OVSDBClient(def_db)
+
+    def open_idl(self):
+        '''
+        Creates the IDL of the DHCP lease DB, if not done yet, without
+        waiting for it to sync. Its lease table is empty until
+        is_synced().
+        '''
+        if self._idl is None:
+            self._idl = DHCPLeaseIdl(def_db, self.schema_helper,
+                                     self.row_listener)
+
+        return self._idl
+
+    @property
+    def idl(self):
+        return self.open_idl()
+
+    def is_synced(self):
+        '''
+        Checks if the IDL has been created and has received the lease
+        table from ovsdb-server.
+        '''
+        return self._idl is not None and self._idl.change_seqno != 0
+
+    def run(self):
+        '''
+        Processes the updates of the IDL, if it has been created.
+        '''
+        if self._idl is not None:
+            self._idl.run()
+
+    def wait(self, poller):
+        if self._idl is not None:
+            self._idl.wait(poller)
 
-        self.expiry_time = None
-        self.mac_address = None
-        self.ip_address = None
-        self.client_hostname = None
-        self.client_id = None
+    def __find_row(self, column, key):
+        rows = self.idl.find_rows(column, key)
+        if not rows:
+            return None, False
 
-        while not self.idl.run():
-            sleep(.1)
+        return rows[0], True
 
     def find_row_by_mac_addr(self, mac_addr):
         '''
-        Walk through the rows in the dhcp lease table (if any)
-        looking for a row with mac addr passed in argument
+        Look up the row with mac addr passed in argument in the
+        mac addr index of the dhcp lease table.
 
         If row is found, set variable tbl_found to True and return
         the row object to caller function
         '''
-        tbl_found = False
-        ovs_rec = None
-        for ovs_rec in self.idl.tables[DHCP_LEASES_TABLE].rows.itervalues():
-            if ovs_rec.mac_address == mac_addr:
-                tbl_found = True
-                break
+        return self.__find_row(MAC_ADDR, mac_addr)
 
-        return ovs_rec, tbl_found
+    def find_row_by_ip_addr(self, ip_addr):
+        return self.__find_row(IP_ADDR, ip_addr)
 
-    def __set_column_value(self, row, entry):
+    def find_row_by_client_id(self, client_id):
+        return self.__find_row(CLIENT_ID, client_id)
 
-        if entry[EXPIRY_TIME] != None:
-            setattr(row, EXPIRY_TIME, entry[EXPIRY_TIME])
-
-        if entry[MAC_ADDR] != None:
-            setattr(row, MAC_ADDR, entry[MAC_ADDR])
-
-        if entry[IP_ADDR] != None:
-            setattr(row, IP_ADDR, entry[IP_ADDR])
+    def find_ip_conflict(self, ip_addr, mac_addr):
+        '''
+        Returns the other mac addr the ip addr is leased to, or None if
+        there is no such lease. The lookup uses the ip addr index of the
+        IDL, which must be synced.
+        '''
+        for ovs_rec in self._idl.find_rows(IP_ADDR, ip_addr):
+            if ovs_rec.mac_address != mac_addr:
+                return ovs_rec.mac_address
+        return None
 
-        if entry[CLIENT_HOSTNAME] != None:
-            setattr(row, CLIENT_HOSTNAME, entry[CLIENT_HOSTNAME])
+    def __transact(self, ops):
+        '''
+        Executes the operations in a single transaction and returns the
+        operation results and the transaction status.
+        '''
+        try:
+            results = self.client.transact(DHCP_LEASES_DB, ops)
+        except OVSDBClientError as e:
+            vlog.err("dhcp_lease_db transaction failed: %s" % (e))
+            return None, ovs.db.idl.Transaction.ERROR
 
-        if entry[CLIENT_ID] != None:
-            setattr(row, CLIENT_ID, entry[CLIENT_ID])
+        return results, ovs.db.idl.Transaction.SUCCESS
 
-    def insert_row(self, entry):
+    def insert_row(self, dhcp_lease):
         '''
         Insert a new row in dhcp_lease_db and update the columns with
         user configured values. Default values are used if user hasn't
         configured any parameter.
         '''
-        self.txn = ovs.db.idl.Transaction(self.idl)
-        row = self.txn.insert(self.idl.tables[DHCP_LEASES_TABLE])
-
-        self.__set_column_value(row, entry)
+        results, status = self.__transact([dhcp_lease_insert_op(dhcp_lease)])
 
-        status = self.txn.commit_block()
+        row = None
+        if results is not None:
+            row = results[0]["uuid"][1]
 
         return row, status
 
-    def update_row(self, mac_addr, entry):
+    def update_row(self, mac_addr, dhcp_lease):
         '''
-        Update a DHCP row with latest modified values.
+        Update a DHCP row with latest modified values. The row is
+        selected by mac addr in ovsdb-server, so the cost doesn't
+        depend on the size of the lease table. A new row is inserted
+        if there is no row for the mac addr.
         '''
-        self.txn = ovs.db.idl.Transaction(self.idl)
-        row, row_found = self.find_row_by_mac_addr(mac_addr)
-
-        if row_found:
-            self.__set_column_value(row, entry)
-
-            status = self.txn.commit_block()
+        row = None
+        results, status = self.__transact([
+            {"op": "update", "table": DHCP_LEASES_TABLE,
+             "where": [[MAC_ADDR, "==", mac_addr]],
+             "row": dhcp_lease_row(dhcp_lease)}])
 
-        else:
-            row, status = self.insert_row(entry)
+        if results is not None and results[0]["count"] == 0:
+            row, status = self.insert_row(dhcp_lease)
 
         return row, status
 
@@ -141,37 +432,91 @@ class DHCPLeaseDB(object):
         If specified row is found, variable row_found
         is updated to True and delete status is returned.
         '''
-        self.txn = ovs.db.idl.Transaction(self.idl)
-        row, row_found = self.find_row_by_mac_addr(mac_addr)
-        status = ovs.db.idl.Transaction.UNCHANGED
+        row_found = False
+        results, status = self.__transact([
+            {"op": "delete", "table": DHCP_LEASES_TABLE,
+             "where": [[MAC_ADDR, "==", mac_addr]]}])
 
-        if row_found:
-            row.delete()
-            status = self.txn.commit_block()
+        if results is not None:
+            row_found = results[0]["count"] > 0
+            if not row_found:
+                status = ovs.db.idl.Transaction.UNCHANGED
 
         return row_found, status
 
-    def clear_db(self):
+    def select_leases(self, where):
         '''
-        Delete a all rows from dhcp_lease_db
+        Returns the rows of the lease table matching the where clauses,
+        as JSON objects of the lease columns. The rows are selected by
+        ovsdb-server, the lease table isn't synced.
         '''
-        ovs_rec = None
-        row_deleted = False
-        self.txn = ovs.db.idl.Transaction(self.idl)
-        status = ovs.db.idl.Transaction.UNCHANGED
+        results, status = self.__transact([
+            {"op": "select", "table": DHCP_LEASES_TABLE,
+             "where": where, "columns": DHCP_LEASE_COLUMNS}])
+
+        if results is None:
+            return []
+
+        return results[0]["rows"]
 
-        while True:
-            for ovs_rec in self.idl.tables[DHCP_LEASES_TABLE].rows.itervalues():
-                ovs_rec.delete()
-                row_deleted = True
-                break
-            else:
-                break
+    def write_leases(self, leases):
+        '''
+        Writes a batch of lease changes in a single transaction.
+        leases is a list of (mac addr, lease) tuples, the lease of
+        the mac addr is replaced by lease, or deleted if lease is None.
+        '''
+        ops = []
+        for mac_addr, dhcp_lease in leases:
+            ops.append({"op": "delete", "table": DHCP_LEASES_TABLE,
+                        "where": [[MAC_ADDR, "==", mac_addr]]})
+            if dhcp_lease is not None:
+                ops.append(dhcp_lease_insert_op(dhcp_lease))
 
-        if row_deleted == True:
-            status = self.txn.commit_block()
+        if not ops:
+            return ovs.db.idl.Transaction.UNCHANGED
 
+        results, status = self.__transact(ops)
         return status
 
+    def delete_expired_leases(self, leases):
+        '''
+        Deletes a batch of expired leases in a single transaction.
+        leases is a list of (mac addr, expiry time) tuples, a lease
+        is only deleted if it wasn't renewed meanwhile.
+
+        Returns the number of rows removed and the delete status.
+        '''
+        rows_removed = 0
+        results, status = self.__transact([
+            {"op": "delete", "table": DHCP_LEASES_TABLE,
+             "where": [[MAC_ADDR, "==", mac_addr],
+                       [EXPIRY_TIME, "==", expiry_time]]}
+            for mac_addr, expiry_time in leases])
+
+        if results is not None:
+            rows_removed = sum(result["count"] for result in results)
+
+        return rows_removed, status
+
+    def clear_db(self):
+        '''
+        Delete all rows from dhcp_lease_db with a single delete
+        operation, without syncing the lease table.
+
+        Returns the number of rows removed and the delete status.
+        '''
+        rows_removed = 0
+        results, status = self.__transact([
+            {"op": "delete", "table": DHCP_LEASES_TABLE, "where": []}])
+
+        if results is not None:
+            rows_removed = results[0]["count"]
+            if rows_removed == 0:
+                status = ovs.db.idl.Transaction.UNCHANGED
+
+        return rows_removed, status
+
     def close(self):
-        self.idl.close()
+        self.client.close()
+        if self._idl is not None:
+            self._idl.close()
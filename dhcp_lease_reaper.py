@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - Removes the expired leases from the DHCP leases DB. dnsmasq runs
+   with --leasefile-ro and only sends a del event for the leases it
+   knows about, so the leases expiring while dnsmasq is down or
+   restarting would otherwise stay in the DB forever.
+ - The leases are taken in expiry time order from the expiry heap of
+   the lease DB IDL and the reaper only wakes up at the next expiry.
+ - The reaper is only run once the lease DB IDL has synced the lease
+   table, the IDL is synced from the daemon's poll loop.
+'''
+
+import heapq
+import time
+
+import ovs.db.idl
+import ovs.timeval
+import ovs.vlog
+from dhcp_lease_db import DHCP_LEASES_TABLE
+from dhcp_lease_db import lease_expiry_time
+
+vlog = ovs.vlog.Vlog("dhcp_lease_reaper")
+
+# Time (secs) after which a failed delete is retried
+RETRY_INTERVAL = 5
+
+
+class DHCPLeaseReaper(object):
+    def __init__(self, dhcp_leases, batch_size=256):
+        '''
+        dhcp_leases is the DHCPLeaseDB of the expired leases. At most
+        batch_size leases are deleted per transaction.
+        '''
+        self.dhcp_leases = dhcp_leases
+        self.batch_size = batch_size
+        self.retry_time = None
+        self.stats = {'leases_reaped': 0,
+                      'lease_reaper_runs': 0,
+                      'lease_reaper_errors': 0,
+                      'lease_reaper_last_run_msecs': 0}
+
+    def __next_lease(self):
+        '''
+        Returns the (expiry time, row) of the lease expiring first,
+        dropping the stale heap entries, or None if no lease expires.
+        '''
+        idl = self.dhcp_leases.idl
+        rows = idl.tables[DHCP_LEASES_TABLE].rows
+
+        while idl.expiry_heap:
+            expiry_time, row_uuid = idl.expiry_heap[0]
+            ovs_rec = rows.get(row_uuid)
+            if ovs_rec is not None and \
+               lease_expiry_time(ovs_rec.expiry_time) == expiry_time:
+                return expiry_time, ovs_rec
+            heapq.heappop(idl.expiry_heap)
+
+        return None
+
+    def next_expiry_time(self):
+        lease = self.__next_lease()
+        if lease is None:
+            return None
+
+        return lease[0]
+
+    def run(self):
+        '''
+        Deletes the expired leases in batches.
+        '''
+        now = time.time()
+        if self.retry_time is not None and now < self.retry_time:
+            return
+        self.retry_time = None
+
+        lease = self.__next_lease()
+        if lease is None or lease[0] > now:
+            return
+
+        start = ovs.timeval.msec()
+        idl = self.dhcp_leases.idl
+
+        while lease is not None and lease[0] <= now:
+            heap_entries = []
+            leases = []
+            while lease is not None and lease[0] <= now and \
+                    len(leases) < self.batch_size:
+                heap_entries.append(heapq.heappop(idl.expiry_heap))
+                leases.append((lease[1].mac_address, lease[1].expiry_time))
+                lease = self.__next_lease()
+
+            rows_removed, status = \
+                self.dhcp_leases.delete_expired_leases(leases)
+
+            if status != ovs.db.idl.Transaction.SUCCESS:
+                self.stats['lease_reaper_errors'] += 1
+                vlog.err("dhcp_lease_reaper - delete of %d expired leases "
+                         "failed: %s" % (len(leases), status))
+                for heap_entry in heap_entries:
+                    heapq.heappush(idl.expiry_heap, heap_entry)
+                self.retry_time = now + RETRY_INTERVAL
+                break
+
+            self.stats['leases_reaped'] += rows_removed
+
+        self.stats['lease_reaper_runs'] += 1
+        self.stats['lease_reaper_last_run_msecs'] = \
+            ovs.timeval.msec() - start
+
+    def wait(self, poller):
+        '''
+        Makes the poller wake up at the next lease expiry.
+        '''
+        if self.retry_time is not None:
+            expiry_time = self.retry_time
+        else:
+            expiry_time = self.next_expiry_time()
+
+        if expiry_time is not None:
+            poller.timer_wait(max(0, int((expiry_time - time.time()) * 1000)))
@@ -0,0 +1,510 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - Lease service run inside the DHCP-TFTP daemon. It listens on a unix
+   socket for the lease events forwarded by the dhcp_leases_client
+   script and handles them over a DHCP leases DB connection that is
+   kept open for the lifetime of the daemon, instead of starting a
+   python interpreter and syncing the leases DB for every event.
+ - With the group commit mode, add/old/del events are queued and the
+   events of a MAC are merged into its latest lease change. The queue
+   is written as one OVSDB transaction every commit_interval msecs or
+   every commit_batch queued MACs. Queued events are lost if the daemon
+   dies before they are written, the sync mode writes every event in
+   its own transaction before replying to dnsmasq.
+ - Client connections are served from the daemon's poll loop, their
+   requests are read and their replies written without blocking.
+ - The leases replayed to dnsmasq on init are taken from the lease
+   snapshot file when it is available, see dhcp_lease_snapshot.
+ - The IP address of an added lease is checked against the other
+   leases with the ip addr index of the lease table IDL. Until the IDL
+   is synced, the added leases are kept aside and checked once it is,
+   so an add event never waits for ovsdb-server.
+'''
+
+import errno
+import json
+import os
+import socket
+import StringIO
+import time
+from collections import OrderedDict
+
+import ovs.db.idl
+import ovs.poller
+import ovs.timeval
+import ovs.vlog
+from dhcp_lease_db import DHCPLeaseDB
+from dhcp_lease_db import DHCP_LEASES_TABLE
+from dhcp_lease_db import MAC_ADDR
+from dhcp_lease_db import dhcp_lease_from_json
+from dhcp_lease_db import dhcp_lease_from_row
+from dhcp_lease_reaper import DHCPLeaseReaper
+from dhcp_lease_snapshot import DHCPLeaseSnapshot
+from dhcp_leases import parse_dhcp_lease_args
+from dhcp_leases import parse_dhcp_leases_show_args
+from dhcp_leases import dhcp_leases_init_entries
+from dhcp_leases import dhcp_leases_show_entries
+from dhcp_leases import dhcp_leases_show_filter
+from dhcp_leases import dhcp_leases_unexpired
+from dhcp_leases import write_dhcp_leases
+from dhcp_leases import SHOW_FORMAT_TEXT
+from dhcp_leases_client import DHCP_LEASE_SERVICE_SOCKET
+
+vlog = ovs.vlog.Vlog("dhcp_lease_service")
+
+# Time (msecs) a client connection may stay idle before it is dropped
+REQUEST_TIMEOUT = 1000
+MAX_REQUEST_SIZE = 65536
+
+# Lease commit modes
+LEASE_COMMIT_SYNC = "sync"
+LEASE_COMMIT_GROUP = "group"
+LEASE_COMMIT_MODES = [LEASE_COMMIT_SYNC, LEASE_COMMIT_GROUP]
+
+
+class DHCPLeaseConnection(object):
+    def __init__(self, conn):
+        '''
+        Client connection of the lease service. The request is read and
+        the reply is written as the socket gets ready, so that a slow
+        client doesn't block the daemon.
+        '''
+        self.conn = conn
+        self.conn.setblocking(False)
+        self.request = ""
+        self.reply = None
+        self.deadline = ovs.timeval.msec() + REQUEST_TIMEOUT
+
+    def timed_out(self):
+        return ovs.timeval.msec() >= self.deadline
+
+    def recv(self):
+        '''
+        Reads the available request data. Returns True once the request
+        is complete.
+        '''
+        while True:
+            try:
+                chunk = self.conn.recv(4096)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return False
+                raise
+
+            if not chunk:
+                return True
+
+            self.request += chunk
+            self.deadline = ovs.timeval.msec() + REQUEST_TIMEOUT
+            if self.request.endswith("\n") or \
+               len(self.request) >= MAX_REQUEST_SIZE:
+                return True
+
+    def send(self):
+        '''
+        Writes as much of the reply as the socket accepts. Returns True
+        once the whole reply is written.
+        '''
+        while self.reply:
+            try:
+                sent = self.conn.send(self.reply)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return False
+                raise
+
+            self.reply = self.reply[sent:]
+            self.deadline = ovs.timeval.msec() + REQUEST_TIMEOUT
+
+        return True
+
+    def wait(self, poller):
+        if self.reply is None:
+            poller.fd_wait(self.conn.fileno(), ovs.poller.POLLIN)
+        else:
+            poller.fd_wait(self.conn.fileno(), ovs.poller.POLLOUT)
+        poller.timer_wait_until(self.deadline)
+
+    def close(self):
+        self.conn.close()
+
+
+class DHCPLeaseService(object):
+    def __init__(self, path=DHCP_LEASE_SERVICE_SOCKET,
+                 commit_mode=LEASE_COMMIT_GROUP, commit_interval=100,
+                 commit_batch=64):
+        '''
+        The leases DB connection is opened on the first request, so that
+        the daemon startup doesn't wait for the leases DB to sync.
+        commit_interval (msecs) and commit_batch bound the delay and the
+        size of the group commits.
+        '''
+        self.path = path
+        self.sock = None
+        self.connections = []
+        self.dhcp_leases = None
+        self.reaper = None
+        self.snapshot = DHCPLeaseSnapshot()
+        self.snapshot_reconciled = False
+        self.commit_mode = commit_mode
+        self.commit_interval = commit_interval
+        self.commit_batch = commit_batch
+        self.commit_deadline = None
+        self.pending_leases = OrderedDict()
+        self.unchecked_leases = OrderedDict()
+        self.stats = {'lease_requests': 0,
+                      'lease_request_errors': 0,
+                      'lease_ip_conflicts': 0,
+                      'lease_events_merged': 0,
+                      'lease_commits': 0,
+                      'lease_commit_errors': 0,
+                      'lease_init_leases': 0,
+                      'lease_init_msecs': 0}
+
+    def open(self):
+        sock_dir = os.path.dirname(self.path)
+        if not os.path.isdir(sock_dir):
+            os.makedirs(sock_dir)
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(128)
+        self.sock.setblocking(False)
+
+        if self.snapshot.load():
+            vlog.info("dhcp_lease_service - loaded %d leases from the lease "
+                      "snapshot" % (len(self.snapshot.records)))
+
+    def close(self):
+        for connection in self.connections:
+            connection.close()
+        self.connections = []
+
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            os.unlink(self.path)
+
+        if self.dhcp_leases is not None:
+            self.flush()
+            self.dhcp_leases.close()
+            self.dhcp_leases = None
+            self.reaper = None
+
+        self.snapshot.close()
+
+    def __lease_db(self):
+        if self.dhcp_leases is None:
+            self.dhcp_leases = DHCPLeaseDB(row_listener=self.__lease_changed)
+            self.reaper = DHCPLeaseReaper(self.dhcp_leases)
+
+            # The lease table is synced by run() and wait() from the
+            # poll loop
+            self.dhcp_leases.open_idl()
+
+        return self.dhcp_leases
+
+    def run(self):
+        '''
+        Processes the leases DB updates and serves the pending requests.
+        '''
+        if self.dhcp_leases is not None:
+            self.dhcp_leases.run()
+
+            # The lease table is only read once the IDL has synced it
+            if self.dhcp_leases.is_synced():
+                if not self.snapshot_reconciled:
+                    rows = self.dhcp_leases.idl.tables[DHCP_LEASES_TABLE].rows
+                    self.snapshot.reconcile(dhcp_lease_from_row(ovs_rec)
+                                            for ovs_rec in rows.itervalues())
+                    self.snapshot_reconciled = True
+
+                self.__check_ip_conflicts()
+                self.reaper.run()
+
+        if self.commit_deadline is not None and \
+           ovs.timeval.msec() >= self.commit_deadline:
+            self.flush()
+
+        while True:
+            try:
+                conn, addr = self.sock.accept()
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+
+            self.stats['lease_requests'] += 1
+            self.connections.append(DHCPLeaseConnection(conn))
+
+        for connection in list(self.connections):
+            if self.__serve(connection):
+                connection.close()
+                self.connections.remove(connection)
+
+    def wait(self, poller):
+        poller.fd_wait(self.sock.fileno(), ovs.poller.POLLIN)
+
+        for connection in self.connections:
+            connection.wait(poller)
+
+        if self.dhcp_leases is not None:
+            self.dhcp_leases.wait(poller)
+            if self.dhcp_leases.is_synced():
+                self.reaper.wait(poller)
+
+        if self.commit_deadline is not None:
+            poller.timer_wait_until(self.commit_deadline)
+
+    def __queue_lease(self, mac_addr, dhcp_lease):
+        '''
+        Queues the lease change of a MAC, replacing its pending change.
+        dhcp_lease is None for a lease delete.
+        '''
+        if mac_addr in self.pending_leases:
+            del self.pending_leases[mac_addr]
+            self.stats['lease_events_merged'] += 1
+
+        self.pending_leases[mac_addr] = dhcp_lease
+
+        if self.commit_deadline is None:
+            self.commit_deadline = ovs.timeval.msec() + self.commit_interval
+
+        if len(self.pending_leases) >= self.commit_batch:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes the queued lease changes in a single transaction.
+        '''
+        self.commit_deadline = None
+        if not self.pending_leases:
+            return
+
+        leases = self.pending_leases.items()
+        self.pending_leases = OrderedDict()
+
+        status = self.__lease_db().write_leases(leases)
+        self.stats['lease_commits'] += 1
+
+        if status != ovs.db.idl.Transaction.SUCCESS:
+            self.stats['lease_commit_errors'] += 1
+            vlog.err("dhcp_lease_service - commit of %d leases failed: %s"
+                     % (len(leases), status))
+            return
+
+        # The snapshot is updated right away, dnsmasq may be restarted
+        # before the lease table IDL gets the changes
+        for mac_addr, dhcp_lease in leases:
+            if dhcp_lease is None:
+                self.snapshot.delete_lease(mac_addr)
+            else:
+                self.snapshot.set_lease(dhcp_lease)
+
+    def __lease_changed(self, event, ovs_rec):
+        '''
+        Applies the lease table changes to the snapshot, including the
+        ones not made by the lease service.
+        '''
+        if not self.snapshot_reconciled:
+            return
+
+        if event != ovs.db.idl.ROW_DELETE:
+            self.snapshot.set_lease(dhcp_lease_from_row(ovs_rec))
+            return
+
+        # Another row of the MAC may have been inserted in the same
+        # transaction
+        rows = self.dhcp_leases.idl.find_rows(MAC_ADDR, ovs_rec.mac_address)
+        if rows:
+            self.snapshot.set_lease(dhcp_lease_from_row(rows[0]))
+        else:
+            self.snapshot.delete_lease(ovs_rec.mac_address)
+
+    def __serve(self, connection):
+        '''
+        Makes progress on a client connection without blocking. Returns
+        True once the connection is done with and can be closed.
+        '''
+        try:
+            if connection.reply is None:
+                if not connection.recv():
+                    if connection.timed_out():
+                        raise socket.timeout("request timed out")
+                    return False
+
+                request = json.loads(connection.request)
+                connection.reply = self.handle_request(request["argv"],
+                                                       request["env"])
+
+            if not connection.send():
+                if connection.timed_out():
+                    raise socket.timeout("reply timed out")
+                return False
+        except (socket.error, ValueError, KeyError, SystemExit) as e:
+            # argparse exits on invalid arguments
+            self.stats['lease_request_errors'] += 1
+            vlog.err("dhcp_lease_service - invalid request: %s" % (e))
+
+        return True
+
+    def handle_request(self, argv, env):
+        '''
+        Handles a lease event with the same arguments and environment
+        dnsmasq passes to the dhcp_leases script and returns the output
+        of the script.
+        '''
+        if len(argv) > 1 and argv[1] == "show":
+            self.flush()
+            return self.__show(parse_dhcp_leases_show_args(argv[2:]))
+
+        command, dhcp_lease = parse_dhcp_lease_args(argv, env)
+        status = ovs.db.idl.Transaction.UNCHANGED
+
+        group_commit = self.commit_mode == LEASE_COMMIT_GROUP
+
+        if command == "init":
+            self.flush()
+            return self.__init_leases()
+        elif command == "add":
+            self.__check_ip_conflict(dhcp_lease)
+            if group_commit:
+                self.__queue_lease(dhcp_lease.mac_address, dhcp_lease)
+            else:
+                row, status = self.__lease_db().insert_row(dhcp_lease)
+        elif command == "old":
+            if group_commit:
+                self.__queue_lease(dhcp_lease.mac_address, dhcp_lease)
+            else:
+                row, status = self.__lease_db().update_row(
+                    dhcp_lease.mac_address, dhcp_lease)
+        elif command == "del":
+            self.unchecked_leases.pop(dhcp_lease.mac_address, None)
+            if group_commit:
+                self.__queue_lease(dhcp_lease.mac_address, None)
+            else:
+                row, status = self.__lease_db().delete_row(
+                    dhcp_lease.mac_address)
+        elif command == "clear":
+            # The queued changes would be removed by the clear anyway
+            self.pending_leases = OrderedDict()
+            self.unchecked_leases = OrderedDict()
+            self.commit_deadline = None
+            rows_removed, status = self.__lease_db().clear_db()
+            vlog.info("dhcp_lease_service - cleared %d leases"
+                      % (rows_removed))
+            if status != ovs.db.idl.Transaction.ERROR:
+                self.snapshot.reconcile([])
+        elif command != "tftp":
+            vlog.err("dhcp_lease_service - invalid command %s" % (command))
+
+        if status not in (ovs.db.idl.Transaction.SUCCESS,
+                          ovs.db.idl.Transaction.UNCHANGED):
+            self.stats['lease_request_errors'] += 1
+            vlog.err("dhcp_lease_service - %s failed: %s" % (command, status))
+        elif status == ovs.db.idl.Transaction.SUCCESS:
+            if command == "add" or command == "old":
+                self.snapshot.set_lease(dhcp_lease)
+            elif command == "del":
+                self.snapshot.delete_lease(dhcp_lease.mac_address)
+
+        return ""
+
+    def __check_ip_conflict(self, dhcp_lease):
+        '''
+        Warns if the IP address of an added lease is leased to another
+        MAC. The check is deferred until the lease table IDL is synced.
+        '''
+        dhcp_leases = self.__lease_db()
+        if not dhcp_leases.is_synced():
+            self.unchecked_leases.pop(dhcp_lease.mac_address, None)
+            self.unchecked_leases[dhcp_lease.mac_address] = dhcp_lease
+            return
+
+        mac_addr = dhcp_leases.find_ip_conflict(dhcp_lease.ip_address,
+                                                dhcp_lease.mac_address)
+        if mac_addr is not None:
+            self.stats['lease_ip_conflicts'] += 1
+            vlog.warn("dhcp_lease_service - %s leased to %s is already "
+                      "leased to %s" % (dhcp_lease.ip_address,
+                                        dhcp_lease.mac_address, mac_addr))
+
+    def __check_ip_conflicts(self):
+        '''
+        Checks the leases added before the lease table IDL was synced.
+        '''
+        if not self.unchecked_leases:
+            return
+
+        unchecked_leases = self.unchecked_leases.values()
+        self.unchecked_leases = OrderedDict()
+        for dhcp_lease in unchecked_leases:
+            self.__check_ip_conflict(dhcp_lease)
+
+    def __init_leases(self):
+        '''
+        Returns the leases replayed to dnsmasq on init. The leases are
+        taken from the lease snapshot if it is available, otherwise they
+        are selected from ovsdb-server, so that the replay doesn't wait
+        for the lease table to be synced.
+        '''
+        start = time.time()
+        out = StringIO.StringIO()
+
+        if self.snapshot.loaded:
+            # Open the leases DB anyway, the snapshot is reconciled with
+            # it once the lease table is synced
+            self.__lease_db()
+            leases = dhcp_leases_unexpired(self.snapshot.leases())
+        else:
+            leases = dhcp_leases_init_entries(self.__lease_db())
+
+        count = write_dhcp_leases(leases, SHOW_FORMAT_TEXT, out)
+
+        self.stats['lease_init_leases'] = count
+        self.stats['lease_init_msecs'] = int((time.time() - start) * 1000)
+        vlog.info("dhcp_lease_service - init replayed %d leases in %d msecs"
+                  % (count, self.stats['lease_init_msecs']))
+
+        return out.getvalue()
+
+    def __show(self, args):
+        '''
+        Returns the output of the show command with the filters of args.
+        The leases are taken from the lease table IDL once it is synced,
+        otherwise the rows matching the exact filters are selected from
+        ovsdb-server.
+        '''
+        where, match = dhcp_leases_show_filter(args)
+        dhcp_leases = self.__lease_db()
+
+        if dhcp_leases.is_synced():
+            rows = dhcp_leases.idl.tables[DHCP_LEASES_TABLE].rows
+            leases = (dhcp_lease_from_row(ovs_rec)
+                      for ovs_rec in rows.itervalues())
+        else:
+            leases = (dhcp_lease_from_json(row)
+                      for row in dhcp_leases.select_leases(where))
+
+        out = StringIO.StringIO()
+        write_dhcp_leases(dhcp_leases_show_entries(leases, match, args),
+                          args.format, out)
+        return out.getvalue()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - Local snapshot of the active leases kept by the lease service, so
+   that the leases replayed to dnsmasq on init don't have to be read
+   from ovsdb-server. The DHCP leases DB stays the source of truth,
+   the snapshot is reconciled with it once the lease table is synced
+   and then follows its changes.
+ - The snapshot file is a header followed by lease records, each made
+   of a fixed-size part and of the MAC address, hostname and client id
+   with their lengths, so that every lease is stored as is. Changes are
+   appended as records, a later record of a MAC replaces the earlier
+   ones. The file is compacted by rewriting the live records to a new
+   file which is fsynced and renamed over the old one, and the rename
+   is fsynced with the directory.
+ - Every record has a CRC, the records after a torn or corrupted
+   record are ignored and truncated when the file is loaded.
+ - The snapshot is best-effort: the appended records are not fsynced,
+   since the lease service already acknowledges the group committed
+   changes before they are written and the snapshot is reconciled with
+   the DHCP leases DB once the lease table is synced. A lease which
+   cannot be recorded disables the snapshot, the leases are then read
+   from the DHCP leases DB.
+'''
+
+import mmap
+import os
+import socket
+import struct
+import zlib
+
+import ovs.vlog
+from dhcp_lease_db import DHCPLease
+from dhcp_lease_db import parse_lease_value
+from dhcp_lease_db import parse_mac_addr
+
+vlog = ovs.vlog.Vlog("dhcp_lease_snapshot")
+
+DHCP_LEASE_SNAPSHOT_FILE = '/var/run/dhcp_tftp/dhcp_leases.snap'
+
+SNAPSHOT_MAGIC = 'DHCPLSN2'
+
+# magic, size of the fixed part of the records
+SNAPSHOT_HEADER = struct.Struct('<8sI4x')
+
+# Fixed part of a record: op, address family, crc, expiry time, packed
+# IP address and the lengths of the MAC address, hostname and client id
+# which follow it
+LEASE_RECORD = struct.Struct('<BBxxIq16sHHH')
+LEASE_RECORD_CRC_OFFSET = 4
+LEASE_RECORD_DATA_OFFSET = 8
+LEASE_RECORD_MAX_FIELD = 0xffff
+
+RECORD_LEASE = 1
+RECORD_DELETE = 2
+
+# Expiry time of the leases without a valid expiry time
+EXPIRY_TIME_UNKNOWN = -1
+
+# Address family of the leases without a valid IP address
+FAMILY_NONE = 0
+
+# Number of stale records above which the snapshot is compacted
+COMPACT_MIN_RECORDS = 1024
+
+
+def _record_field(value):
+    '''
+    Returns the value of a text field of a record, missing values are
+    stored as "*". Raises ValueError if the value does not fit.
+    '''
+    if value is None:
+        return "*"
+
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+
+    if len(value) > LEASE_RECORD_MAX_FIELD:
+        raise ValueError("lease field of %d bytes" % (len(value)))
+
+    return value
+
+
+def pack_lease_record(op, dhcp_lease):
+    expiry_time = dhcp_lease.expiry_time
+    if expiry_time is None:
+        expiry_time = EXPIRY_TIME_UNKNOWN
+
+    if dhcp_lease.ip is None:
+        family = FAMILY_NONE
+        packed_ip_addr = ""
+    elif len(dhcp_lease.ip) == 4:
+        family = socket.AF_INET
+        packed_ip_addr = dhcp_lease.ip
+    else:
+        family = socket.AF_INET6
+        packed_ip_addr = dhcp_lease.ip
+
+    mac_addr = _record_field(dhcp_lease.mac_address)
+    hostname = _record_field(dhcp_lease.client_hostname)
+    client_id = _record_field(dhcp_lease.client_id)
+
+    record = LEASE_RECORD.pack(
+        op, family, 0, expiry_time, packed_ip_addr,
+        len(mac_addr), len(hostname), len(client_id)) + \
+        mac_addr + hostname + client_id
+
+    crc = zlib.crc32(record[LEASE_RECORD_DATA_OFFSET:]) & 0xffffffff
+    return record[:LEASE_RECORD_CRC_OFFSET] + struct.pack('<I', crc) + \
+        record[LEASE_RECORD_DATA_OFFSET:]
+
+
+def lease_record_size(data, offset=0):
+    '''
+    Returns the size of the record at offset, or None if the record is
+    truncated.
+    '''
+    if offset + LEASE_RECORD.size > len(data):
+        return None
+
+    size = LEASE_RECORD.size + sum(LEASE_RECORD.unpack_from(data,
+                                                            offset)[-3:])
+    if offset + size > len(data):
+        return None
+
+    return size
+
+
+def unpack_lease_record(data, offset=0):
+    '''
+    Returns the op and the lease of a record, or None if the record is
+    truncated or corrupted.
+    '''
+    size = lease_record_size(data, offset)
+    if size is None:
+        return None
+
+    op, family, crc, expiry_time, packed_ip_addr, mac_addr_len, \
+        hostname_len, client_id_len = LEASE_RECORD.unpack_from(data, offset)
+
+    start = offset + LEASE_RECORD_DATA_OFFSET
+    end = offset + size
+    if zlib.crc32(data[start:end]) & 0xffffffff != crc or \
+       op not in (RECORD_LEASE, RECORD_DELETE):
+        return None
+
+    start = offset + LEASE_RECORD.size
+    mac_addr = data[start:start + mac_addr_len]
+    start += mac_addr_len
+    hostname = data[start:start + hostname_len]
+    start += hostname_len
+    client_id = data[start:start + client_id_len]
+
+    if family == FAMILY_NONE:
+        ip = None
+    elif family == socket.AF_INET:
+        ip = packed_ip_addr[:4]
+    else:
+        ip = packed_ip_addr
+
+    if expiry_time == EXPIRY_TIME_UNKNOWN:
+        expiry_time = None
+
+    return op, DHCPLease(expiry_time,
+                         parse_mac_addr(mac_addr),
+                         ip,
+                         parse_lease_value(hostname),
+                         parse_lease_value(client_id))
+
+
+class DHCPLeaseSnapshot(object):
+    def __init__(self, path=DHCP_LEASE_SNAPSHOT_FILE):
+        '''
+        The live records are kept in memory by MAC address, so that
+        unchanged leases are not appended again and the snapshot can
+        be compacted without reading the file.
+        '''
+        self.path = path
+        self.fd = None
+        self.records = {}
+        self.loaded = False
+        self.stats = {'lease_snapshot_records': 0,
+                      'lease_snapshot_compactions': 0,
+                      'lease_snapshot_reconciles': 0}
+
+    def load(self):
+        '''
+        Loads the snapshot file through mmap and opens it for appending.
+        Returns False if there is no valid snapshot file.
+        '''
+        self.records = {}
+        self.loaded = False
+        self.stats['lease_snapshot_records'] = 0
+
+        try:
+            fd = os.open(self.path, os.O_RDWR)
+        except OSError:
+            return False
+
+        size = os.fstat(fd).st_size
+        if size < SNAPSHOT_HEADER.size:
+            os.close(fd)
+            return False
+
+        data = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        try:
+            magic, record_size = SNAPSHOT_HEADER.unpack_from(data, 0)
+            if magic != SNAPSHOT_MAGIC or record_size != LEASE_RECORD.size:
+                vlog.err("dhcp_lease_snapshot - invalid snapshot file %s"
+                         % (self.path))
+                os.close(fd)
+                return False
+
+            offset = SNAPSHOT_HEADER.size
+            while offset < size:
+                record = unpack_lease_record(data, offset)
+                if record is None:
+                    break
+
+                record_size = lease_record_size(data, offset)
+                self.__apply_record(record[0], record[1].mac_address,
+                                    data[offset:offset + record_size])
+                offset += record_size
+        finally:
+            data.close()
+
+        if offset < size:
+            vlog.info("dhcp_lease_snapshot - dropping %d bytes of torn "
+                      "records from %s" % (size - offset, self.path))
+            os.ftruncate(fd, offset)
+
+        os.lseek(fd, 0, os.SEEK_END)
+        self.fd = fd
+        self.loaded = True
+        return True
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def __apply_record(self, op, mac_addr, record):
+        self.stats['lease_snapshot_records'] += 1
+        if op == RECORD_DELETE:
+            self.records.pop(mac_addr, None)
+        else:
+            self.records[mac_addr] = record
+
+    def leases(self):
+        '''
+        Yields the leases of the snapshot.
+        '''
+        for record in self.records.itervalues():
+            yield unpack_lease_record(record)[1]
+
+    def __disable(self, e):
+        '''
+        Stops using the snapshot after a write error or a lease which
+        cannot be recorded, the leases are then read from the DHCP
+        leases DB.
+        '''
+        vlog.err("dhcp_lease_snapshot - write to %s failed: %s"
+                 % (self.path, e))
+        self.close()
+        self.records = {}
+        self.loaded = False
+
+    def __append(self, op, mac_addr, record):
+        if self.fd is None:
+            return
+
+        try:
+            os.write(self.fd, record)
+        except OSError as e:
+            self.__disable(e)
+            return
+
+        self.__apply_record(op, mac_addr, record)
+
+        if self.stats['lease_snapshot_records'] > \
+           2 * len(self.records) + COMPACT_MIN_RECORDS:
+            self.compact()
+
+    def set_lease(self, dhcp_lease):
+        if self.fd is None:
+            return
+
+        mac_addr = dhcp_lease.mac_address
+        try:
+            record = pack_lease_record(RECORD_LEASE, dhcp_lease)
+        except ValueError as e:
+            self.__disable(e)
+            return
+
+        if self.records.get(mac_addr) != record:
+            self.__append(RECORD_LEASE, mac_addr, record)
+
+    def delete_lease(self, mac_addr):
+        if mac_addr in self.records:
+            dhcp_lease = DHCPLease(mac=parse_mac_addr(mac_addr))
+            self.__append(RECORD_DELETE, mac_addr,
+                          pack_lease_record(RECORD_DELETE, dhcp_lease))
+
+    def __write(self, records):
+        '''
+        Replaces the snapshot file by a file with the given records.
+        '''
+        self.close()
+
+        tmp_path = self.path + '.tmp'
+        try:
+            snapshot_dir = os.path.dirname(self.path)
+            if not os.path.isdir(snapshot_dir):
+                os.makedirs(snapshot_dir)
+
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                         0o644)
+            try:
+                os.write(fd, SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC,
+                                                  LEASE_RECORD.size))
+                os.write(fd, "".join(records.itervalues()))
+                os.fsync(fd)
+                os.rename(tmp_path, self.path)
+
+                dir_fd = os.open(snapshot_dir, os.O_RDONLY)
+                try:
+                    os.fsync(dir_fd)
+                finally:
+                    os.close(dir_fd)
+            except OSError:
+                os.close(fd)
+                raise
+        except OSError as e:
+            self.__disable(e)
+            return
+
+        self.fd = fd
+        self.records = records
+        self.loaded = True
+        self.stats['lease_snapshot_records'] = len(records)
+
+    def compact(self):
+        self.stats['lease_snapshot_compactions'] += 1
+        self.__write(self.records)
+
+    def reconcile(self, dhcp_leases):
+        '''
+        Makes the snapshot match the leases of the DHCP leases DB.
+        The file is rewritten only if they differ.
+        '''
+        records = {}
+        try:
+            for dhcp_lease in dhcp_leases:
+                records[dhcp_lease.mac_address] = \
+                    pack_lease_record(RECORD_LEASE, dhcp_lease)
+        except ValueError as e:
+            self.__disable(e)
+            return
+
+        if self.loaded and records == self.records:
+            return
+
+        vlog.info("dhcp_lease_snapshot - reconciled %d leases with the "
+                  "DHCP leases DB" % (len(records)))
+        self.stats['lease_snapshot_reconciles'] += 1
+        self.__write(records)
@@ -15,102 +15,385 @@
 #    under the License..
 
 import argparse
+import binascii
+import fnmatch
+import heapq
 import os
 import json
+import socket
 import sys
-import subprocess
+import time
 
-import ovs.dirs
 from ovs.db import error
-from ovs.db import types
 import ovs.db.idl
 from dhcp_lease_db import DHCPLeaseDB
+from dhcp_lease_db import DHCP_LEASES_DB
+from dhcp_lease_db import DHCP_LEASE_NO_VALUE
+from dhcp_lease_db import MAC_ADDR
+from dhcp_lease_db import MAC_ADDR_RE
+from dhcp_lease_db import IP_ADDR
+from dhcp_lease_db import CLIENT_HOSTNAME
+from dhcp_lease_db import dhcp_lease_from_json
+from dhcp_lease_db import dhcp_lease_from_values
+from dhcp_lease_db import dhcp_lease_insert_op
+from dhcp_lease_db import lease_expiry_time
+from dhcp_lease_db import def_db
+from ovsdb_client import OVSDBClient
+from ovsdb_client import OVSDBClientError
 
 vlog = ovs.vlog.Vlog("dhcp_leases")
 
+# Size of the stdout buffer of the leases replayed on init
+INIT_BUFFER_SIZE = 65536
 
-def print_to_stdout(dhcp_lease_entry):
-    print "%s %s %s %s %s" % \
-          (dhcp_lease_entry["expiry_time"],
-           dhcp_lease_entry["mac_address"],
-           dhcp_lease_entry["ip_address"],
-           dhcp_lease_entry["client_hostname"],
-           dhcp_lease_entry["client_id"])
+# Output formats of the show command
+SHOW_FORMAT_TEXT = "text"
+SHOW_FORMAT_JSON = "json"
+SHOW_FORMAT_NDJSON = "ndjson"
+SHOW_FORMATS = [SHOW_FORMAT_TEXT, SHOW_FORMAT_JSON, SHOW_FORMAT_NDJSON]
 
+GLOB_CHARS = '*?['
 
-def dhcp_leases_show():
 
-    dhcp_leases = DHCPLeaseDB()
+def _output_value(value):
+    if value is None:
+        return DHCP_LEASE_NO_VALUE
+
+    return value
+
+
+def format_dhcp_lease(dhcp_lease):
+    return "%s %s %s %s %s" % \
+           (_output_value(dhcp_lease.expiry_time),
+            _output_value(dhcp_lease.mac_address),
+            _output_value(dhcp_lease.ip_address),
+            _output_value(dhcp_lease.client_hostname),
+            _output_value(dhcp_lease.client_id))
+
+
+def dhcp_lease_to_json(dhcp_lease):
+    '''
+    Returns the JSON object of a lease, with null for the missing
+    values and the expiry time as a number.
+    '''
+    return json.dumps({"expiry_time": dhcp_lease.expiry_time,
+                       "mac_address": dhcp_lease.mac_address,
+                       "ip_address": dhcp_lease.ip_address,
+                       "client_hostname": dhcp_lease.client_hostname,
+                       "client_id": dhcp_lease.client_id},
+                      sort_keys=True)
 
-    dhcp_lease_entry = {}
 
-    # OPS_TODO:
-    # Print dhcp_leases.idl.change_seqno
-    for ovs_rec in dhcp_leases.idl.tables["DHCP_Lease"].rows.itervalues():
-        dhcp_lease_entry = {"expiry_time": "*", "mac_address": "*",
-                            "ip_address": "*", "client_hostname": "*",
-                            "client_id": "*"}
+def write_dhcp_leases(dhcp_leases, output_format, out=sys.stdout):
+    '''
+    Writes the leases one by one as they are generated, without
+    building the whole output in memory. Returns the number of leases
+    written.
+    '''
+    count = 0
+    if output_format == SHOW_FORMAT_JSON:
+        separator = "["
+        for dhcp_lease in dhcp_leases:
+            out.write(separator + dhcp_lease_to_json(dhcp_lease))
+            separator = ",\n"
+            count += 1
+        out.write("]\n" if separator != "[" else "[]\n")
+    elif output_format == SHOW_FORMAT_NDJSON:
+        for dhcp_lease in dhcp_leases:
+            out.write(dhcp_lease_to_json(dhcp_lease) + "\n")
+            count += 1
+    else:
+        for dhcp_lease in dhcp_leases:
+            out.write(format_dhcp_lease(dhcp_lease) + "\n")
+            count += 1
+
+    return count
+
+
+def ip_addr_to_int(ip_addr):
+    '''
+    Returns the address family and the integer value of an IPv4 or IPv6
+    address. Raises ValueError for an invalid address.
+    '''
+    family = socket.AF_INET6 if ":" in ip_addr else socket.AF_INET
+    try:
+        packed = socket.inet_pton(family, ip_addr)
+    except socket.error:
+        raise ValueError("invalid IP address %s" % (ip_addr))
+
+    return family, int(binascii.hexlify(packed), 16)
+
+
+def parse_ip_filter(ip_filter):
+    '''
+    Parses an ADDR, FIRST-LAST or ADDR/PREFIXLEN show filter and returns
+    the address family and the first and last address as integers.
+    '''
+    try:
+        if "/" in ip_filter:
+            ip_addr, prefix_len = ip_filter.split("/", 1)
+            family, addr = ip_addr_to_int(ip_addr)
+            bits = 32 if family == socket.AF_INET else 128
+            prefix_len = int(prefix_len)
+            if prefix_len < 0 or prefix_len > bits:
+                raise ValueError("invalid prefix length %d" % (prefix_len))
+            host_mask = (1 << (bits - prefix_len)) - 1
+            return family, addr & ~host_mask, addr | host_mask
+
+        if "-" in ip_filter:
+            first_addr, last_addr = ip_filter.split("-", 1)
+            family, first = ip_addr_to_int(first_addr)
+            last_family, last = ip_addr_to_int(last_addr)
+            if last_family != family or last < first:
+                raise ValueError("invalid IP address range %s" % (ip_filter))
+            return family, first, last
+
+        family, addr = ip_addr_to_int(ip_filter)
+        return family, addr, addr
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def packed_ip_addr_to_int(ip):
+    '''
+    Returns the address family and the integer value of a packed IPv4
+    or IPv6 address.
+    '''
+    family = socket.AF_INET if len(ip) == 4 else socket.AF_INET6
+    return family, int(binascii.hexlify(ip), 16)
+
+
+def int_to_ip_addr(family, addr):
+    bits = 32 if family == socket.AF_INET else 128
+    return socket.inet_ntop(family,
+                            binascii.unhexlify("%0*x" % (bits / 4, addr)))
+
+
+def dhcp_leases_show_filter(args):
+    '''
+    Returns the OVSDB where clauses of the show filters that
+    ovsdb-server can evaluate, and a function checking a lease against
+    all the filters.
+    '''
+    where = []
 
-        if ovs_rec.expiry_time and ovs_rec.expiry_time is not None:
-            dhcp_lease_entry["expiry_time"] = ovs_rec.expiry_time
-        if ovs_rec.mac_address and ovs_rec.mac_address is not None:
-            dhcp_lease_entry["mac_address"] = ovs_rec.mac_address
-        if ovs_rec.ip_address and ovs_rec.ip_address is not None:
-            dhcp_lease_entry["ip_address"] = ovs_rec.ip_address
-        if ovs_rec.client_hostname and ovs_rec.client_hostname is not None:
-            dhcp_lease_entry["client_hostname"] = ovs_rec.client_hostname[0]
-        if ovs_rec.client_id and ovs_rec.client_id is not None:
-            dhcp_lease_entry["client_id"] = ovs_rec.client_id[0]
+    mac_prefix = None
+    if args.mac is not None:
+        mac_prefix = args.mac.lower()
+        if MAC_ADDR_RE.match(mac_prefix):
+            where.append([MAC_ADDR, "==", mac_prefix])
 
-        print_to_stdout(dhcp_lease_entry)
+    if args.ip is not None:
+        family, first, last = args.ip
+        if first == last:
+            where.append([IP_ADDR, "==", int_to_ip_addr(family, first)])
 
+    if args.hostname is not None:
+        if not any(c in args.hostname for c in GLOB_CHARS):
+            where.append([CLIENT_HOSTNAME, "==", args.hostname])
+
+    def match(dhcp_lease):
+        if mac_prefix is not None and \
+           (dhcp_lease.mac is None or
+                not dhcp_lease.mac_address.lower().startswith(mac_prefix)):
+            return False
+
+        if args.ip is not None:
+            if dhcp_lease.ip is None:
+                return False
+            family, addr = packed_ip_addr_to_int(dhcp_lease.ip)
+            if family != args.ip[0] or \
+               addr < args.ip[1] or addr > args.ip[2]:
+                return False
+
+        if args.hostname is not None and \
+           not fnmatch.fnmatchcase(_output_value(dhcp_lease.client_hostname),
+                                   args.hostname):
+            return False
+
+        # Infinite leases never expire
+        if args.expiring_before is not None:
+            expiry_time = lease_expiry_time(dhcp_lease.expiry_time)
+            if expiry_time is None or expiry_time >= args.expiring_before:
+                return False
+
+        return True
+
+    return where, match
+
+
+def _mac_address_key(dhcp_lease):
+    return dhcp_lease.mac_address
+
+
+def dhcp_leases_show_entries(dhcp_leases, match, args):
+    '''
+    Returns the leases matching the show filters, from offset and up to
+    limit leases. The leases have no order in OVSDB, so they are paged
+    by MAC. With a limit, only the first offset + limit leases are kept
+    in memory.
+    '''
+    dhcp_leases = (dhcp_lease for dhcp_lease in dhcp_leases
+                   if match(dhcp_lease))
+
+    if args.limit is not None:
+        return heapq.nsmallest(args.offset + args.limit, dhcp_leases,
+                               key=_mac_address_key)[args.offset:]
+
+    if args.offset:
+        return sorted(dhcp_leases, key=_mac_address_key)[args.offset:]
+
+    return dhcp_leases
+
+
+def dhcp_leases_select(args):
+    '''
+    Yields the leases matching the show filters, from offset and up to
+    limit leases.
+    '''
+    where, match = dhcp_leases_show_filter(args)
+
+    dhcp_leases = DHCPLeaseDB()
+    rows = dhcp_leases.select_leases(where)
     dhcp_leases.close()
 
-'''
-Using ovsdb-client as python IDL doesn't scale well for large
-number of leases. But an alternate (better) option is listed in OPS_TODO
-below as this requires more investigation and time. Also, in any case,
-python IDL usage in "update" & "delete" operations have to be replaced
-with one of these options.
-OPS-TODO
-   a) Open a socket
-   b) connect synchronously - bail out if it fails
-   c) send a string which has the formatted transaction
-   d) close the sending side of the socket
-   e) keep receiving synchronously from the socket into a buffer
-      until socket closes from the other side
-   f) parse the buffer using standard Python JSON parser call
-   g) Look at the response and report errors/success/show results
-'''
-
-
-def dhcp_leases_add(dhcp_lease_entry):
-
-    add_row_cmd = 'ovsdb-client transact \'["dhcp_leases",{"op":"insert", \
-                  "table":"DHCP_Lease", "row":{ "expiry_time":"%s", \
-                  "mac_address":"%s", "ip_address":"%s", \
-                  "client_hostname":"%s", "client_id": "%s" } }]\'' % (
-                  dhcp_lease_entry["expiry_time"],
-                  dhcp_lease_entry["mac_address"],
-                  dhcp_lease_entry["ip_address"],
-                  dhcp_lease_entry["client_hostname"],
-                  dhcp_lease_entry["client_id"])
-
-    dhcp_leases_insert_process = subprocess.Popen(add_row_cmd,
-                                                  stdout=subprocess.PIPE,
-                                                  stderr=subprocess.PIPE,
-                                                  shell=True)
-
-    if "error" in dhcp_leases_insert_process.stdout.read():
-        vlog.err("dhcp_leases add_row_cmd failed")
-
-
-def dhcp_leases_update(dhcp_lease_entry):
+    for dhcp_lease in dhcp_leases_show_entries(
+            (dhcp_lease_from_json(row) for row in rows), match, args):
+        yield dhcp_lease
+
+
+def dhcp_leases_show_filtered(args):
+    '''
+    Prints the leases matching the show filters. Only the matching rows
+    are selected from ovsdb-server if the filters are exact (full MAC,
+    single IP, hostname without wildcards), the other filters are
+    applied on the selected rows as they are printed.
+    '''
+    write_dhcp_leases(dhcp_leases_select(args), args.format)
+
+
+def _non_negative_int(value):
+    try:
+        number = int(value)
+    except ValueError:
+        number = -1
+
+    if number < 0:
+        raise argparse.ArgumentTypeError("invalid count %s" % (value))
+
+    return number
 
+
+def parse_dhcp_leases_show_args(argv):
+    '''
+    Parses the filters of the show command:
+      - dhcp_leases show [--mac PREFIX] [--ip ADDR|FIRST-LAST|ADDR/LEN]
+                         [--hostname GLOB] [--expiring-before TIME]
+                         [--limit N] [--offset N]
+                         [--format ndjson|json|text]
+    '''
+    parser = argparse.ArgumentParser(prog="dhcp_leases show")
+    parser.add_argument('--format', choices=SHOW_FORMATS,
+                        default=SHOW_FORMAT_TEXT,
+                        help="Output the leases as space separated text, "
+                             "a JSON array or one JSON object per line.",
+                        dest='format')
+    parser.add_argument('--mac', metavar="PREFIX",
+                        help="Show the leases of the MAC addresses or "
+                             "DUIDs starting with PREFIX.",
+                        dest='mac')
+    parser.add_argument('--ip', metavar="ADDR", type=parse_ip_filter,
+                        help="Show the leases of an IP address, an IP "
+                             "address range FIRST-LAST or a subnet "
+                             "ADDR/PREFIXLEN.",
+                        dest='ip')
+    parser.add_argument('--hostname', metavar="GLOB",
+                        help="Show the leases of the hostnames matching "
+                             "the shell-style pattern GLOB.",
+                        dest='hostname')
+    parser.add_argument('--expiring-before', metavar="TIME", type=int,
+                        help="Show the leases expiring before TIME "
+                             "(seconds since the epoch), infinite leases "
+                             "excluded.",
+                        dest='expiring_before')
+    parser.add_argument('--limit', metavar="N", type=_non_negative_int,
+                        help="Show at most N leases, ordered by MAC.",
+                        dest='limit')
+    parser.add_argument('--offset', metavar="N", type=_non_negative_int,
+                        default=0,
+                        help="Skip the first N leases, ordered by MAC.",
+                        dest='offset')
+
+    return parser.parse_args(argv)
+
+
+def dhcp_leases_unexpired(dhcp_leases):
+    '''
+    Yields the leases which haven't expired yet.
+    '''
+    now = time.time()
+
+    for dhcp_lease in dhcp_leases:
+        expiry_time = lease_expiry_time(dhcp_lease.expiry_time)
+        if expiry_time is None or expiry_time > now:
+            yield dhcp_lease
+
+
+def dhcp_leases_init_entries(dhcp_leases):
+    '''
+    Yields the leases dnsmasq loads on init. The leases are read
+    with a single select of the lease columns and the expired leases
+    are skipped, dnsmasq would drop them anyway.
+    '''
+    return dhcp_leases_unexpired(dhcp_lease_from_json(row)
+                                 for row in dhcp_leases.select_leases([]))
+
+
+def dhcp_leases_init():
+    '''
+    Replays the leases to dnsmasq on stdout through a single buffered
+    writer. The script only handles init when the lease service is not
+    reachable, and the lease events it handles then bypass the lease
+    snapshot of the service. The leases are therefore selected from
+    ovsdb-server, the snapshot may be stale.
+    '''
+    start = time.time()
     dhcp_leases = DHCPLeaseDB()
 
-    row, status = dhcp_leases.update_row(dhcp_lease_entry["mac_address"],
-                                         dhcp_lease_entry)
+    out = os.fdopen(os.dup(sys.stdout.fileno()), 'w', INIT_BUFFER_SIZE)
+    try:
+        count = write_dhcp_leases(dhcp_leases_init_entries(dhcp_leases),
+                                  SHOW_FORMAT_TEXT, out)
+    finally:
+        out.close()
+        dhcp_leases.close()
+
+    vlog.info("dhcp_leases init replayed %d leases in %d msecs"
+              % (count, (time.time() - start) * 1000))
+
+
+def dhcp_leases_add(dhcp_lease):
+    '''
+    Inserts the lease with a JSON-RPC transaction sent straight to
+    ovsdb-server, as a python IDL doesn't scale well for a large
+    number of leases.
+    '''
+    client = OVSDBClient(def_db)
+
+    try:
+        client.transact(DHCP_LEASES_DB,
+                        [dhcp_lease_insert_op(dhcp_lease)])
+    except OVSDBClientError as e:
+        vlog.err("dhcp_leases add failed: %s" % (e))
+    finally:
+        client.close()
+
+
+def dhcp_leases_update(dhcp_lease):
+
+    dhcp_leases = DHCPLeaseDB()
+
+    row, status = dhcp_leases.update_row(dhcp_lease.mac_address, dhcp_lease)
 
     if status != ovs.db.idl.Transaction.SUCCESS:
         vlog.err("dhcp_leases update_row failed")
@@ -118,11 +401,11 @@ def dhcp_leases_update(dhcp_lease_entry):
     dhcp_leases.close()
 
 
-def dhcp_leases_delete(dhcp_lease_entry):
+def dhcp_leases_delete(dhcp_lease):
 
     dhcp_leases = DHCPLeaseDB()
 
-    row, status = dhcp_leases.delete_row(dhcp_lease_entry["mac_address"])
+    row, status = dhcp_leases.delete_row(dhcp_lease.mac_address)
 
     if status != ovs.db.idl.Transaction.SUCCESS:
         vlog.err("dhcp_leases delete_row failed")
@@ -137,30 +420,21 @@ def dhcp_leases_clear_db():
     '''
     dhcp_leases = DHCPLeaseDB()
 
-    status = dhcp_leases.clear_db()
+    rows_removed, status = dhcp_leases.clear_db()
 
-    if status != ovs.db.idl.Transaction.SUCCESS:
+    if status == ovs.db.idl.Transaction.SUCCESS:
+        vlog.info("dhcp_leases clear_db removed %d leases" % (rows_removed))
+    elif status != ovs.db.idl.Transaction.UNCHANGED:
         vlog.err("dhcp_leases clear_db failed")
 
     dhcp_leases.close()
 
 
-def main():
-
-    dhcp_lease_entry = {"expiry_time": "*", "mac_address": "*",
-                        "ip_address": "*",
-                        "client_hostname": "*", "client_id": "*"}
-
-    argv = sys.argv
-    num_args = len(argv)
-
-    if num_args < 2:
-        vlog.err("Error in arguments passed to dhcp_leases script, Exiting")
-        sys.exit()
-
-    parser = argparse.ArgumentParser()
-
+def parse_dhcp_lease_args(argv, environ):
     '''
+    Parses the arguments dnsmasq passes to the leases script and returns
+    the command and the lease.
+
     Dnsmasq invokes this script as:
       - dhcp_leases init
       - dhcp_leases add <mac_addr> <ip_addr> <hostname> <client-id>
@@ -175,6 +449,10 @@ def main():
       the number of arguments, do it in a generic way that handles all the
       cases.
     '''
+    num_args = len(argv)
+
+    parser = argparse.ArgumentParser()
+
     parser.add_argument(action="store", dest='command')
     if num_args > 2:
         parser.add_argument(action="store", dest='mac_address')
@@ -185,28 +463,45 @@ def main():
     if num_args > 5:
         parser.add_argument(action="store", dest='client_id')
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv[1:])
 
+    expiry_time = None
     if num_args > 2:
-        dhcp_lease_entry["mac_address"] = args.mac_address
-        dhcp_lease_entry["expiry_time"] = os.environ["DNSMASQ_LEASE_EXPIRES"]
-    if num_args > 3:
-        dhcp_lease_entry["ip_address"] = args.ip_address
-    if num_args > 4:
-        dhcp_lease_entry["client_hostname"] = args.client_hostname
-    if num_args > 5:
-        dhcp_lease_entry["client_id"] = args.client_id
+        expiry_time = environ["DNSMASQ_LEASE_EXPIRES"]
+
+    dhcp_lease = dhcp_lease_from_values(
+        expiry_time,
+        getattr(args, 'mac_address', None),
+        getattr(args, 'ip_address', None),
+        getattr(args, 'client_hostname', None),
+        getattr(args, 'client_id', None))
+
+    return args.command, dhcp_lease
+
+
+def main():
+
+    argv = sys.argv
+    num_args = len(argv)
+
+    if num_args < 2:
+        vlog.err("Error in arguments passed to dhcp_leases script, Exiting")
+        sys.exit()
+
+    if argv[1] == "show":
+        dhcp_leases_show_filtered(parse_dhcp_leases_show_args(argv[2:]))
+        return
 
-    command = args.command
+    command, dhcp_lease = parse_dhcp_lease_args(argv, os.environ)
 
-    if command == "init" or command == "show":
-        dhcp_leases_show()
+    if command == "init":
+        dhcp_leases_init()
     elif command == "add":
-        dhcp_leases_add(dhcp_lease_entry)
+        dhcp_leases_add(dhcp_lease)
     elif command == "del":
-        dhcp_leases_delete(dhcp_lease_entry)
+        dhcp_leases_delete(dhcp_lease)
     elif command == "old":
-        dhcp_leases_update(dhcp_lease_entry)
+        dhcp_leases_update(dhcp_lease)
     elif command == "tftp":
         sys.exit()
     elif command == "clear":
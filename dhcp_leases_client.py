@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - dhcp-script invoked by dnsmasq for every lease event. It forwards
+   the arguments and the DNSMASQ_* environment of the event to the
+   lease service of the DHCP-TFTP daemon over a unix socket and writes
+   the reply to stdout. Only standard library modules are imported
+   here, the OVSDB work is done by the long-lived lease service.
+ - If the lease service is not reachable, the event is handled by the
+   dhcp_leases script instead.
+'''
+
+import json
+import os
+import socket
+import sys
+
+DHCP_LEASE_SERVICE_SOCKET = '/var/run/dhcp_tftp/dhcp_leases.sock'
+DHCP_LEASES_SCRIPT = '/usr/bin/dhcp_leases'
+
+
+def main():
+
+    request = {"argv": sys.argv,
+               "env": dict((key, value)
+                           for key, value in os.environ.iteritems()
+                           if key.startswith("DNSMASQ_"))}
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(DHCP_LEASE_SERVICE_SOCKET)
+    except socket.error:
+        sock.close()
+        os.execv(DHCP_LEASES_SCRIPT, [DHCP_LEASES_SCRIPT] + sys.argv[1:])
+
+    sock.sendall(json.dumps(request) + "\n")
+    sock.shutdown(socket.SHUT_WR)
+
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        sys.stdout.write(data)
+
+    sock.close()
+
+
+if __name__ == '__main__':
+    main()
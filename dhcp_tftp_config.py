@@ -0,0 +1,512 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - Canonical model of the DHCP-TFTP server configuration. Every
+   OVSDB row relevant to dnsmasq is converted to a tuple of
+   (dnsmasq option, value) entries and the entries of each table
+   are kept sorted, so that two models built from the same
+   configuration always compare equal irrespective of row UUIDs
+   or IDL iteration order. The daemon compares the model before
+   and after each IDL run and restarts dnsmasq only if it differs.
+ - The model is rendered to a dnsmasq conf file, one entry per line,
+   which is passed to dnsmasq with --conf-file. Static hosts and
+   options can instead be rendered to a dhcp-hostsfile and
+   dhcp-optsfile, which dnsmasq re-reads on SIGHUP without a restart.
+ - DHCPTFTPConfigCache keeps the dnsmasq entries of every row and only
+   re-renders the rows reported as inserted, modified or deleted by the
+   IDL, so the work done per config change is proportional to the
+   number of changed rows. A table whose rows dict was replaced by the
+   IDL, as done when it reconnects to OVSDB, is rebuilt from scratch.
+ - The entries of every table are kept in a sorted list, the entries of
+   a changed row are removed from it and inserted back with a binary
+   search, so a config change does not sort the entries of the table
+   again. Only the final copy of the list to the config tuple is linear.
+ - The cache also indexes the static hosts by IP address, MAC address,
+   client-id and hostname, so that the static hosts sharing one of them
+   are found without comparing every pair of hosts.
+'''
+
+import os
+from bisect import bisect_left
+from bisect import insort
+from collections import namedtuple
+
+# Tables definitions
+SYSTEM_TABLE = 'System'
+DHCP_SERVER_TABLE = 'DHCP_Server'
+DHCP_SERVER_RANGE_TABLE = 'DHCPSrv_Range'
+DHCP_SERVER_STATIC_HOST_TABLE = 'DHCPSrv_Static_Host'
+DHCP_SERVER_OPTION_TABLE = 'DHCPSrv_Option'
+DHCP_SERVER_MATCH_TABLE = 'DHCPSrv_Match'
+
+# dnsmasq option names
+DNSMASQ_DHCP_RANGE = 'dhcp-range'
+DNSMASQ_DHCP_HOST = 'dhcp-host'
+DNSMASQ_DHCP_OPTION = 'dhcp-option'
+DNSMASQ_DHCP_MATCH = 'dhcp-match'
+DNSMASQ_DHCP_BOOT = 'dhcp-boot'
+DNSMASQ_ENABLE_TFTP = 'enable-tftp'
+DNSMASQ_TFTP_SECURE = 'tftp-secure'
+DNSMASQ_TFTP_ROOT = 'tftp-root'
+DNSMASQ_DHCP_HOSTSFILE = 'dhcp-hostsfile'
+DNSMASQ_DHCP_OPTSFILE = 'dhcp-optsfile'
+
+# System:other_config keys for the TFTP server
+TFTP_SERVER_ENABLE = 'tftp_server_enable'
+TFTP_SERVER_SECURE = 'tftp_server_secure'
+TFTP_SERVER_PATH = 'tftp_server_path'
+
+DHCPTFTPConfig = namedtuple('DHCPTFTPConfig',
+                            ['ranges', 'static_hosts', 'options',
+                             'matches', 'bootp', 'tftp'])
+
+# Config fields dnsmasq can re-read on SIGHUP from its dhcp-hostsfile and
+# dhcp-optsfile. A change in any other field needs a dnsmasq restart.
+DNSMASQ_RELOAD_FIELDS = ('static_hosts', 'options')
+DNSMASQ_RESTART_FIELDS = ('ranges', 'matches', 'bootp', 'tftp')
+
+
+def _lease_duration(lease_duration):
+    if lease_duration == 0:
+        return 'infinite'
+    return str(lease_duration) + 'm'
+
+
+def dhcp_range_entries(ovs_rec):
+    '''
+    Returns the dnsmasq entries for a DHCPSrv_Range row.
+    '''
+    range_options = ""
+    if ovs_rec.match_tags:
+        for each_tag in ovs_rec.match_tags:
+            range_options = range_options + 'tag:' + each_tag + ','
+
+    if ovs_rec.set_tag:
+        for each_tag in ovs_rec.set_tag:
+            range_options = range_options + 'set:' + each_tag + ','
+
+    if ovs_rec.start_ip_address:
+        range_options = range_options + ovs_rec.start_ip_address
+
+    if ovs_rec.end_ip_address:
+        range_options = range_options + ',' + ovs_rec.end_ip_address[0]
+
+    if ovs_rec.is_static and ovs_rec.is_static[0] is True:
+        range_options = range_options + ',' + 'static'
+
+    if ovs_rec.netmask:
+        range_options = range_options + ',' + ovs_rec.netmask[0]
+
+    if ovs_rec.broadcast:
+        range_options = range_options + ',' + ovs_rec.broadcast[0]
+
+    if ovs_rec.prefix_len and ovs_rec.prefix_len[0] != 64:
+        range_options = range_options + ',' + str(ovs_rec.prefix_len[0])
+
+    if ovs_rec.lease_duration:
+        range_options = range_options + ',' + \
+            _lease_duration(ovs_rec.lease_duration[0])
+
+    return ((DNSMASQ_DHCP_RANGE, range_options),)
+
+
+def dhcp_host_entries(ovs_rec):
+    '''
+    Returns the dnsmasq entries for a DHCPSrv_Static_Host row.
+    '''
+    static_host_options = ""
+    if ovs_rec.mac_addresses:
+        for each_mac in ovs_rec.mac_addresses:
+            static_host_options = static_host_options + each_mac + ','
+
+    if ovs_rec.client_id:
+        static_host_options = static_host_options + 'id:' + \
+            ovs_rec.client_id[0] + ','
+
+    if ovs_rec.set_tags:
+        for each_tag in ovs_rec.set_tags:
+            static_host_options = static_host_options + 'set:' + \
+                each_tag + ','
+
+    if ovs_rec.ip_address:
+        static_host_options = static_host_options + ovs_rec.ip_address
+
+    if ovs_rec.client_hostname:
+        static_host_options = static_host_options + ',' + \
+            ovs_rec.client_hostname[0]
+
+    if ovs_rec.lease_duration:
+        static_host_options = static_host_options + ',' + \
+            _lease_duration(ovs_rec.lease_duration[0])
+
+    return ((DNSMASQ_DHCP_HOST, static_host_options),)
+
+
+def dhcp_option_entries(ovs_rec):
+    '''
+    Returns the dnsmasq entries for a DHCPSrv_Option row.
+    '''
+    dhcp_options = ""
+    if ovs_rec.match_tags:
+        for each_tag in ovs_rec.match_tags:
+            dhcp_options = dhcp_options + 'set:' + each_tag + ','
+
+    if ovs_rec.option_name:
+        if ovs_rec.ipv6 and ovs_rec.ipv6[0] is True:
+            dhcp_options = dhcp_options + 'option6:'
+        else:
+            dhcp_options = dhcp_options + 'option:'
+
+        dhcp_options = dhcp_options + ovs_rec.option_name[0]
+    else:
+        dhcp_options = dhcp_options + str(ovs_rec.option_number[0])
+
+    if ovs_rec.option_value:
+        dhcp_options = dhcp_options + ',' + ovs_rec.option_value[0]
+
+    return ((DNSMASQ_DHCP_OPTION, dhcp_options),)
+
+
+def dhcp_match_entries(ovs_rec):
+    '''
+    Returns the dnsmasq entries for a DHCPSrv_Match row.
+    '''
+    match_options = ""
+    if ovs_rec.set_tag:
+        match_options = match_options + 'set:' + ovs_rec.set_tag + ','
+
+    if ovs_rec.option_name:
+        match_options = match_options + 'option:' + ovs_rec.option_name[0]
+    else:
+        match_options = match_options + str(ovs_rec.option_number[0])
+
+    if ovs_rec.option_value:
+        match_options = match_options + ',' + ovs_rec.option_value[0]
+
+    return ((DNSMASQ_DHCP_MATCH, match_options),)
+
+
+def dhcp_boot_entries(ovs_rec):
+    '''
+    Returns the dnsmasq entries for the bootp column of a DHCP_Server row.
+    '''
+    entries = []
+    if ovs_rec.bootp:
+        for key, value in ovs_rec.bootp.iteritems():
+            if key == 'no_matching_tag':
+                entries.append((DNSMASQ_DHCP_BOOT, value))
+            else:
+                entries.append((DNSMASQ_DHCP_BOOT,
+                                'tag:' + key + ',' + value))
+
+    return tuple(sorted(entries))
+
+
+def tftp_entries(ovs_rec):
+    '''
+    Returns the dnsmasq entries for the TFTP server keys of
+    System:other_config.
+    '''
+    entries = []
+    if ovs_rec.other_config:
+        other_config = ovs_rec.other_config
+        if other_config.get(TFTP_SERVER_ENABLE) == 'true':
+            entries.append((DNSMASQ_ENABLE_TFTP, None))
+        if other_config.get(TFTP_SERVER_SECURE) == 'true':
+            entries.append((DNSMASQ_TFTP_SECURE, None))
+        if other_config.get(TFTP_SERVER_PATH):
+            entries.append((DNSMASQ_TFTP_ROOT,
+                            other_config[TFTP_SERVER_PATH]))
+
+    return tuple(entries)
+
+
+def static_host_keys(ovs_rec):
+    '''
+    Returns the (column, value) keys of a DHCPSrv_Static_Host row which
+    must not be shared with another static host. MAC addresses are
+    compared in lower case.
+    '''
+    keys = [('ip_address', ovs_rec.ip_address)]
+    keys.extend(('mac_addresses', mac.lower())
+                for mac in ovs_rec.mac_addresses)
+    keys.extend(('client_id', client_id) for client_id in ovs_rec.client_id)
+    keys.extend(('client_hostname', hostname)
+                for hostname in ovs_rec.client_hostname)
+    return tuple(keys)
+
+
+class StaticHostKeyIndex(object):
+    def __init__(self):
+        '''
+        Index of the static host row UUIDs by each of their unique keys.
+        Unlike DHCPSrvStaticHostIndex of the opsplugins, which needs
+        opsrest and checks a row against the IDL when it is validated,
+        it is updated from the row changes reported to the cache and
+        lists every conflict of the committed rows.
+        '''
+        self.row_keys = {}
+        self.index = {}
+
+    def delete_row(self, row_uuid):
+        for key in self.row_keys.pop(row_uuid, ()):
+            row_uuids = self.index[key]
+            row_uuids.discard(row_uuid)
+            if not row_uuids:
+                del self.index[key]
+
+    def update_row(self, row_uuid, keys):
+        self.delete_row(row_uuid)
+        self.row_keys[row_uuid] = keys
+        for key in keys:
+            self.index.setdefault(key, set()).add(row_uuid)
+
+    def clear(self):
+        self.row_keys.clear()
+        self.index.clear()
+
+    def find_rows(self, key):
+        '''
+        Returns the set of row UUIDs which have the (column, value) key.
+        '''
+        return self.index.get(key, set())
+
+    def find_conflicts(self, row_uuid):
+        '''
+        Returns the (key, row UUID) of the other rows sharing a key with
+        the row.
+        '''
+        conflicts = []
+        for key in self.row_keys.get(row_uuid, ()):
+            for other_uuid in self.index[key]:
+                if other_uuid != row_uuid:
+                    conflicts.append((key, other_uuid))
+        return conflicts
+
+
+# Config field and row renderer of each table in the config
+CONFIG_TABLES = {
+    DHCP_SERVER_RANGE_TABLE: ('ranges', dhcp_range_entries),
+    DHCP_SERVER_STATIC_HOST_TABLE: ('static_hosts', dhcp_host_entries),
+    DHCP_SERVER_OPTION_TABLE: ('options', dhcp_option_entries),
+    DHCP_SERVER_MATCH_TABLE: ('matches', dhcp_match_entries),
+    DHCP_SERVER_TABLE: ('bootp', dhcp_boot_entries),
+    SYSTEM_TABLE: ('tftp', tftp_entries),
+}
+
+
+class DHCPTFTPConfigCache(object):
+    def __init__(self):
+        '''
+        Create an empty cache. Rows are added to it as the IDL reports
+        them through row_changed().
+        '''
+        self.row_entries = {}
+        self.table_entries = {}
+        self.changed_rows = {}
+        for table_name in CONFIG_TABLES:
+            self.row_entries[table_name] = {}
+            self.table_entries[table_name] = []
+            self.changed_rows[table_name] = set()
+
+        self.table_rows = {}
+        self.config = DHCPTFTPConfig(*([()] * len(DHCPTFTPConfig._fields)))
+        self.static_hosts = StaticHostKeyIndex()
+        self.static_host_conflicts = []
+
+    def row_changed(self, table_name, row_uuid):
+        '''
+        Records that a row was inserted, modified or deleted in the IDL.
+        Changes of tables which are not part of the config are ignored.
+        '''
+        changed_rows = self.changed_rows.get(table_name)
+        if changed_rows is not None:
+            changed_rows.add(row_uuid)
+
+    def __resynced_tables(self, tables):
+        '''
+        Returns the names of the tables whose rows were replaced since
+        the last call. The IDL replaces the rows of every table without
+        reporting the dropped rows when it reconnects to OVSDB, so the
+        changed rows alone no longer describe those tables.
+        '''
+        resynced = set()
+        for table_name in CONFIG_TABLES:
+            rows = tables[table_name].rows
+            if rows is not self.table_rows.get(table_name):
+                self.table_rows[table_name] = rows
+                resynced.add(table_name)
+        return resynced
+
+    def __update_table(self, table_name, table, resynced):
+        '''
+        Re-renders the changed rows of a table, or all its rows if it was
+        resynced, and returns True if the entries of the table changed.
+        '''
+        entries_func = CONFIG_TABLES[table_name][1]
+        row_entries = self.row_entries[table_name]
+        table_entries = self.table_entries[table_name]
+        changed_rows = self.changed_rows[table_name]
+        table_changed = False
+
+        if resynced:
+            changed_rows.clear()
+            row_entries.clear()
+            del table_entries[:]
+            for row_uuid, ovs_rec in table.rows.iteritems():
+                entries = entries_func(ovs_rec)
+                row_entries[row_uuid] = entries
+                table_entries.extend(entries)
+            table_entries.sort()
+            return True
+
+        for row_uuid in changed_rows:
+            ovs_rec = table.rows.get(row_uuid)
+            old_entries = row_entries.get(row_uuid, ())
+            if ovs_rec is None:
+                entries = ()
+                row_entries.pop(row_uuid, None)
+            else:
+                entries = entries_func(ovs_rec)
+                row_entries[row_uuid] = entries
+
+            if old_entries == entries:
+                continue
+
+            for entry in old_entries:
+                del table_entries[bisect_left(table_entries, entry)]
+            for entry in entries:
+                insort(table_entries, entry)
+            table_changed = True
+
+        changed_rows.clear()
+        return table_changed
+
+    def __update_static_hosts(self, table, resynced):
+        '''
+        Applies the changed static host rows, or all of them if the table
+        was resynced, to the static host index and records the changed
+        rows sharing a key with another row in static_host_conflicts, as
+        (row, (column, value), other row).
+        '''
+        changed_rows = self.changed_rows[DHCP_SERVER_STATIC_HOST_TABLE]
+        if resynced:
+            self.static_hosts.clear()
+            changed_rows = set(table.rows)
+
+        for row_uuid in changed_rows:
+            ovs_rec = table.rows.get(row_uuid)
+            if ovs_rec is None:
+                self.static_hosts.delete_row(row_uuid)
+            else:
+                self.static_hosts.update_row(row_uuid,
+                                             static_host_keys(ovs_rec))
+
+        self.static_host_conflicts = []
+        for row_uuid in changed_rows:
+            for key, other_uuid in self.static_hosts.find_conflicts(row_uuid):
+                # A conflict between two changed rows is reported once
+                if other_uuid in changed_rows and other_uuid < row_uuid:
+                    continue
+                self.static_host_conflicts.append((table.rows[row_uuid], key,
+                                                   table.rows[other_uuid]))
+
+    def get_config(self, tables):
+        '''
+        Applies the changed rows to the cache and returns the canonical
+        config. Only the config fields of tables whose entries changed
+        are rebuilt, the others are shared with the previous config.
+        '''
+        resynced = self.__resynced_tables(tables)
+        self.__update_static_hosts(tables[DHCP_SERVER_STATIC_HOST_TABLE],
+                                   DHCP_SERVER_STATIC_HOST_TABLE in resynced)
+
+        changed_fields = {}
+        for table_name, (field, entries_func) in CONFIG_TABLES.iteritems():
+            if self.__update_table(table_name, tables[table_name],
+                                   table_name in resynced):
+                changed_fields[field] = tuple(self.table_entries[table_name])
+
+        if changed_fields:
+            self.config = self.config._replace(**changed_fields)
+
+        return self.config
+
+
+def dhcp_tftp_config_entries(config, fields=None):
+    '''
+    Iterates over the dnsmasq entries of a config in the order they are
+    passed to dnsmasq. If fields is given, only the entries of those
+    fields of the config are returned.
+    '''
+    if fields is None:
+        fields = config._fields
+
+    for field in fields:
+        for entry in getattr(config, field):
+            yield entry
+
+
+def dhcp_tftp_config_reloadable(old_config, new_config):
+    '''
+    Checks if new_config differs from old_config only in the fields
+    which dnsmasq re-reads from its hostsfile and optsfile on SIGHUP.
+    '''
+    if old_config is None:
+        return False
+
+    for field in DNSMASQ_RESTART_FIELDS:
+        if getattr(old_config, field) != getattr(new_config, field):
+            return False
+
+    return True
+
+
+def _write_dnsmasq_file(path, lines):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as dnsmasq_file:
+        for line in lines:
+            dnsmasq_file.write(line + '\n')
+
+        # The data must be on disk before the rename, otherwise a crash
+        # could leave an empty file in place of the old one
+        dnsmasq_file.flush()
+        os.fsync(dnsmasq_file.fileno())
+
+    os.rename(tmp_path, path)
+
+
+def write_dnsmasq_conf(path, entries):
+    '''
+    Streams the dnsmasq entries to a conf file. The entries are written
+    to a temporary file which then atomically replaces the conf file, so
+    dnsmasq never reads a partially written config.
+    '''
+    _write_dnsmasq_file(path, (option if value is None
+                               else option + '=' + value
+                               for option, value in entries))
+
+
+def write_dnsmasq_reload_file(path, entries):
+    '''
+    Streams the values of the dnsmasq entries to a dhcp-hostsfile or
+    dhcp-optsfile, which has the same format as the corresponding conf
+    file entries without the option name. The file is replaced atomically
+    like the conf file.
+    '''
+    _write_dnsmasq_file(path, (value for option, value in entries))
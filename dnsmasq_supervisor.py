@@ -0,0 +1,349 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - Supervises the dnsmasq process started by the DHCP-TFTP daemon.
+   dnsmasq is run with --keep-in-foreground, so the PID of the
+   spawned process is the PID of the dnsmasq daemon itself and it
+   can be reloaded and stopped without scanning the process table.
+ - dnsmasq startup is checked asynchronously from the daemon's poll
+   loop by watching dnsmasq stderr and the DHCP/TFTP sockets it opens,
+   so the daemon keeps serving unixctl and OVSDB updates meanwhile.
+ - dnsmasq is stopped asynchronously as well. stop() only sends
+   SIGTERM, run() reaps the stopping dnsmasq from the poll loop and
+   kills it if it did not exit in time. A dnsmasq started meanwhile is
+   spawned once the previous one is reaped, so that it can bind the
+   DHCP and TFTP ports.
+ - The error output of a running dnsmasq is logged, so that dnsmasq
+   never blocks on a full stderr pipe.
+'''
+
+import errno
+import fcntl
+import os
+import signal
+import subprocess
+
+import ovs.poller
+import ovs.timeval
+import ovs.vlog
+
+vlog = ovs.vlog.Vlog("dnsmasq_supervisor")
+
+DNSMASQ_FOREGROUND_OPTION = '--keep-in-foreground'
+
+# Interval (msecs) at which a stopping dnsmasq is polled
+STOP_CHECK_INTERVAL = 10
+
+# Interval (msecs) at which the sockets of a starting dnsmasq are checked
+STARTUP_CHECK_INTERVAL = 100
+
+# UDP ports dnsmasq listens on
+DHCP_PORT = 67
+DHCPV6_PORT = 547
+TFTP_PORT = 69
+
+PROC_NET_UDP_FILES = ['/proc/net/udp', '/proc/net/udp6']
+
+
+def bound_udp_ports(pid):
+    '''
+    Returns the set of local UDP ports of the sockets opened by a process.
+    '''
+    inodes = set()
+    fd_dir = '/proc/%d/fd' % (pid)
+    try:
+        for fd in os.listdir(fd_dir):
+            try:
+                link = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if link.startswith('socket:['):
+                inodes.add(link[8:-1])
+    except OSError:
+        return set()
+
+    ports = set()
+    for path in PROC_NET_UDP_FILES:
+        try:
+            with open(path, 'r') as proc_net_udp:
+                proc_net_udp.readline()
+                for line in proc_net_udp:
+                    fields = line.split()
+                    if len(fields) > 9 and fields[9] in inodes:
+                        ports.add(int(fields[1].rsplit(':', 1)[1], 16))
+        except IOError:
+            continue
+
+    return ports
+
+
+class DnsmasqSupervisor(object):
+    def __init__(self, stop_timeout=2.0, startup_timeout=1000):
+        '''
+        stop_timeout is the time (secs) dnsmasq is given to exit after
+        SIGTERM before it is killed. startup_timeout is the time (msecs)
+        dnsmasq is given to open its sockets or to fail on a bad config
+        before it is considered started.
+        '''
+        self.process = None
+        self.command = None
+        self.stop_timeout = stop_timeout
+        self.startup_timeout = startup_timeout
+        self.startup_deadline = None
+        self.startup_ports = []
+        self.startup_err = ""
+        self.stderr_eof = False
+        self.stderr_buf = ""
+        self.stopping = None
+        self.stop_deadline = None
+        self.pending_start = None
+
+    def pid(self):
+        if self.process is None:
+            return None
+        return self.process.pid
+
+    def is_running(self):
+        '''
+        Checks if dnsmasq is running. This also reaps an exited dnsmasq,
+        so it doesn't stay around as a zombie process.
+        '''
+        return self.process is not None and self.process.poll() is None
+
+    def start(self, command, startup_ports=None):
+        '''
+        Starts dnsmasq in the foreground without waiting for it. The
+        startup is completed by check_startup(). startup_ports is a list
+        of groups of UDP ports, dnsmasq has started once it has bound
+        one port of each group. If a previous dnsmasq is still stopping,
+        dnsmasq is started by run() once it is reaped.
+        '''
+        if self.stopping is not None:
+            self.pending_start = (command, startup_ports)
+            return
+
+        self.command = list(command)
+        if DNSMASQ_FOREGROUND_OPTION not in self.command:
+            self.command.append(DNSMASQ_FOREGROUND_OPTION)
+
+        with open(os.devnull, 'w') as devnull:
+            self.process = subprocess.Popen(self.command,
+                                            stdout=devnull,
+                                            stderr=subprocess.PIPE,
+                                            close_fds=True)
+
+        stderr_fd = self.process.stderr.fileno()
+        flags = fcntl.fcntl(stderr_fd, fcntl.F_GETFL)
+        fcntl.fcntl(stderr_fd, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+
+        self.startup_deadline = ovs.timeval.msec() + self.startup_timeout
+        self.startup_ports = startup_ports or []
+        self.startup_err = ""
+        self.stderr_eof = False
+        self.stderr_buf = ""
+
+    def is_starting(self):
+        return self.startup_deadline is not None or \
+            self.pending_start is not None
+
+    def __read_stderr(self):
+        data = ""
+        while not self.stderr_eof:
+            try:
+                chunk = os.read(self.process.stderr.fileno(), 4096)
+            except OSError as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    break
+                raise
+            if not chunk:
+                self.stderr_eof = True
+            data += chunk
+        return data
+
+    def __log_stderr(self):
+        '''
+        Logs the complete lines written by dnsmasq to stderr since its
+        startup.
+        '''
+        self.stderr_buf += self.__read_stderr()
+        if self.stderr_eof:
+            lines = self.stderr_buf.splitlines()
+            self.stderr_buf = ""
+        else:
+            lines = self.stderr_buf.split('\n')
+            self.stderr_buf = lines.pop()
+
+        for line in lines:
+            if line:
+                vlog.warn("dnsmasq_supervisor - dnsmasq pid %d: %s"
+                          % (self.process.pid, line))
+
+    def __reap(self):
+        '''
+        Reaps the stopping dnsmasq, or kills it once stop_timeout has
+        passed. Starts the pending dnsmasq once it is reaped.
+        '''
+        if self.stopping.poll() is None:
+            if self.stop_deadline is not None and \
+               ovs.timeval.msec() >= self.stop_deadline:
+                vlog.info("dnsmasq_supervisor - dnsmasq pid %d did not "
+                          "exit, killing it" % (self.stopping.pid))
+                try:
+                    self.stopping.kill()
+                except OSError:
+                    pass
+                self.stop_deadline = None
+            return
+
+        self.stopping.stderr.close()
+        self.stopping = None
+
+        if self.pending_start is not None:
+            command, startup_ports = self.pending_start
+            self.pending_start = None
+            self.start(command, startup_ports)
+
+    def run(self):
+        '''
+        Runs the supervisor from the daemon's poll loop. Reaps an exited
+        or stopping dnsmasq and logs the error output of a running one.
+        '''
+        if self.stopping is not None:
+            self.__reap()
+
+        if self.process is not None and self.startup_deadline is None:
+            self.__log_stderr()
+            self.is_running()
+
+    def check_startup(self):
+        '''
+        Checks the progress of a dnsmasq startup. Returns None while the
+        startup is in progress, otherwise a (started, message) tuple. The
+        message is the error output of dnsmasq if it failed to start.
+        '''
+        if self.startup_deadline is None:
+            return None
+
+        self.startup_err += self.__read_stderr()
+
+        if self.process.poll() is not None:
+            self.startup_deadline = None
+            if self.startup_err == "":
+                self.startup_err = "dnsmasq exited with status %d" % \
+                                   (self.process.returncode)
+            return (False, self.startup_err)
+
+        # Without ports to check, dnsmasq has started if it is still
+        # running at the deadline
+        ports = bound_udp_ports(self.process.pid)
+        listening = len(self.startup_ports) > 0
+        for port_group in self.startup_ports:
+            if not ports.intersection(port_group):
+                listening = False
+
+        if not listening and ovs.timeval.msec() < self.startup_deadline:
+            return None
+
+        self.startup_deadline = None
+        return (True, "listening on udp ports %s" %
+                (' '.join(str(port) for port in sorted(ports))))
+
+    def wait(self, poller):
+        '''
+        Makes the poller wake up on dnsmasq startup progress, error
+        output and exit of a stopping dnsmasq.
+        '''
+        if self.stopping is not None:
+            # A process exit gives no poll event, so check it periodically
+            poller.timer_wait(STOP_CHECK_INTERVAL)
+
+        if self.process is None:
+            return
+
+        if not self.stderr_eof:
+            poller.fd_wait(self.process.stderr.fileno(), ovs.poller.POLLIN)
+
+        if self.startup_deadline is None:
+            return
+
+        poller.timer_wait_until(self.startup_deadline)
+        if self.startup_ports:
+            # Sockets give no poll event, so check them periodically
+            poller.timer_wait(STARTUP_CHECK_INTERVAL)
+
+    def reload(self):
+        '''
+        Sends SIGHUP to dnsmasq. Returns False if dnsmasq is not running.
+        '''
+        if not self.is_running():
+            return False
+
+        try:
+            os.kill(self.process.pid, signal.SIGHUP)
+        except OSError:
+            return False
+
+        return True
+
+    def stop(self):
+        '''
+        Stops dnsmasq with SIGTERM without waiting for it to exit. The
+        stopping dnsmasq is reaped by run(), which kills it with SIGKILL
+        if it did not exit within stop_timeout.
+        '''
+        self.startup_deadline = None
+        self.pending_start = None
+
+        if self.process is None:
+            return
+
+        if not self.is_running():
+            self.process.stderr.close()
+            self.process = None
+            return
+
+        vlog.dbg("dnsmasq_supervisor - stopping dnsmasq pid %d"
+                 % (self.process.pid))
+        try:
+            self.process.terminate()
+        except OSError:
+            pass
+
+        self.stopping = self.process
+        self.stop_deadline = ovs.timeval.msec() + \
+            int(self.stop_timeout * 1000)
+        self.process = None
+
+    def close(self):
+        '''
+        Stops dnsmasq on daemon exit. A dnsmasq which did not exit on
+        SIGTERM is killed right away rather than waited for.
+        '''
+        self.stop()
+        if self.stopping is None:
+            return
+
+        if self.stopping.poll() is None:
+            try:
+                self.stopping.kill()
+            except OSError:
+                pass
+            self.stopping.wait()
+
+        self.stopping.stderr.close()
+        self.stopping = None
@@ -45,7 +45,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "tag" in dump and "10.255.255.255" in dump and "60" in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "10.0.0.1" in dump_bash and "10.0.0.254" in dump_bash and \
         "255.0.0.0" in dump_bash and "tag1" in dump_bash and \
         "tag2" in dump_bash and "tag3" in dump_bash and "tag" in \
@@ -60,7 +60,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         and "tag1,tag2,tag3" in dump and "60" in dump
 
     sleep(15)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.hosts", shell='bash')
     assert "10.0.0.100" in dump_bash and "aa:bb:cc:dd:ee:ff" in dump_bash \
         and "tag1" and "tag2" and "tag3" in dump_bash and "60" in dump_bash
 
@@ -73,7 +73,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         and "opt1,opt2,opt3" in dump
 
     sleep(15)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.opts", shell='bash')
     assert "option:Router" in dump_bash and "10.11.12.1" in dump_bash and \
         "opt1" and "opt2" and "opt3" in dump_bash
 
@@ -86,7 +86,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "tag4,tag5,tag6" in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.opts", shell='bash')
     assert "3" in dump_bash and "10.10.10.1" in dump_bash and "tag4" and \
         "tag5" and "tag6" in dump_bash
 
@@ -99,7 +99,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "Router" in dump_bash and "10.20.10.1" in dump_bash and \
         "ops_match_name" in dump_bash
 
@@ -111,7 +111,7 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "3" in dump and "10.20.20.10" in dump and "ops_match_num" in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "3" in dump_bash and "10.20.20.10" in dump_bash and \
         "ops_match_num" in dump_bash
 
@@ -122,7 +122,7 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "/tmp/testfile" in dump and "ops_bootp" in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "/tmp/testfile" in dump_bash and "ops_bootp" in dump_bash
 
     step('### Test to delete DHCP dynamic configurations ###')
@@ -140,7 +140,7 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert range_created is False
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     range_in_use = False
     if "10.0.0.1" in dump_bash and "10.0.0.254" in dump_bash and \
         "255.0.0.0" in dump_bash and "tag1,tag2,tag3" in dump_bash  \
@@ -160,7 +160,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "testname" not in dump and "60" not in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.hosts", shell='bash')
     assert "10.0.0.100" not in dump_bash and "aa:bb:cc:dd:ee:ff" not in \
         dump_bash and "testid" not in dump_bash and "tag1,tag2,tag3" not \
         in dump_bash and "testname" not in dump_bash and ",60" not in \
@@ -178,7 +178,7 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert option_created is False
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.opts", shell='bash')
     option_in_use = False
     if "Router" in dump and "10.11.12.1" in dump \
             in dump and "opt1,opt2,opt3" in dump:
@@ -197,7 +197,7 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert option_created is False
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.opts", shell='bash')
     option_in_use = False
     if "3" in dump_bash and "10.10.10.1" in dump_bash and \
             "tag4,tag5,tag6" in dump_bash:
@@ -213,7 +213,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "ops_match_name" not in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "Router" not in dump and "10.20.10.1" not in dump and \
         "ops_match_name" not in dump
 
@@ -226,7 +226,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "ops_match_num" not in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "3" not in dump and "10.20.20.10" not in dump and \
         "ops_match_num" not in dump
 
@@ -237,7 +237,7 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "/tmp/testfile" not in dump and "ops_bootp" not in dump
 
     sleep(20)
-    dump_bash = sw1("ps -ef | grep dnsmasq", shell='bash')
+    dump_bash = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
     assert "/tmp/testfile" not in dump_bash and "ops_bootp" not \
         in dump_bash
 
@@ -249,8 +249,8 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "TFTP server : Enabled" in dump
 
     sleep(20)
-    dump = sw1("ps -ef | grep dnsmasq", shell='bash')
-    assert "--enable-tftp" in dump
+    dump = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
+    assert "enable-tftp" in dump
 
     step('### Test to enable tftp server secure mode ###')
     sw1("secure-mode")
@@ -258,8 +258,8 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "TFTP server secure mode : Enabled" in dump
 
     sleep(20)
-    dump = sw1("ps -ef | grep dnsmasq", shell='bash')
-    assert "--tftp-secure" in dump
+    dump = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
+    assert "tftp-secure" in dump
 
     step('### Test to add tftp path ###')
     sw1("path /tmp/")
@@ -267,8 +267,8 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "TFTP server file path : /tmp/" in dump
 
     sleep(20)
-    dump = sw1("ps -ef | grep dnsmasq", shell='bash')
-    assert "--tftp-root=/tmp/" in dump
+    dump = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
+    assert "tftp-root=/tmp/" in dump
 
     step('### Test to disable tftp server ###')
     sw1("no enable")
@@ -276,8 +276,8 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "TFTP server : Disabled" in dump
 
     sleep(20)
-    dump = sw1("ps -ef | grep dnsmasq", shell='bash')
-    assert "--enable-tftp" not in dump
+    dump = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
+    assert "enable-tftp" not in dump
 
     step('### Test to disable tftp server secure mode ###')
     sw1("no secure-mode")
@@ -285,11 +285,12 @@ def test_vtysh_dhcp_tftp(topology, step):
     assert "TFTP server secure mode : Disabled" in dump
 
     sleep(20)
-    dump = sw1("ps -ef | grep dnsmasq", shell='bash')
-    assert "--tftp-secure" not in dump
+    dump = sw1("cat /var/run/dhcp_tftp/dnsmasq.conf", shell='bash')
+    assert "tftp-secure" not in dump
 
     step('### Test to add DHCP leases information ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    # The leases expire in a day, the daemon reaps the expired leases
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases add 11:22:33:44:55:66 10.0.0.100 test_s1",
         shell='bash')
     dump = sw1("do show dhcp-server leases")
@@ -297,7 +298,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "test_s1" in dump
 
     step('### Test to modify DHCP leases information ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases old 11:22:33:44:55:66 20.0.0.200 test_s1_new",
         shell='bash')
     dump = sw1("do show dhcp-server leases")
@@ -305,7 +306,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "test_s1_new" in dump
 
     step('### Test to delete DHCP leases information ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases del 11:22:33:44:55:66 20.0.0.200 test_s1_new",
         shell='bash')
     dump = sw1("do show dhcp-server leases")
@@ -313,7 +314,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         dump and "test_s1_new" not in dump
 
     step('### Test to add DHCP v6 leases information ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases add \
         01:02:03:04:05:06:07:08:09:10:11:12:13:14:15:16:17:18:19:20 \
         20:1::1:241 test_v6_s1",
@@ -324,7 +325,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "test_v6_s1" in dump
 
     step('### Test to modify DHCP v6 leases information ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases old \
         01:02:03:04:05:06:07:08:09:10:11:12:13:14:15:16:17:18:19:20 \
         20:1::1:242 test_v6_s1_new",
@@ -335,7 +336,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         "test_v6_s1_new" in dump
 
     step('### Test to delete DHCP v6 leases information ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases del \
         01:02:03:04:05:06:07:08:09:10:11:12:13:14:15:16:17:18:19:20 \
         20:1::1:242 test_v6_s1_new",
@@ -346,7 +347,7 @@ def test_vtysh_dhcp_tftp(topology, step):
         dump and "test_v6_s1_new" not in dump
 
     step('### Test to clear all DHCP server leases ###')
-    sw1("export DNSMASQ_LEASE_EXPIRES=1440976224", shell='bash')
+    sw1("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))", shell='bash')
     sw1("dhcp_leases add 11:22:33:44:55:66 10.0.0.100 test_s1", shell='bash')
     sw1("dhcp_leases add 21:22:33:44:55:66 10.0.0.200 test_s2", shell='bash')
     sw1("configure terminal")
@@ -29,19 +29,32 @@ import argparse
 import os
 import sys
 import subprocess
-from time import sleep
-import signal
+from itertools import chain
 
-import ovs.dirs
-from ovs.db import error
-from ovs.db import types
 import ovs.daemon
 import ovs.db.idl
 import ovs.unixctl
 import ovs.unixctl.server
+import ovs.poller
+import ovs.timeval
 from ops_eventlog import event_log_init
 from ops_eventlog import log_event
 import ops_diagdump
+from dhcp_tftp_config import DHCPTFTPConfigCache
+from dhcp_tftp_config import dhcp_tftp_config_entries
+from dhcp_tftp_config import dhcp_tftp_config_reloadable
+from dhcp_tftp_config import write_dnsmasq_conf
+from dhcp_tftp_config import write_dnsmasq_reload_file
+from dhcp_tftp_config import DNSMASQ_DHCP_HOSTSFILE
+from dhcp_tftp_config import DNSMASQ_DHCP_OPTSFILE
+from dhcp_tftp_config import DNSMASQ_RESTART_FIELDS
+from dhcp_tftp_config import DNSMASQ_ENABLE_TFTP
+from dnsmasq_supervisor import DnsmasqSupervisor
+from dnsmasq_supervisor import DHCP_PORT
+from dnsmasq_supervisor import DHCPV6_PORT
+from dnsmasq_supervisor import TFTP_PORT
+from dhcp_lease_service import DHCPLeaseService
+from dhcp_lease_service import LEASE_COMMIT_MODES
 
 # OVS definitions
 idl = None
@@ -100,19 +113,61 @@ vlog = ovs.vlog.Vlog("dhcp_tftp")
 exiting = False
 seqno = 0
 
-dnsmasq_process = None
+dnsmasq_supervisor = DnsmasqSupervisor()
+dhcp_leases_clear_process = None
+
+# Lease events of dnsmasq are forwarded to this service by the
+# dhcp_leases_client script
+dhcp_lease_service = DHCPLeaseService()
+
+# Time (msecs) at which the daemon was started
+daemon_start_time = None
+
 dnsmasq_started = False
 dnsmasq_command = None
 dhcp_range_config = False
+dhcp_tftp_config = None
+dhcp_tftp_config_cache = DHCPTFTPConfigCache()
+
+# dnsmasq config is rendered to this file and passed with --conf-file
+dnsmasq_run_dir = '/var/run/dhcp_tftp'
+dnsmasq_conf_file = dnsmasq_run_dir + '/dnsmasq.conf'
+dnsmasq_hosts_file = dnsmasq_run_dir + '/dnsmasq.hosts'
+dnsmasq_opts_file = dnsmasq_run_dir + '/dnsmasq.opts'
+
+# Static hosts and options are passed in dhcp-hostsfile/dhcp-optsfile and
+# reloaded with SIGHUP, unless disabled with --disable-reload
+dnsmasq_reload_enabled = True
+
+# Config changes are coalesced until no change was seen for the quiet
+# period or the oldest pending change is max delay old (msecs)
+coalesce_quiet_period = 200
+coalesce_max_delay = 1000
+coalesce_first_change = None
+coalesce_last_change = None
+
+# Daemon statistics, shown by the dhcp_tftp/show-stats unixctl command
+dhcp_tftp_stats = {'config_changes': 0,
+                   'config_changes_coalesced': 0,
+                   'config_applies': 0,
+                   'boot_to_serving_msecs': None}
 
 # OPS_TODO: Remove the log facility option before final release
-dnsmasq_default_command = ('/usr/bin/dnsmasq --port=0 --user=root '
-                           '--dhcp-script=/usr/bin/dhcp_leases --leasefile-ro '
-                           '--log-facility=/tmp/dnsmasq.log ')
-dnsmasq_dhcp_range_option = '--dhcp-range='
-dnsmasq_dhcp_host_option = '--dhcp-host='
-dnsmasq_dhcp_option_arg = '--dhcp-option='
-dnsmasq_dhcp_boot_option = '--dhcp-boot='
+dnsmasq_default_command = ['/usr/bin/dnsmasq', '--port=0', '--user=root',
+                           '--dhcp-script=/usr/bin/dhcp_leases_client.py',
+                           '--leasefile-ro',
+                           '--log-facility=/tmp/dnsmasq.log',
+                           '--keep-in-foreground',
+                           '--conf-file=' + dnsmasq_conf_file]
+
+
+class DHCPTFTPIdl(ovs.db.idl.Idl):
+    '''
+    IDL which reports every inserted, modified and deleted row to the
+    DHCP-TFTP config cache, so that only those rows are re-rendered.
+    '''
+    def notify(self, event, row, updates=None):
+        dhcp_tftp_config_cache.row_changed(row._table.name, row.uuid)
 
 
 def unixctl_exit(conn, unused_argv, unused_aux):
@@ -121,6 +176,31 @@ def unixctl_exit(conn, unused_argv, unused_aux):
     conn.reply(None)
 
 
+def unixctl_show_stats(conn, unused_argv, unused_aux):
+    conn.reply(dhcp_tftp_stats_str())
+
+
+# ------------------ dhcp_tftp_stats_str() ----------------
+def dhcp_tftp_stats_str():
+    buff = ''
+    for key in sorted(dhcp_tftp_stats):
+        buff = buff + '%s: %s\n' % (key, dhcp_tftp_stats[key])
+
+    for key in sorted(dhcp_lease_service.stats):
+        buff = buff + '%s: %s\n' % (key, dhcp_lease_service.stats[key])
+
+    for key in sorted(dhcp_lease_service.snapshot.stats):
+        buff = buff + '%s: %s\n' % (key,
+                                     dhcp_lease_service.snapshot.stats[key])
+
+    if dhcp_lease_service.reaper is not None:
+        for key in sorted(dhcp_lease_service.reaper.stats):
+            buff = buff + '%s: %s\n' % (key,
+                                         dhcp_lease_service.reaper.stats[key])
+
+    return buff
+
+
 # ------------------ db_get_system_status() ----------------
 def db_get_system_status(data):
     '''
@@ -172,6 +252,18 @@ def ops_dhcp_tftp_diagnostics_handler(argv):
         fbuff += ['========================================================\n']
         fbuff += log.readlines()
 
+    # Capture the config file passed to dnsmasq
+    if os.path.isfile(dnsmasq_conf_file):
+        with open(dnsmasq_conf_file, "r") as conf:
+            fbuff += ['Dnsmasq config file\n']
+            fbuff += ['=================================================='
+                      '======\n']
+            fbuff += conf.readlines()
+
+    fbuff += ['Daemon statistics\n']
+    fbuff += ['========================================================\n']
+    fbuff += [dhcp_tftp_stats_str()]
+
     for x in fbuff:
         buff += x
 
@@ -207,7 +299,7 @@ def dhcp_tftp_init(remote):
     schema_helper.register_table(DHCP_SERVER_OPTION_TABLE)
     schema_helper.register_table(DHCP_SERVER_MATCH_TABLE)
 
-    idl = ovs.db.idl.Idl(remote, schema_helper)
+    idl = DHCPTFTPIdl(remote, schema_helper)
 
 
 # ------------------ dhcp_tftp_get_config() ---------
@@ -218,309 +310,276 @@ def dhcp_tftp_get_config():
     global dnsmasq_default_command
     global dhcp_range_config
     global dnsmasq_started
+    global dhcp_tftp_config
+    global dhcp_leases_clear_process
 
-    vrf_row = None
-    dhcp_server_rec = None
-    dhcpsrv_range_table = None
-    ovs_rec = None
     dhcp_leases_command = None
 
-    range_options = None
-    static_host_options = None
-
-    tags = []
-    dhcp_range = []
-    dhcp_host = []
-    dhcp_option = []
-    dhcp_boot = []
+    dhcp_tftp_config = dhcp_tftp_config_cache.get_config(idl.tables)
+    dhcp_tftp_log_static_host_conflicts()
 
     dnsmasq_command = dnsmasq_default_command
-    vlog.dbg("dhcp_tftp_debug - dnsmasq_command(1) %s "
-             % (dnsmasq_command))
 
-    # Get the dhcp server ranges config first
-    for ovs_rec in idl.tables[DHCP_SERVER_RANGE_TABLE].rows.itervalues():
+    if dhcp_tftp_config.ranges:
         dhcp_range_config = True
-        range_options = ""
-        if ovs_rec.match_tags and ovs_rec.match_tags is not None:
-            tags = ovs_rec.match_tags
-            for each_tag in tags:
-                range_options = range_options + 'tag:' + each_tag + ','
 
-        if ovs_rec.set_tag and ovs_rec.set_tag is not None:
-            tags = ovs_rec.set_tag
-            for each_tag in tags:
-                range_options = range_options + 'set:' + each_tag + ','
+    if dhcp_range_config == False and dnsmasq_started == False:
+        # Clear the leases in the background, the result is checked
+        # by dhcp_leases_clear_check() from the main loop
+        dhcp_leases_command = ['/usr/bin/dhcp_leases', 'clear']
+        dhcp_leases_clear_process = subprocess.Popen(dhcp_leases_command,
+                                                     stdout=subprocess.PIPE,
+                                                     stderr=subprocess.PIPE)
+
+    if not os.path.isdir(dnsmasq_run_dir):
+        os.makedirs(dnsmasq_run_dir)
+
+    if dnsmasq_reload_enabled:
+        dnsmasq_write_reload_files(dhcp_tftp_config)
+        conf_entries = chain(
+            dhcp_tftp_config_entries(dhcp_tftp_config,
+                                     DNSMASQ_RESTART_FIELDS),
+            [(DNSMASQ_DHCP_HOSTSFILE, dnsmasq_hosts_file),
+             (DNSMASQ_DHCP_OPTSFILE, dnsmasq_opts_file)])
+    else:
+        conf_entries = dhcp_tftp_config_entries(dhcp_tftp_config)
 
-        if ovs_rec.start_ip_address and ovs_rec.start_ip_address is not None:
-            range_options = range_options + ovs_rec.start_ip_address
+    write_dnsmasq_conf(dnsmasq_conf_file, conf_entries)
 
-        if ovs_rec.end_ip_address and ovs_rec.end_ip_address is not None:
-            range_options = range_options + ',' + ovs_rec.end_ip_address[0]
+    vlog.info("dhcp_tftp_debug - dnsmasq config written to %s "
+              % (dnsmasq_conf_file))
 
-        if ovs_rec.is_static and ovs_rec.is_static is not None:
-            if ovs_rec.is_static[0] == True:
-                range_options = range_options + ',' + 'static'
 
-        if ovs_rec.netmask and ovs_rec.netmask is not None:
-            range_options = range_options + ',' + ovs_rec.netmask[0]
+# ------------------ dhcp_tftp_log_static_host_conflicts() ---------
+def dhcp_tftp_log_static_host_conflicts():
+    '''
+    Logs the changed static hosts which share their IP address, a MAC
+    address, the client-id or the hostname with another static host.
+    dnsmasq only uses the first of these hosts.
+    '''
+    for ovs_rec, (column, value), other_rec in \
+            dhcp_tftp_config_cache.static_host_conflicts:
+        vlog.warn("dhcp_tftp_debug - static host %s: %s %s is also "
+                  "configured for static host %s"
+                  % (ovs_rec.ip_address, column, value,
+                     other_rec.ip_address))
 
-        if ovs_rec.broadcast and ovs_rec.broadcast is not None:
-            range_options = range_options + ',' + ovs_rec.broadcast[0]
 
-        if ovs_rec.prefix_len and ovs_rec.prefix_len is not None:
-            if ovs_rec.prefix_len[0] != 64:
-                range_options = range_options + ',' + \
-                                str(ovs_rec.prefix_len[0])
+# ------------------ dnsmasq_write_reload_files() ---------
+def dnsmasq_write_reload_files(config):
+    '''
+    Writes the static hosts and options of the config to the files
+    dnsmasq re-reads on SIGHUP.
+    '''
+    write_dnsmasq_reload_file(dnsmasq_hosts_file,
+                              dhcp_tftp_config_entries(config,
+                                                       ['static_hosts']))
+    write_dnsmasq_reload_file(dnsmasq_opts_file,
+                              dhcp_tftp_config_entries(config, ['options']))
 
-        if ovs_rec.lease_duration and ovs_rec.lease_duration is not None:
-            if ovs_rec.lease_duration[0] == 0:
-                range_options = range_options + ',' + 'infinite'
-            else:
-                range_options = range_options + ',' + \
-                                str(ovs_rec.lease_duration[0]) + 'm'
 
-        vlog.dbg("dhcp_tftp_debug - dhcp_range %s "
-                 % (range_options))
-        dnsmasq_command = dnsmasq_command + ' --dhcp-range=' + range_options
-        vlog.dbg("dhcp_tftp_debug - dnsmasq cmd %s "
-                 % (dnsmasq_command))
-        # print dnsmasq_command
+# ------------------ dhcp_tftp_config_apply() ---------
+def dhcp_tftp_config_apply():
+    '''
+    Compares the DHCP-TFTP config currently in the IDL with the
+    config dnsmasq is running with. If only static hosts and options
+    changed dnsmasq is reloaded, otherwise it is restarted.
+    '''
+    global idl
+    global dhcp_tftp_config
 
-    if dhcp_range_config == False and dnsmasq_started == False:
-        dhcp_leases_command = "/usr/bin/dhcp_leases clear"
-        dnsmasq_process = subprocess.Popen(dhcp_leases_command,
-                                           stdout=subprocess.PIPE,
-                                           stderr=subprocess.PIPE, shell=True)
-
-        sleep(5)
-        dnsmasq_process.poll()
-        err = dnsmasq_process.stderr.read()
-        print err
-        if err != "":
-           vlog.emer("%s" % (err))
-           vlog.emer("Error with config, dnsmasq failed, command %s" %
-                  (dhcp_leases_command))
-
-    # Get the dhcp server static hosts config
-    for ovs_rec in idl.tables[DHCP_SERVER_STATIC_HOST_TABLE].rows.itervalues():
-        static_host_options = ""
-        if ovs_rec.mac_addresses and ovs_rec.mac_addresses is not None:
-            macs = ovs_rec.mac_addresses
-            for each_mac in macs:
-                static_host_options = static_host_options + each_mac + ','
-
-        if ovs_rec.client_id and ovs_rec.client_id is not None:
-            static_host_options = static_host_options + 'id:' + \
-                                  ovs_rec.client_id[0] + ','
-
-        if ovs_rec.set_tags and ovs_rec.set_tags is not None:
-            tags = ovs_rec.set_tags
-            for each_tag in tags:
-                static_host_options = static_host_options + 'set:' + \
-                                      each_tag + ','
-
-        if ovs_rec.ip_address and ovs_rec.ip_address is not None:
-            static_host_options = static_host_options + ovs_rec.ip_address
-
-        if ovs_rec.client_hostname and ovs_rec.client_hostname is not None:
-            static_host_options = static_host_options + ',' + \
-                                  ovs_rec.client_hostname[0]
-
-        if ovs_rec.lease_duration and ovs_rec.lease_duration is not None:
-            if ovs_rec.lease_duration[0] == 0:
-                static_host_options = static_host_options + ',' + 'infinite'
-            else:
-                static_host_options = static_host_options + ',' + \
-                                      str(ovs_rec.lease_duration[0]) + 'm'
-
-        vlog.dbg("dhcp_tftp_debug - dhcp_host %s "
-                 % (static_host_options))
-        dnsmasq_command = dnsmasq_command + ' --dhcp-host=' + \
-            static_host_options
-        vlog.dbg("dhcp_tftp_debug - dnsmasq cmd %s "
-                 % (dnsmasq_command))
-        # print dnsmasq_command
-
-    # Get the dhcp server options config
-    for ovs_rec in idl.tables[DHCP_SERVER_OPTION_TABLE].rows.itervalues():
-        dhcp_options = ""
-        if ovs_rec.match_tags and ovs_rec.match_tags is not None:
-            tags = ovs_rec.match_tags
-            for each_tag in tags:
-                dhcp_options = dhcp_options + 'set:' + each_tag + ','
-
-        if ovs_rec.option_name and ovs_rec.option_name is not None:
-            if ovs_rec.ipv6 and ovs_rec.ipv6 is not None:
-                if ovs_rec.ipv6[0] == True:
-                    dhcp_options = dhcp_options + 'option6:'
-                else:
-                    dhcp_options = dhcp_options + 'option:'
-            else:
-                dhcp_options = dhcp_options + 'option:'
-
-            dhcp_options = dhcp_options + ovs_rec.option_name[0]
-        else:
-            dhcp_options = dhcp_options + str(ovs_rec.option_number[0])
-
-        if ovs_rec.option_value and ovs_rec.option_value is not None:
-            dhcp_options = dhcp_options + ',' + ovs_rec.option_value[0]
-
-        vlog.dbg("dhcp_tftp_debug - dhcp_option %s "
-                 % (dhcp_options))
-        dnsmasq_command = dnsmasq_command + ' --dhcp-option=' + dhcp_options
-        vlog.dbg("dhcp_tftp_debug - dnsmasq cmd %s "
-                 % (dnsmasq_command))
-        # print dnsmasq_command
-
-    # Get the dhcp server matches config
-    for ovs_rec in idl.tables[DHCP_SERVER_MATCH_TABLE].rows.itervalues():
-        match_options = ""
-        if ovs_rec.set_tag and ovs_rec.set_tag is not None:
-            match_options = match_options + 'set:' + ovs_rec.set_tag + ','
-
-        if ovs_rec.option_name and ovs_rec.option_name is not None:
-            match_options = match_options + 'option:' + ovs_rec.option_name[0]
-        else:
-            match_options = match_options + str(ovs_rec.option_number[0])
-
-        if ovs_rec.option_value and ovs_rec.option_value is not None:
-            match_options = match_options + ',' + ovs_rec.option_value[0]
-
-        vlog.dbg("dhcp_tftp_debug - dhcp match %s "
-                 % (match_options))
-        dnsmasq_command = dnsmasq_command + ' --dhcp-match=' + match_options
-        vlog.dbg("dhcp_tftp_debug - dnsmasq cmd %s "
-                 % (dnsmasq_command))
-        # print dnsmasq_command
-
-    # Get the dhcp server bootp config
-    for ovs_rec in idl.tables[DHCP_SERVER_TABLE].rows.itervalues():
-        if ovs_rec.bootp and ovs_rec.bootp is not None:
-            bootp_options = ""
-            bootp = {}
-            bootp = ovs_rec.bootp
-            for key, value in bootp.iteritems():
-                bootp_options = ""
-                if key == 'no_matching_tag':
-                    bootp_options = value
-                else:
-                    bootp_options = 'tag:' + key + ',' + value
-
-                vlog.dbg("dhcp_tftp_debug - dhcp boot %s "
-                         % (bootp_options))
-                dnsmasq_command = dnsmasq_command + ' --dhcp-boot=' + \
-                    bootp_options
-                vlog.dbg("dhcp_tftp_debug - dnsmasq cmd %s "
-                         % (dnsmasq_command))
-        # print dnsmasq_command
-
-    # Get the tftp server config
-    for ovs_rec in idl.tables[SYSTEM_TABLE].rows.itervalues():
-        if ovs_rec.other_config and ovs_rec.other_config is not None:
-            for key, value in ovs_rec.other_config.iteritems():
-                if key == 'tftp_server_enable':
-                    if value and value == 'true':
-                        dnsmasq_command = dnsmasq_command + ' --enable-tftp '
-                if key == 'tftp_server_secure':
-                    if value and value == 'true':
-                        dnsmasq_command = dnsmasq_command + ' --tftp-secure '
-                if key == 'tftp_server_path':
-                    if value and value is not None:
-                        dnsmasq_command = dnsmasq_command + ' --tftp-root=' + \
-                                          value
-
-                vlog.dbg("dhcp_tftp_debug - dnsmasq cmd %s "
-                         % (dnsmasq_command))
-                # print dnsmasq_command
-
-    vlog.info("dhcp_tftp_debug - dnsmasq_command(2) %s "
-              % (dnsmasq_command))
+    new_config = dhcp_tftp_config_cache.get_config(idl.tables)
+    dhcp_tftp_log_static_host_conflicts()
+
+    if new_config == dhcp_tftp_config:
+        vlog.dbg("dhcp_tftp_debug - config unchanged, "
+                 "dnsmasq not restarted")
+        return
+
+    if dnsmasq_reload_enabled and \
+       dhcp_tftp_config_reloadable(dhcp_tftp_config, new_config) and \
+       dnsmasq_reload(new_config):
+        return
+
+    dnsmasq_restart()
+
+
+# ------------------ dhcp_tftp_config_changed() ---------
+def dhcp_tftp_config_changed():
+    '''
+    Records a config change seen in the IDL. The change is applied
+    later by dhcp_tftp_config_coalesce() together with the other changes
+    of the same burst.
+    '''
+    global coalesce_first_change
+    global coalesce_last_change
+
+    now = ovs.timeval.msec()
+    dhcp_tftp_stats['config_changes'] += 1
+
+    if coalesce_first_change is None:
+        coalesce_first_change = now
+    else:
+        dhcp_tftp_stats['config_changes_coalesced'] += 1
+
+    coalesce_last_change = now
+
+
+# ------------------ dhcp_tftp_config_deadline() ---------
+def dhcp_tftp_config_deadline():
+    '''
+    Returns the time (msecs) at which the pending config changes have
+    to be applied, or None if no change is pending.
+    '''
+    if coalesce_first_change is None:
+        return None
+
+    return min(coalesce_last_change + coalesce_quiet_period,
+               coalesce_first_change + coalesce_max_delay)
+
+
+# ------------------ dhcp_tftp_config_coalesce() ---------
+def dhcp_tftp_config_coalesce():
+    '''
+    Applies the pending config changes once the quiet period has
+    elapsed or the max delay has been reached.
+    '''
+    global coalesce_first_change
+    global coalesce_last_change
+
+    deadline = dhcp_tftp_config_deadline()
+    if deadline is None or ovs.timeval.msec() < deadline:
+        return
+
+    coalesce_first_change = None
+    coalesce_last_change = None
+    dhcp_tftp_stats['config_applies'] += 1
+
+    dhcp_tftp_config_apply()
 
 
 # ------------------ dnsmasq_start_process() ----------
 def dnsmasq_start_process():
-
-    global dnsmasq_process
+    '''
+    Starts dnsmasq. The startup is completed asynchronously by
+    dnsmasq_check_startup() from the main loop.
+    '''
     global dnsmasq_command
 
-    dnsmasq_process = None
-
     vlog.info("dhcp_tftp_debug - dnsmasq_command(3) %s "
-              % (dnsmasq_command))
+              % (' '.join(dnsmasq_command)))
 
-    dnsmasq_process = subprocess.Popen(dnsmasq_command,
-                                       stdout=subprocess.PIPE,
-                                       stderr=subprocess.PIPE, shell=True)
+    # dnsmasq has started once it listens on the DHCP and TFTP ports
+    startup_ports = []
+    if dhcp_tftp_config.ranges:
+        startup_ports.append((DHCP_PORT, DHCPV6_PORT))
+    if (DNSMASQ_ENABLE_TFTP, None) in dhcp_tftp_config.tftp:
+        startup_ports.append((TFTP_PORT,))
 
-    err = dnsmasq_process.stderr.read()
-    print err
-    if err != "":
-        vlog.emer("%s" % (err))
+    dnsmasq_supervisor.start(dnsmasq_command, startup_ports)
+
+
+# ------------------ dnsmasq_check_startup() ----------
+def dnsmasq_check_startup():
+    '''
+    Checks if a starting dnsmasq has come up or failed and reports it.
+    '''
+    result = dnsmasq_supervisor.check_startup()
+    if result is None:
+        return
+
+    started, message = result
+    if not started:
+        vlog.emer("%s" % (message))
         vlog.emer("Error with config, dnsmasq failed, command %s" %
-                  (dnsmasq_command))
+                  (' '.join(dnsmasq_command)))
         log_event("DNSMASQ_FAILURE",
-                  ["dnsmasq_command", dnsmasq_command])
+                  ["dnsmasq_command", ' '.join(dnsmasq_command)])
     else:
-        vlog.info("dhcp_tftp_debug - dnsmasq started")
+        vlog.info("dhcp_tftp_debug - dnsmasq started, pid %d, %s"
+                  % (dnsmasq_supervisor.pid(), message))
         log_event("DNSMASQ_SUCCESS",
-                  ["dnsmasq_command", dnsmasq_command])
+                  ["dnsmasq_command", ' '.join(dnsmasq_command)])
+
+        if dhcp_tftp_stats['boot_to_serving_msecs'] is None:
+            dhcp_tftp_stats['boot_to_serving_msecs'] = \
+                ovs.timeval.msec() - daemon_start_time
+            vlog.info("dhcp_tftp_debug - dnsmasq serving %d msecs after "
+                      "daemon start"
+                      % (dhcp_tftp_stats['boot_to_serving_msecs']))
+
+
+# ------------------ dhcp_leases_clear_check() ----------
+def dhcp_leases_clear_check():
+    '''
+    Reports the result of the background leases clear once it exits.
+    '''
+    global dhcp_leases_clear_process
+
+    if dhcp_leases_clear_process is None or \
+       dhcp_leases_clear_process.poll() is None:
+        return
+
+    err = dhcp_leases_clear_process.stderr.read()
+    dhcp_leases_clear_process = None
+    if err != "":
+        vlog.emer("%s" % (err))
+        vlog.emer("Error with config, dhcp_leases clear failed")
 
 
 # ------------------ dnsmasq_run() ----------------
 def dnsmasq_run():
-
-    global idl
-    global seqno
+    '''
+    Starts dnsmasq once System:cur_cfg shows that the system is
+    configured and the startup config is restored.
+    '''
     global dnsmasq_started
 
-    idl.run()
+    if system_is_configured() == False:
+        return
 
-    if seqno != idl.change_seqno:
-        vlog.info("dhcp_tftp_debug - seqno change from %d to %d "
-                  % (seqno, idl.change_seqno))
-        seqno = idl.change_seqno
+    # Get the dhcp-tftp config
+    dhcp_tftp_get_config()
+
+    # Start the dnsmasq
+    dnsmasq_start_process()
+    dnsmasq_started = True
 
-        # Check if system is configured and startup config is restored
-        if system_is_configured() == False:
-            return
-        else:
-            # Get the dhcp-tftp config
-            dhcp_tftp_get_config()
 
-            # Start the dnsmasq
-            dnsmasq_start_process()
-            dnsmasq_started = True
+# --------------------- dnsmasq_reload() --------------
+def dnsmasq_reload(config):
+    '''
+    Rewrites the dnsmasq hostsfile and optsfile and sends SIGHUP to
+    dnsmasq to re-read them. Returns False if dnsmasq could not be
+    signalled, in which case it needs to be restarted.
+    '''
+    global dhcp_tftp_config
+
+    if not dnsmasq_supervisor.is_running():
+        vlog.info("dhcp_tftp_debug - dnsmasq not running, unable to reload")
+        return False
+
+    dnsmasq_write_reload_files(config)
+
+    if not dnsmasq_supervisor.reload():
+        vlog.info("dhcp_tftp_debug - unable to reload dnsmasq process")
+        return False
+
+    dhcp_tftp_config = config
+    vlog.info("dhcp_tftp_debug - dnsmasq reloaded")
+
+    return True
 
 
 # --------------------- dnsmasq_restart() --------------
 def dnsmasq_restart():
 
     global idl
-    global dnsmasq_process
-
-    if dnsmasq_process is not None:
-        vlog.dbg("dhcp_tftp_debug - killing dnsmasq")
-        try:
-            dnsmasq_process.kill()
-        except OSError:
-            vlog.info("dhcp_tftp_debug - unable to kill dnsmasq process")
-            pass
-
-    # Also check if any other dnsmasq process is running and kill
-    # This needs to be done as dnsmasq binary forks multiple processes
-    vlog.info("dhcp_tftp_debug (2) - killing dnsmasq")
-    p = subprocess.Popen(['ps', '-A'], stdout=subprocess.PIPE)
-    out, err = p.communicate()
-
-    for line in out.splitlines():
-        if 'dnsmasq' in line:
-            pid = int(line.split(None, 1)[0])
-            try:
-                os.kill(pid, signal.SIGKILL)
-            except OSError:
-                vlog.info("dhcp_tftp_debug - unable to kill previous process")
-                pass
+
+    # dnsmasq runs in the foreground, so stopping the supervised process
+    # stops only the dnsmasq started by this daemon
+    vlog.info("dhcp_tftp_debug - stopping dnsmasq")
+    dnsmasq_supervisor.stop()
 
     # Get the config
     dhcp_tftp_get_config()
@@ -536,12 +595,47 @@ def main():
     global idl
     global seqno
     global dnsmasq_started
-    global dnsmasq_process
+    global dnsmasq_reload_enabled
+    global daemon_start_time
+    global coalesce_quiet_period
+    global coalesce_max_delay
+
+    daemon_start_time = ovs.timeval.msec()
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-d', '--database', metavar="DATABASE",
                         help="A socket on which ovsdb-server is listening.",
                         dest='database')
+    parser.add_argument('--disable-reload', action='store_true',
+                        help="Restart dnsmasq on static host and option "
+                             "changes instead of reloading it with SIGHUP.",
+                        dest='disable_reload')
+    parser.add_argument('--coalesce-quiet-period', metavar="MSECS", type=int,
+                        default=coalesce_quiet_period,
+                        help="Apply config changes only after no further "
+                             "change was seen for MSECS milliseconds.",
+                        dest='coalesce_quiet_period')
+    parser.add_argument('--coalesce-max-delay', metavar="MSECS", type=int,
+                        default=coalesce_max_delay,
+                        help="Apply config changes at most MSECS "
+                             "milliseconds after the first change.",
+                        dest='coalesce_max_delay')
+    parser.add_argument('--lease-commit', choices=LEASE_COMMIT_MODES,
+                        default=dhcp_lease_service.commit_mode,
+                        help="Write every lease event in its own "
+                             "transaction (sync) or queue the lease events "
+                             "and write them in batches (group).",
+                        dest='lease_commit')
+    parser.add_argument('--lease-commit-interval', metavar="MSECS", type=int,
+                        default=dhcp_lease_service.commit_interval,
+                        help="Write queued lease events at most MSECS "
+                             "milliseconds after the first queued event.",
+                        dest='lease_commit_interval')
+    parser.add_argument('--lease-commit-batch', metavar="EVENTS", type=int,
+                        default=dhcp_lease_service.commit_batch,
+                        help="Write queued lease events once EVENTS "
+                             "leases are queued.",
+                        dest='lease_commit_batch')
 
     ovs.vlog.add_args(parser)
     ovs.daemon.add_args(parser)
@@ -554,6 +648,13 @@ def main():
     else:
         remote = args.database
 
+    dnsmasq_reload_enabled = not args.disable_reload
+    coalesce_quiet_period = args.coalesce_quiet_period
+    coalesce_max_delay = args.coalesce_max_delay
+    dhcp_lease_service.commit_mode = args.lease_commit
+    dhcp_lease_service.commit_interval = args.lease_commit_interval
+    dhcp_lease_service.commit_batch = args.lease_commit_batch
+
     dhcp_tftp_init(remote)
 
     ovs.daemon.daemonize()
@@ -561,15 +662,16 @@ def main():
     ovs.daemon._make_pidfile()
 
     ovs.unixctl.command_register("exit", "", 0, 0, unixctl_exit, None)
+    ovs.unixctl.command_register("dhcp_tftp/show-stats", "", 0, 0,
+                                 unixctl_show_stats, None)
     error, unixctl_server = ovs.unixctl.server.UnixctlServer.create(None)
 
     if error:
         ovs.util.ovs_fatal(error, "dhcp_tftp_helper: could not create "
                                   "unix-ctl server", vlog)
 
-    while dnsmasq_started is False:
-        dnsmasq_run()
-        sleep(2)
+    # Serve the lease events of dnsmasq
+    dhcp_lease_service.open()
 
     # Event logging init for DHCP-TFTP server
     event_log_init("DHCP-TFTP-SERVER")
@@ -577,8 +679,6 @@ def main():
     # Diags callback init for DHCP-TFTP server
     ops_diagdump.init_diag_dump_basic(ops_dhcp_tftp_diagnostics_handler)
 
-    seqno = idl.change_seqno    # Sequence number when we last processed the db
-
     exiting = False
     while not exiting:
 
@@ -587,14 +687,24 @@ def main():
         if exiting:
             break
 
-        # Check if dnsmasq process is exited to avoid zombie process
-        if dnsmasq_process is not None:
-            dnsmasq_process.poll()
+        dhcp_lease_service.run()
+
+        # Reap an exited or stopping dnsmasq to avoid zombie processes
+        # and log its error output
+        dnsmasq_supervisor.run()
 
         if seqno == idl.change_seqno:
             poller = ovs.poller.Poller()
             unixctl_server.wait(poller)
             idl.wait(poller)
+            dnsmasq_supervisor.wait(poller)
+            dhcp_lease_service.wait(poller)
+            if dhcp_leases_clear_process is not None:
+                poller.fd_wait(dhcp_leases_clear_process.stderr.fileno(),
+                               ovs.poller.POLLIN)
+            deadline = dhcp_tftp_config_deadline()
+            if deadline is not None:
+                poller.timer_wait_until(deadline)
             poller.block()
 
         idl.run()  # Better reload the tables
@@ -602,21 +712,29 @@ def main():
         vlog.dbg("dhcp_tftp_debug main - seqno change from %d to %d "
                  % (seqno, idl.change_seqno))
         if seqno != idl.change_seqno:
-            '''
-            OPS_TODO:
-              If seqno is changed, it is assumed that DHCP/TFTP server config
-              parameters have been changed by user and hence dnsmasq is
-              is restarted with new config.
-
-              This needs to be fixed - even if seqno gets changed, we need
-              to check if the DHCP/TFTP server configuration is really changed
-              or not and restart the dnsmasq daemon only if the config had
-              been changed.
-            '''
-            dnsmasq_restart()
             seqno = idl.change_seqno
 
+            if dnsmasq_started is False:
+                # Start dnsmasq as soon as OVSDB reports that the
+                # system is configured
+                dnsmasq_run()
+            else:
+                # A burst of transactions (e.g. a pasted config block)
+                # bumps the seqno once per transaction. Coalesce them so
+                # that dnsmasq is restarted or reloaded only once.
+                dhcp_tftp_config_changed()
+
+        # A seqno change only means that some monitored row changed,
+        # e.g. System or VRF columns unrelated to DHCP-TFTP. Restart
+        # dnsmasq only if the DHCP-TFTP server config really changed.
+        dhcp_tftp_config_coalesce()
+
+        dnsmasq_check_startup()
+        dhcp_leases_clear_check()
+
     # Daemon exit
+    dnsmasq_supervisor.close()
+    dhcp_lease_service.close()
     unixctl_server.close()
     idl.close()
 
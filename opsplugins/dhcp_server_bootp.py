@@ -15,22 +15,34 @@
 # under the License.
 
 from opsvalidator.base import BaseValidator
-from opsvalidator import error
-from opsvalidator.error import ValidationError
-from opsrest.utils.utils import get_column_data_from_row
 from opsrest.utils import *
+import dhcptftpbatchvalidations
 import dhcptftpservervalidations
 
+DHCP_SERVER_COLUMNS = ("bootp",)
+
+
+def dhcp_server_bootp_errors(dhcp_server_row, columns, idl):
+    '''
+    Returns the details of all the errors of the bootp column of a
+    DHCP_Server row.
+    '''
+    errors = []
+
+    bootp = columns["bootp"]
+    if bootp is not None:
+        tag_value = bootp.get("match tag", None)
+        if (tag_value is not None) and \
+           (not dhcptftpservervalidations.is_valid_tag(tag_value)):
+            errors.append("%s is invalid." % (tag_value))
+
+    return errors
+
 
 class DhcpTftpServerBootpValidator(BaseValidator):
     resource = "dhcp_server"
 
     def validate_modification(self, validation_args):
-        dhcp_server_row = validation_args.resource_row
-        if hasattr(dhcp_server_row, "bootp"):
-            bootp = get_column_data_from_row(dhcp_server_row, "bootp")
-            tag_value = bootp.get("match tag", None)
-            if (tag_value is not None) and \
-               (not dhcptftpservervalidations.is_valid_tag(tag_value)):
-                details = "%s is invalid." % (tag_value)
-                raise ValidationError(error.VERIFICATION_FAILED, details)
+        dhcptftpbatchvalidations.validate_row(validation_args,
+                                              DHCP_SERVER_COLUMNS,
+                                              dhcp_server_bootp_errors)
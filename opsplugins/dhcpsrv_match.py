@@ -15,40 +15,42 @@
 # under the License.
 
 from opsvalidator.base import BaseValidator
-from opsvalidator import error
-from opsvalidator.error import ValidationError
-from opsrest.utils.utils import get_column_data_from_row
+import dhcptftpbatchvalidations
 import dhcptftpservervalidations
 
+DHCPSRV_MATCH_COLUMNS = ("set_tag", "option_name", "option_number")
+
+
+def dhcpsrv_match_errors(DHCPSrv_Match_row, columns, idl):
+    '''
+    Returns the details of all the errors of a DHCPSrv_Match row.
+    '''
+    errors = []
+
+    set_tag = columns["set_tag"]
+    if not dhcptftpservervalidations.is_valid_tag(set_tag):
+        errors.append("%s is invalid." % (set_tag))
+
+    option_name = columns["option_name"]
+    if (option_name is not None):
+        for name in option_name:
+            if (not dhcptftpservervalidations.is_valid_tag(name)):
+                errors.append("%s is invalid." % (name))
+
+    option_number = columns["option_number"]
+    if (option_number is not None):
+        for number in option_number:
+            if (not dhcptftpservervalidations.is_valid_option_number(
+                    number)):
+                errors.append("%d is invalid." % (number))
+
+    return errors
+
 
 class DHCPSrvMatchValidator(BaseValidator):
     resource = "dhcpsrv_match"
 
     def validate_modification(self, validation_args):
-        option_name = None
-        option_number = None
-        DHCPSrv_Match_row = validation_args.resource_row
-        set_tag = get_column_data_from_row(DHCPSrv_Match_row,
-                                           "set_tag")
-        if not dhcptftpservervalidations.is_valid_tag(set_tag):
-            details = "%s is invalid." % (set_tag)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Match_row, "option_name"):
-            option_name = get_column_data_from_row(DHCPSrv_Match_row,
-                                                   "option_name")
-        if (option_name is not None):
-            for name in option_name:
-                if (not dhcptftpservervalidations.is_valid_tag(name)):
-                    details = "%s is invalid." % (name)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Match_row, "option_number"):
-            option_number = get_column_data_from_row(DHCPSrv_Match_row,
-                                                     "option_number")
-        if (option_number is not None):
-            for number in option_number:
-                if (not dhcptftpservervalidations.is_valid_option_number(
-                        number)):
-                    details = "%d is invalid." % (number)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
+        dhcptftpbatchvalidations.validate_row(validation_args,
+                                              DHCPSRV_MATCH_COLUMNS,
+                                              dhcpsrv_match_errors)
@@ -15,44 +15,43 @@
 # under the License.
 
 from opsvalidator.base import BaseValidator
-from opsvalidator import error
-from opsvalidator.error import ValidationError
-from opsrest.utils.utils import get_column_data_from_row
+import dhcptftpbatchvalidations
 import dhcptftpservervalidations
 
+DHCPSRV_OPTION_COLUMNS = ("option_name", "match_tags", "option_number")
+
+
+def dhcpsrv_option_errors(DHCPSrv_Option_row, columns, idl):
+    '''
+    Returns the details of all the errors of a DHCPSrv_Option row.
+    '''
+    errors = []
+
+    option_name = columns["option_name"]
+    if (option_name is not None):
+        for name in option_name:
+            if (not dhcptftpservervalidations.is_valid_tag(name)):
+                errors.append("%s is invalid." % (name))
+
+    match_tags = columns["match_tags"]
+    if (match_tags is not None) and \
+       (not dhcptftpservervalidations.is_valid_tags(match_tags)):
+        errors.append("%s is invalid." % (match_tags))
+
+    option_number = columns["option_number"]
+    if (option_number is not None):
+        for number in option_number:
+            if (not dhcptftpservervalidations.is_valid_option_number(
+                    number)):
+                errors.append("%s is invalid." % (number))
+
+    return errors
+
 
 class DHCPSrvOptionValidator(BaseValidator):
     resource = "dhcpsrv_option"
 
     def validate_modification(self, validation_args):
-        option_name = None
-        option_number = None
-        match_tags = None
-        DHCPSrv_Option_row = validation_args.resource_row
-
-        if hasattr(DHCPSrv_Option_row, "option_name"):
-            option_name = get_column_data_from_row(DHCPSrv_Option_row,
-                                                   "option_name")
-        if (option_name is not None):
-            for name in option_name:
-                if (not dhcptftpservervalidations.is_valid_tag(name)):
-                    details = "%s is invalid." % (name)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Option_row, "match_tags"):
-            match_tags = get_column_data_from_row(DHCPSrv_Option_row,
-                                                  "match_tags")
-        if (match_tags is not None) and \
-           (not dhcptftpservervalidations.is_valid_tags(match_tags)):
-            details = "%s is invalid." % (match_tags)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Option_row, "option_number"):
-            option_number = get_column_data_from_row(DHCPSrv_Option_row,
-                                                     "option_number")
-        if (option_number is not None):
-            for number in option_number:
-                if (not dhcptftpservervalidations.is_valid_option_number(
-                        number)):
-                    details = "%s is invalid." % (number)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
+        dhcptftpbatchvalidations.validate_row(validation_args,
+                                              DHCPSRV_OPTION_COLUMNS,
+                                              dhcpsrv_option_errors)
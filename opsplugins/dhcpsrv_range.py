@@ -15,161 +15,142 @@
 # under the License.
 
 from opsvalidator.base import BaseValidator
-from opsvalidator import error
-from opsvalidator.error import ValidationError
 from opsrest.utils.utils import get_column_data_from_row
+import dhcptftpbatchvalidations
 import dhcptftpservervalidations
+import dhcpsrvrangeindex
 import ipaddress
 
+DHCPSRV_RANGE_COLUMNS = ("name", "netmask", "start_ip_address",
+                         "end_ip_address", "lease_duration", "set_tag",
+                         "match_tags", "broadcast", "prefix_len")
+
+
+def dhcpsrv_range_errors(DHCPSrv_Range_row, columns, idl):
+    '''
+    Returns the details of all the errors of a DHCPSrv_Range row. The
+    overlap with the other ranges is only checked for a row without
+    other errors.
+    '''
+    errors = []
+    end_ip = None
+    net_mask = None
+    subnet_mask = None
+    broad_cast = None
+    prefixlen = None
+
+    name = columns["name"]
+    if not dhcptftpservervalidations.is_valid_tag(name):
+        errors.append("%s is invalid." % (name))
+
+    # The start and end addresses must not be the network or broadcast
+    # address of the subnet of the netmask
+    net_masks = [ipaddress.IPAddress(mask) for mask in
+                 columns["netmask"] or []]
+    netmask_valid = True
+    for mask in net_masks:
+        net_mask = mask
+        if (not mask.is_valid_netmask):
+            netmask_valid = False
+    if (net_mask is not None) and netmask_valid:
+        subnet_mask = net_mask
+
+    start_ip = ipaddress.IPAddress(columns["start_ip_address"])
+    if not start_ip.is_valid_host(subnet_mask):
+        errors.append("%s is invalid." % (start_ip))
+
+    end_ip_address = columns["end_ip_address"]
+    if (end_ip_address is not None):
+        for ip in end_ip_address:
+            end_ip = ipaddress.IPAddress(ip)
+            if (not end_ip.is_valid_host(subnet_mask)):
+                errors.append("%s is invalid." % (ip))
+
+    lease_duration = columns["lease_duration"]
+    if (lease_duration is not None):
+        for duration in lease_duration:
+            if (not dhcptftpservervalidations.is_valid_lease_duration
+               (duration)):
+                errors.append("Lease duration should be 0 for infinite or "
+                              "between 2-65535.")
+
+    if (start_ip.value is not None) and \
+       (end_ip is not None) and (end_ip.value is not None) and \
+       (start_ip.ip_type != end_ip.ip_type):
+        errors.append("Invalid IP address range")
+
+    set_tag = columns["set_tag"]
+    if (set_tag is not None):
+        for tag in set_tag:
+            if (not dhcptftpservervalidations.is_valid_tag(tag)):
+                errors.append("%s is invalid." % (tag))
+
+    match_tags = columns["match_tags"]
+    if (match_tags is not None) and \
+       (not dhcptftpservervalidations.is_valid_tags(match_tags)):
+        errors.append("%s is invalid." % (match_tags))
+
+    for mask in net_masks:
+        if (not mask.is_valid_netmask):
+            errors.append("%s is invalid." % (mask))
+
+    if start_ip.is_ipv4 and (end_ip is not None) and end_ip.is_ipv4 and \
+       (net_mask is not None) and netmask_valid and \
+       (start_ip.network(net_mask) != end_ip.network(net_mask)):
+        errors.append("Invalid IP address range.")
+
+    if start_ip.is_ipv6 and (net_mask is not None):
+        errors.append("Error : netmask configuration not allowed for IPv6")
+
+    broadcast = columns["broadcast"]
+    if broadcast is not None:
+        for b in broadcast:
+            broad_cast = ipaddress.IPAddress(b)
+
+    if start_ip.is_ipv4 and \
+       (net_mask is not None) and netmask_valid and \
+       (broad_cast is not None) and \
+       ((not broad_cast.is_ipv4) or
+        (start_ip.broadcast(net_mask) != broad_cast.value)):
+        errors.append("%s is invalid." % (broad_cast))
+
+    if (broad_cast is not None) and (net_mask is None):
+        errors.append("Error : netmask must be specified before broadcast "
+                      "address")
+
+    if (net_mask is not None) and \
+       (broad_cast is not None) and \
+       start_ip.is_ipv6:
+        errors.append("Error : broadcast address not allowed for IPv6")
+
+    prefix_len = columns["prefix_len"]
+    if prefix_len is not None:
+        for p in prefix_len:
+            prefixlen = p
+
+    if (end_ip is not None) and \
+       (prefixlen is not None) and \
+       (not start_ip.is_ipv6):
+        errors.append("Error: prefix length configuration not allowed for "
+                      "IPv4")
+
+    if not errors:
+        range_index = dhcpsrvrangeindex.dhcpsrv_range_index(idl)
+        overlap_row = range_index.find_overlap(
+            DHCPSrv_Range_row,
+            dhcpsrvrangeindex.address_interval(start_ip, end_ip or start_ip))
+        if overlap_row is not None:
+            errors.append("Range %s overlaps range %s."
+                          % (name, get_column_data_from_row(overlap_row,
+                                                            "name")))
+
+    return errors
+
 
 class DHCPSrvRangeValidator(BaseValidator):
     resource = "dhcpsrv_range"
 
     def validate_modification(self, validation_args):
-        lease_duration = None
-        start_ip_address = None
-        end_ip_address = None
-        name = None
-        set_tag = None
-        match_tags = None
-        netmask = None
-        broadcast = None
-        prefix_len = None
-        net_mask = None
-        end_ip = None
-        broad_cast = None
-        prefixlen = None
-
-        DHCPSrv_Range_row = validation_args.resource_row
-        name = get_column_data_from_row(DHCPSrv_Range_row,
-                                        "name")
-        if not dhcptftpservervalidations.is_valid_tag(name):
-            details = "%s is invalid." % (name)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        start_ip_address = get_column_data_from_row(DHCPSrv_Range_row,
-                                                    "start_ip_address")
-
-        if not ipaddress.is_valid_ip_address(start_ip_address):
-            details = "%s is invalid." % (start_ip_address)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "end_ip_address"):
-            end_ip_address = get_column_data_from_row(DHCPSrv_Range_row,
-                                                      "end_ip_address")
-
-        if (end_ip_address is not None):
-            for ip in end_ip_address:
-                end_ip = ip
-                if (not ipaddress.is_valid_ip_address(ip)):
-                    details = "%s is invalid." % (ip)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "lease_duration"):
-            lease_duration = get_column_data_from_row(DHCPSrv_Range_row,
-                                                      "lease_duration")
-
-        if (lease_duration is not None):
-            for duration in lease_duration:
-                if (not dhcptftpservervalidations.is_valid_lease_duration
-                   (duration)):
-                    details = "Lease duration should be 0 for infinite or " \
-                              "between 2-65535."
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if (start_ip_address is not None) and \
-           (end_ip is not None) and \
-           (ipaddress.ip_type(start_ip_address) != ipaddress.ip_type(end_ip)):
-            details = "Invalid IP address range"
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "set_tag"):
-            set_tag = get_column_data_from_row(DHCPSrv_Range_row,
-                                               "set_tag")
-
-        if (set_tag is not None):
-            for tag in set_tag:
-                if (not dhcptftpservervalidations.is_valid_tag(tag)):
-                    details = "%s is invalid." % (tag)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "match_tags"):
-            match_tags = get_column_data_from_row(DHCPSrv_Range_row,
-                                                  "match_tags")
-
-        if (match_tags is not None) and \
-           (not dhcptftpservervalidations.is_valid_tags(match_tags)):
-            details = "%s is invalid." % (match_tags)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "netmask"):
-            netmask = get_column_data_from_row(DHCPSrv_Range_row,
-                                               "netmask")
-
-        if (netmask is not None):
-            for mask in netmask:
-                net_mask = mask
-                if (not ipaddress.is_valid_netmask(mask)):
-                    details = "%s is invalid." % (mask)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if (start_ip_address is not None) and \
-           (end_ip is not None) and \
-           (net_mask is not None) and \
-           (ipaddress.ip_type(start_ip_address) == 0) and \
-           (not ipaddress.is_valid_net(start_ip_address, end_ip, net_mask)):
-            details = "Invalid IP address range."
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if (start_ip_address is not None) and \
-           (ipaddress.ip_type(start_ip_address) == 1) and \
-           (net_mask is not None):
-            details = "Error : netmask configuration not allowed for IPv6"
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "broadcast"):
-            broadcast = get_column_data_from_row(DHCPSrv_Range_row,
-                                                 "broadcast")
-
-        if broadcast is not None:
-            for b in broadcast:
-                broad_cast = b
-
-        if (start_ip_address is not None) and \
-           (ipaddress.ip_type(start_ip_address) == 0) and \
-           (net_mask is not None) and \
-           (broad_cast is not None) and \
-           (not ipaddress.is_valid_broadcast_addr(start_ip_address,
-                                                  net_mask,
-                                                  broad_cast)):
-            details = "%s is invalid." % (broad_cast)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if (start_ip_address is not None) and \
-           (broad_cast is not None) and \
-           (net_mask is None):
-            details = "Error : netmask must be specified before broadcast " \
-                      "address"
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if (start_ip_address is not None) and \
-           (net_mask is not None) and \
-           (broad_cast is not None) and \
-           (ipaddress.ip_type(start_ip_address) == 1):
-            details = "Error : broadcast address not allowed for IPv6"
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Range_row, "prefix_len"):
-            prefix_len = get_column_data_from_row(DHCPSrv_Range_row,
-                                                  "prefix_len")
-
-        if prefix_len is not None:
-            for p in prefix_len:
-                prefixlen = p
-
-        if (start_ip_address is not None) and \
-           (end_ip is not None) and \
-           (prefixlen is not None) and \
-           (ipaddress.ip_type(start_ip_address) != 1):
-            details = "Error: prefix length configuration not allowed for IPv4"
-            raise ValidationError(error.VERIFICATION_FAILED, details)
+        dhcptftpbatchvalidations.validate_row(validation_args,
+                                              DHCPSRV_RANGE_COLUMNS,
+                                              dhcpsrv_range_errors)
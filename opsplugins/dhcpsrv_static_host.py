@@ -15,83 +15,103 @@
 # under the License.
 
 from opsvalidator.base import BaseValidator
-from opsvalidator import error
-from opsvalidator.error import ValidationError
 from opsrest.utils.utils import get_column_data_from_row
+from dhcptftpservervalidations import get_column
+import dhcptftpbatchvalidations
 import dhcptftpservervalidations
+import dhcpsrvhostindex
+import dhcpsrvrangeindex
 import ipaddress
 
+DHCPSRV_STATIC_HOST_COLUMNS = ("ip_address", "mac_addresses", "set_tags",
+                               "client_hostname", "client_id",
+                               "lease_duration")
+
+
+def dhcpsrv_static_host_errors(DHCPSrv_Static_Host, columns, idl):
+    '''
+    Returns the details of all the errors of a DHCPSrv_Static_Host row.
+    The conflicts with the other static hosts and with the ranges are
+    only checked for a row without other errors.
+    '''
+    errors = []
+
+    ip_address = columns["ip_address"]
+    ip = ipaddress.IPAddress(ip_address)
+    if not ip.is_valid:
+        errors.append("%s is an invalid IP address." % (ip_address))
+
+    mac_addresses = columns["mac_addresses"]
+    if (mac_addresses is not None) and \
+       (not dhcptftpservervalidations.is_valid_mac_addresses(
+            mac_addresses)):
+        errors.append("Invalid MAC addresses.")
+
+    set_tags = columns["set_tags"]
+    if (set_tags is not None) and \
+       (not dhcptftpservervalidations.is_valid_tags(set_tags)):
+        errors.append("%s is invalid." % (set_tags))
+
+    client_hostname = columns["client_hostname"]
+    if (client_hostname is not None):
+        for hostname in client_hostname:
+            if (not dhcptftpservervalidations.is_valid_tag(hostname)):
+                errors.append("%s is invalid." % (hostname))
+
+    client_id = columns["client_id"]
+    if (client_id is not None):
+        for c_id in client_id:
+            if (not dhcptftpservervalidations.is_valid_tag(c_id)):
+                errors.append("%s is invalid." % (c_id))
+
+    if (mac_addresses is None) and (client_hostname is None) and \
+       (client_id is None):
+        errors.append("Any one of MAC address or hostname or client-id"
+                      " must be specified")
+
+    lease_duration = columns["lease_duration"]
+    if (lease_duration is not None):
+        for duration in lease_duration:
+            if (not dhcptftpservervalidations.is_valid_lease_duration(
+                    duration)):
+                errors.append("Lease duration should be 0 for infinite or"
+                              " between 2-65535.")
+
+    if errors:
+        return errors
+
+    host_index = dhcpsrvhostindex.dhcpsrv_static_host_index(idl)
+    conflict = host_index.find_conflict(
+        DHCPSrv_Static_Host, dhcpsrvhostindex.static_host_column_keys(columns))
+    if conflict is not None:
+        column, value, other_host = conflict
+        errors.append("%s %s is already configured for static host %s."
+                      % (dhcpsrvhostindex.static_host_column_name(column),
+                         value,
+                         get_column_data_from_row(other_host, "ip_address")))
+
+    range_index = dhcpsrvrangeindex.dhcpsrv_range_index(idl)
+    for range_row in range_index.find_ranges(ip.ip_type, ip.value,
+                                             ip.value):
+        is_static = get_column(range_row, "is_static")
+        if is_static and is_static[0] is True:
+            continue
+
+        missing_tags = set(get_column(range_row, "match_tags") or []) - \
+            set(set_tags or [])
+        if missing_tags:
+            errors.append("%s is in range %s which requires the tags %s."
+                          % (ip_address,
+                             get_column_data_from_row(range_row, "name"),
+                             ", ".join(sorted(missing_tags))))
+
+    return errors
+
 
 class DHCPSrvStaticHostValidator(BaseValidator):
     resource = "dhcpsrv_static_host"
 
     def validate_modification(self, validation_args):
-        mac_addresses = None
-        set_tags = None
-        client_id = None
-        client_hostname = None
-        lease_duration = None
-
-        DHCPSrv_Static_Host = validation_args.resource_row
-        ip_address = get_column_data_from_row(DHCPSrv_Static_Host,
-                                              "ip_address")
-
-        if not ipaddress.is_valid_ip_address(ip_address):
-            details = "%s is an invalid IP address." % (ip_address)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Static_Host, "mac_addresses"):
-            mac_addresses = get_column_data_from_row(DHCPSrv_Static_Host,
-                                                     "mac_addresses")
-        if (mac_addresses is not None) and \
-           (not dhcptftpservervalidations.is_valid_mac_addresses(
-                mac_addresses)):
-            details = "Invalid MAC addresses."
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Static_Host, "set_tags"):
-            set_tags = get_column_data_from_row(DHCPSrv_Static_Host,
-                                                "set_tags")
-
-        if (set_tags is not None) and \
-           (not dhcptftpservervalidations.is_valid_tags(set_tags)):
-            details = "%s is invalid." % (set_tags)
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Static_Host, "client_hostname"):
-            client_hostname = get_column_data_from_row(DHCPSrv_Static_Host,
-                                                       "client_hostname")
-
-        if (client_hostname is not None):
-            for hostname in client_hostname:
-                if (not dhcptftpservervalidations.is_valid_tag(hostname)):
-                    details = "%s is invalid." % (hostname)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Static_Host, "client_id"):
-            client_id = get_column_data_from_row(DHCPSrv_Static_Host,
-                                                 "client_id")
-
-        if (client_id is not None):
-            for c_id in client_id:
-                if (not dhcptftpservervalidations.is_valid_tag(c_id)):
-                    details = "%s is invalid." % (c_id)
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if (mac_addresses is None) and (client_hostname is None) and \
-           (client_id is None):
-            details = "Any one of MAC address or hostname or client-id" \
-                      " must be specified"
-            raise ValidationError(error.VERIFICATION_FAILED, details)
-
-        if hasattr(DHCPSrv_Static_Host, "lease_duration"):
-            lease_duration = get_column_data_from_row(DHCPSrv_Static_Host,
-                                                      "lease_duration")
-
-        if (lease_duration is not None):
-            for duration in lease_duration:
-                if (not dhcptftpservervalidations.is_valid_lease_duration(
-                        duration)):
-                    details = "Lease duration should be 0 for infinite or" \
-                              " between 2-65535."
-                    raise ValidationError(error.VERIFICATION_FAILED, details)
+        dhcptftpbatchvalidations.validate_row(validation_args,
+                                              DHCPSRV_STATIC_HOST_COLUMNS,
+                                              dhcpsrv_static_host_errors)
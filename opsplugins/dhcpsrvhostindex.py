@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Uniqueness index of the DHCPSrv_Static_Host rows on the IP address,
+   each MAC address, the client-id and the hostname, so that a static
+   host is checked against the configured hosts with dict lookups.
+ - When the change seqno of the IDL changes, only the rows inserted,
+   modified or deleted since the last change are re-indexed. The index
+   is rebuilt when the IDL resyncs the table.
+ - The rows validated before they are committed are added to it, so
+   the rows of a bulk load are checked against each other as well.
+   They are re-indexed with their committed values, or dropped, at the
+   next change of the IDL.
+ - The rows reported by the index are checked against their current
+   values, stale entries are dropped.
+'''
+
+from opsrest.utils.utils import get_column_data_from_row
+import dhcpsrvrowchanges
+
+DHCPSRV_STATIC_HOST_TABLE = "DHCPSrv_Static_Host"
+
+# Columns whose values must not be shared by two static hosts, and
+# their names in the error messages
+STATIC_HOST_UNIQUE_COLUMNS = (("ip_address", "IP address"),
+                              ("mac_addresses", "MAC address"),
+                              ("client_id", "Client-id"),
+                              ("client_hostname", "Hostname"))
+
+_host_index = None
+
+
+def static_host_column_keys(columns):
+    '''
+    Returns the (column, value) keys of the dict of the column data of
+    a DHCPSrv_Static_Host row. MAC addresses are compared in lower case.
+    '''
+    keys = []
+    for column, column_name in STATIC_HOST_UNIQUE_COLUMNS:
+        values = columns.get(column)
+        if values is None:
+            continue
+
+        if not isinstance(values, list):
+            values = [values]
+
+        for value in values:
+            if column == "mac_addresses":
+                value = value.lower()
+            keys.append((column, value))
+
+    return keys
+
+
+def static_host_keys(row):
+    '''
+    Returns the (column, value) keys of a DHCPSrv_Static_Host row.
+    '''
+    return static_host_column_keys(
+        dict((column, get_column_data_from_row(row, column))
+             for column, column_name in STATIC_HOST_UNIQUE_COLUMNS
+             if hasattr(row, column)))
+
+
+def static_host_column_name(column):
+    return dict(STATIC_HOST_UNIQUE_COLUMNS)[column]
+
+
+class DHCPSrvStaticHostIndex(object):
+    def __init__(self, idl):
+        self.idl = idl
+        self.change_seqno = idl.change_seqno
+        self.changed_rows = dhcpsrvrowchanges.dhcpsrv_row_changes(
+            idl).track(DHCPSRV_STATIC_HOST_TABLE)
+        self.pending_rows = set()
+        self.__rebuild()
+
+    def __rows(self):
+        return self.idl.tables[DHCPSRV_STATIC_HOST_TABLE].rows
+
+    def __rebuild(self):
+        self.rows = self.__rows()
+        self.row_keys = {}
+        self.index = {}
+        self.changed_rows.clear()
+        self.pending_rows.clear()
+
+        for row_uuid, row in self.rows.iteritems():
+            self.__add_row(row_uuid, static_host_keys(row))
+
+    def __update_row(self, row_uuid):
+        self.__remove_row(row_uuid)
+        row = self.rows.get(row_uuid)
+        if row is not None:
+            self.__add_row(row_uuid, static_host_keys(row))
+
+    def update(self):
+        '''
+        Re-indexes the rows changed and the rows validated since the
+        last change of the IDL, or rebuilds the index if the table was
+        resynced.
+        '''
+        if self.change_seqno == self.idl.change_seqno:
+            return
+        self.change_seqno = self.idl.change_seqno
+
+        if self.__rows() is not self.rows:
+            self.__rebuild()
+            return
+
+        row_uuids = self.changed_rows | self.pending_rows
+        self.changed_rows.clear()
+        self.pending_rows.clear()
+        for row_uuid in row_uuids:
+            self.__update_row(row_uuid)
+
+    def __add_row(self, row_uuid, keys):
+        self.row_keys[row_uuid] = keys
+        for key in keys:
+            self.index.setdefault(key, set()).add(row_uuid)
+
+    def __remove_row(self, row_uuid):
+        for key in self.row_keys.pop(row_uuid, ()):
+            row_uuids = self.index[key]
+            row_uuids.discard(row_uuid)
+            if not row_uuids:
+                del self.index[key]
+
+    def find_row(self, key, row_uuid=None):
+        '''
+        Returns the row, other than row_uuid, which has the (column,
+        value) key, or None.
+        '''
+        for other_uuid in list(self.index.get(key, ())):
+            if other_uuid == row_uuid:
+                continue
+
+            row = self.rows.get(other_uuid)
+            if row is not None and key in static_host_keys(row):
+                return row
+
+            # Stale entry of a row changed or removed since it was
+            # indexed
+            self.__update_row(other_uuid)
+
+        return None
+
+    def find_conflict(self, row, keys=None):
+        '''
+        Returns the (column, value, row) of a static host which shares
+        a key with the row, or None. The row is then indexed with these
+        keys until the next change of the IDL. The keys of the row are
+        computed if not given.
+        '''
+        if keys is None:
+            keys = static_host_keys(row)
+        for key in keys:
+            other_row = self.find_row(key, row.uuid)
+            if other_row is not None:
+                return key[0], key[1], other_row
+
+        self.__remove_row(row.uuid)
+        self.__add_row(row.uuid, keys)
+        self.pending_rows.add(row.uuid)
+        return None
+
+
+def dhcpsrv_static_host_index(idl):
+    '''
+    Returns the static host index of the IDL, updated with the rows
+    changed since it was last used.
+    '''
+    global _host_index
+    if _host_index is None or _host_index.idl is not idl:
+        _host_index = DHCPSrvStaticHostIndex(idl)
+    else:
+        _host_index.update()
+    return _host_index
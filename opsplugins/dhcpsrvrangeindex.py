@@ -0,0 +1,247 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Interval index over the DHCPSrv_Range rows, used to find overlapping
+   ranges and the range of a static host IP without comparing every
+   pair of rows.
+ - The ranges which don't overlap each other, as enforced by the
+   validation, are kept in a list sorted by start address, so their
+   ends are sorted as well and the ranges overlapping an interval are
+   found with a single bisect. Ranges overlapping an indexed range,
+   which may only be configured by bypassing the validation, are kept
+   aside and compared with every lookup.
+ - When the change seqno of the IDL changes, only the rows inserted,
+   modified or deleted since the last change are re-indexed, with a
+   bisect insort or delete. The index is rebuilt when the IDL resyncs
+   the table.
+ - The rows validated before they are committed are added to it, so
+   the rows of a bulk load are checked against each other as well.
+   They are re-indexed with their committed values, or dropped, at the
+   next change of the IDL.
+ - The rows reported by the index are checked against their current
+   values, stale entries are re-indexed.
+'''
+
+import bisect
+
+from opsrest.utils.utils import get_column_data_from_row
+import dhcpsrvrowchanges
+import ipaddress
+
+DHCPSRV_RANGE_TABLE = "DHCPSrv_Range"
+
+IPV4 = ipaddress.IP_TYPE_IPV4
+IPV6 = ipaddress.IP_TYPE_IPV6
+
+_range_index = None
+
+
+def address_interval(start_ip, end_ip):
+    '''
+    Returns the (ip type, start, end) interval between two IPAddress,
+    or None if they are not valid addresses of the same type.
+    '''
+    if start_ip.value is None or end_ip.value is None or \
+       start_ip.ip_type != end_ip.ip_type:
+        return None
+
+    return (start_ip.ip_type, min(start_ip.value, end_ip.value),
+            max(start_ip.value, end_ip.value))
+
+
+def range_interval(row):
+    '''
+    Returns the (ip type, start, end) interval of a DHCPSrv_Range row,
+    or None if its addresses are not valid.
+    '''
+    start_ip = ipaddress.IPAddress(get_column_data_from_row(
+        row, "start_ip_address"))
+
+    end_ip = start_ip
+    if hasattr(row, "end_ip_address"):
+        end_ip_address = get_column_data_from_row(row, "end_ip_address")
+        if end_ip_address:
+            end_ip = ipaddress.IPAddress(end_ip_address[0])
+
+    return address_interval(start_ip, end_ip)
+
+
+def _overlaps(interval, family, start, end):
+    return interval is not None and interval[0] == family and \
+        interval[1] <= end and interval[2] >= start
+
+
+class DHCPSrvRangeIndex(object):
+    def __init__(self, idl):
+        self.idl = idl
+        self.change_seqno = idl.change_seqno
+        self.changed_rows = dhcpsrvrowchanges.dhcpsrv_row_changes(
+            idl).track(DHCPSRV_RANGE_TABLE)
+        self.pending_rows = set()
+        self.__rebuild()
+
+    def __rows(self):
+        return self.idl.tables[DHCPSRV_RANGE_TABLE].rows
+
+    def __rebuild(self):
+        self.rows = self.__rows()
+        self.intervals = {}
+        self.entries = {IPV4: [], IPV6: []}
+        self.overlapping = {}
+        self.changed_rows.clear()
+        self.pending_rows.clear()
+
+        entries = []
+        for row_uuid, row in self.rows.iteritems():
+            interval = range_interval(row)
+            if interval is not None:
+                self.intervals[row_uuid] = interval
+                entries.append(interval + (row_uuid,))
+
+        entries.sort()
+        last_ends = {IPV4: -1, IPV6: -1}
+        for family, start, end, row_uuid in entries:
+            if start > last_ends[family]:
+                self.entries[family].append((start, end, row_uuid))
+                last_ends[family] = end
+            else:
+                self.overlapping[row_uuid] = (family, start, end)
+
+    def __find(self, family, start, end):
+        '''
+        Returns the UUIDs of the indexed rows whose range overlaps
+        start-end.
+        '''
+        entries = self.entries[family]
+        row_uuids = []
+        i = bisect.bisect_right(entries, (end, float('inf')))
+        while i > 0 and entries[i - 1][1] >= start:
+            i -= 1
+            row_uuids.append(entries[i][2])
+
+        for row_uuid, interval in self.overlapping.iteritems():
+            if _overlaps(interval, family, start, end):
+                row_uuids.append(row_uuid)
+
+        return row_uuids
+
+    def __add_row(self, row_uuid, interval):
+        self.intervals[row_uuid] = interval
+        family, start, end = interval
+        if self.__find(family, start, end):
+            self.overlapping[row_uuid] = interval
+        else:
+            bisect.insort(self.entries[family], (start, end, row_uuid))
+
+    def __remove_row(self, row_uuid):
+        interval = self.intervals.pop(row_uuid, None)
+        if interval is None or \
+           self.overlapping.pop(row_uuid, None) is not None:
+            return
+
+        family, start, end = interval
+        entries = self.entries[family]
+        del entries[bisect.bisect_left(entries, (start, end, row_uuid))]
+
+    def __update_row(self, row_uuid):
+        self.__remove_row(row_uuid)
+        row = self.rows.get(row_uuid)
+        if row is None:
+            return None
+
+        interval = range_interval(row)
+        if interval is not None:
+            self.__add_row(row_uuid, interval)
+        return interval
+
+    def update(self):
+        '''
+        Re-indexes the rows changed and the rows validated since the
+        last change of the IDL, or rebuilds the index if the table was
+        resynced.
+        '''
+        if self.change_seqno == self.idl.change_seqno:
+            return
+        self.change_seqno = self.idl.change_seqno
+
+        if self.__rows() is not self.rows:
+            self.__rebuild()
+            return
+
+        row_uuids = self.changed_rows | self.pending_rows
+        self.changed_rows.clear()
+        self.pending_rows.clear()
+        for row_uuid in row_uuids:
+            self.__update_row(row_uuid)
+
+    def find_ranges(self, family, start, end, row_uuid=None):
+        '''
+        Returns the rows, other than row_uuid, whose range overlaps
+        start-end.
+        '''
+        matches = []
+        for other_uuid in self.__find(family, start, end):
+            if other_uuid == row_uuid:
+                continue
+
+            row = self.rows.get(other_uuid)
+            if row is not None and \
+               range_interval(row) == self.intervals[other_uuid]:
+                matches.append(row)
+                continue
+
+            # Stale entry of a row changed or removed since it was
+            # indexed
+            if _overlaps(self.__update_row(other_uuid), family, start, end):
+                matches.append(row)
+
+        return matches
+
+    def find_overlap(self, row, interval=None):
+        '''
+        Returns a row whose range overlaps the range of the row, or None.
+        The row is then indexed with this range until the next change of
+        the IDL. The interval of the row is computed if not given.
+        '''
+        if interval is None:
+            interval = range_interval(row)
+        if interval is None:
+            return None
+
+        family, start, end = interval
+        matches = self.find_ranges(family, start, end, row.uuid)
+        if matches:
+            return matches[0]
+
+        self.__remove_row(row.uuid)
+        self.__add_row(row.uuid, interval)
+        self.pending_rows.add(row.uuid)
+        return None
+
+
+def dhcpsrv_range_index(idl):
+    '''
+    Returns the range index of the IDL, updated with the rows changed
+    since it was last used.
+    '''
+    global _range_index
+    if _range_index is None or _range_index.idl is not idl:
+        _range_index = DHCPSrvRangeIndex(idl)
+    else:
+        _range_index.update()
+    return _range_index
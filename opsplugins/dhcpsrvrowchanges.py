@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Tracks the rows of the DHCP server tables inserted, modified and
+   deleted in the IDL of the REST daemon, so that the range and static
+   host indexes are updated from the changed rows instead of being
+   rebuilt at every change of the IDL.
+ - The IDL is created by the REST daemon, so its notify() is wrapped
+   to record the UUID of every changed row of the tracked tables
+   before calling the original notify().
+ - The IDL replaces the rows dict of a table when it reconnects to
+   OVSDB, the indexes are rebuilt when the rows dict of their table
+   is replaced.
+'''
+
+_row_changes = None
+
+
+class DHCPSrvRowChanges(object):
+    def __init__(self, idl):
+        self.idl = idl
+        self.changed_rows = {}
+        self.idl_notify = idl.notify
+        idl.notify = self.__notify
+
+    def __notify(self, event, row, updates=None):
+        changed_rows = self.changed_rows.get(row._table.name)
+        if changed_rows is not None:
+            changed_rows.add(row.uuid)
+        self.idl_notify(event, row, updates)
+
+    def track(self, table_name):
+        '''
+        Returns the set of the UUIDs of the rows of the table changed
+        since it was last cleared by the caller.
+        '''
+        return self.changed_rows.setdefault(table_name, set())
+
+
+def dhcpsrv_row_changes(idl):
+    '''
+    Returns the row change tracker of the IDL.
+    '''
+    global _row_changes
+    if _row_changes is None or _row_changes.idl is not idl:
+        _row_changes = DHCPSrvRowChanges(idl)
+    return _row_changes
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Batch validation of the DHCP-TFTP server rows of a transaction.
+   The rows are validated in one pass and the errors of all the rows
+   are returned together instead of raising on the first one.
+ - Every DHCP-TFTP server validator checks its rows through
+   row_errors(), which reads the columns of a row once and passes
+   them to the row validator of the resource. validate_modification()
+   raises the first of these errors.
+ - The overlaps between ranges and the duplicate static hosts are found
+   through the range and static host indexes, which also index the rows
+   validated earlier in the batch.
+ - The validator modules import this module, so their functions are
+   only looked up once they are all loaded.
+'''
+
+from opsvalidator import error
+from opsvalidator.error import ValidationError
+from dhcptftpservervalidations import get_column
+import dhcp_server_bootp
+import dhcpsrv_match
+import dhcpsrv_option
+import dhcpsrv_range
+import dhcpsrv_static_host
+
+
+def row_columns(row, columns):
+    '''
+    Returns a dict of the data of the columns of the row, None for the
+    columns the row doesn't have.
+    '''
+    return dict((column, get_column(row, column)) for column in columns)
+
+
+def row_errors(row, idl, columns, errors):
+    '''
+    Returns the details of all the errors of a row, as returned by
+    errors(row, columns, idl) for the data of the given columns.
+    '''
+    return errors(row, row_columns(row, columns), idl)
+
+
+def validate_row(validation_args, columns, errors):
+    '''
+    Raises a ValidationError with the first error of the row being
+    modified.
+    '''
+    details = row_errors(validation_args.resource_row, validation_args.idl,
+                         columns, errors)
+    if details:
+        raise ValidationError(error.VERIFICATION_FAILED, details[0])
+
+
+def batch_validators():
+    '''
+    Returns the resource, the validated columns and the row validator
+    of each resource, in validation order. The ranges are validated
+    before the static hosts, which are checked against them.
+    '''
+    return (
+        ("dhcp_server", dhcp_server_bootp.DHCP_SERVER_COLUMNS,
+         dhcp_server_bootp.dhcp_server_bootp_errors),
+        ("dhcpsrv_range", dhcpsrv_range.DHCPSRV_RANGE_COLUMNS,
+         dhcpsrv_range.dhcpsrv_range_errors),
+        ("dhcpsrv_static_host",
+         dhcpsrv_static_host.DHCPSRV_STATIC_HOST_COLUMNS,
+         dhcpsrv_static_host.dhcpsrv_static_host_errors),
+        ("dhcpsrv_option", dhcpsrv_option.DHCPSRV_OPTION_COLUMNS,
+         dhcpsrv_option.dhcpsrv_option_errors),
+        ("dhcpsrv_match", dhcpsrv_match.DHCPSRV_MATCH_COLUMNS,
+         dhcpsrv_match.dhcpsrv_match_errors),
+    )
+
+
+def validate_rows(idl, resource_rows):
+    '''
+    Validates the (resource, row) pairs and returns the (resource, row,
+    details) of all the errors. Rows of other resources are ignored.
+    '''
+    rows = {}
+    for resource, row in resource_rows:
+        rows.setdefault(resource, []).append(row)
+
+    errors = []
+    for resource, columns, resource_errors in batch_validators():
+        for row in rows.get(resource, ()):
+            for details in row_errors(row, idl, columns, resource_errors):
+                errors.append((resource, row, details))
+
+    return errors
@@ -14,11 +14,22 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+from opsrest.utils.utils import get_column_data_from_row
 import macaddress
 
 MAX_DHCP_CONFIG_NAME_LENGTH = 15
 
 
+def get_column(row, column):
+    '''
+    Returns the data of a column of the row, or None if the row has no
+    such column.
+    '''
+    if not hasattr(row, column):
+        return None
+    return get_column_data_from_row(row, column)
+
+
 def is_valid_tags(match_tags):
     for tag in match_tags:
         if len(tag) > MAX_DHCP_CONFIG_NAME_LENGTH:
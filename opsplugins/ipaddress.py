@@ -18,7 +18,12 @@ import socket
 import struct
 
 
-def is_valid_ip_address(ip):
+def is_valid_ip_address(ip, netmask=None):
+    '''
+    An IPv4 address is also rejected if it is the network or broadcast
+    address of the subnet of the netmask, or without a netmask if it
+    ends in .0 or .255.
+    '''
     is_ipv4 = True
     try:
         socket.inet_pton(socket.AF_INET, ip)
@@ -29,7 +34,10 @@ def is_valid_ip_address(ip):
         except:
             return False
 
-    if is_ipv4 and not is_valid_ipv4(ip2int(ip)):
+    if is_ipv4 and netmask is not None:
+        netmask = ip2int(netmask)
+
+    if is_ipv4 and not is_valid_ipv4(ip2int(ip), netmask):
         return False
 
     if not is_ipv4 and not is_ipv6_global_unicast(ipv6_to_int(ip)):
@@ -62,11 +70,21 @@ def ipv6_to_int(ip):
     return (tup1 << 64) | tup2
 
 
-def is_valid_ipv4(ip):
-    return not (is_broadcast_ipv4(ip) or is_loopback_ipv4(ip) or
-                is_multicast_ipv4(ip) or is_experimental_ipv4(ip) or
-                is_invalid_ipv4(ip) or is_subnet_broadcast(ip) or
-                is_network_address(ip))
+def is_valid_ipv4(ip, netmask=None):
+    if (is_broadcast_ipv4(ip) or is_loopback_ipv4(ip) or
+            is_multicast_ipv4(ip) or is_experimental_ipv4(ip) or
+            is_invalid_ipv4(ip)):
+        return False
+
+    # Without a netmask, the subnet of the address is only known to
+    # dnsmasq and addresses ending in .0 or .255 are rejected
+    if netmask is None:
+        netmask = CLASSFUL_NETMASK
+
+    if is_subnet_broadcast(ip, netmask) or is_network_address(ip, netmask):
+        return False
+
+    return True
 
 
 def is_broadcast_ipv4(ip):
@@ -89,12 +107,31 @@ def is_invalid_ipv4(ip):
     return (ip == 0)
 
 
-def is_subnet_broadcast(ip):
-    return ((ip & 0x000000ff) == 0xff)
+# Netmask of the /24 subnet an address without a netmask is checked
+# against
+CLASSFUL_NETMASK = 0xffffff00
+
 
+def _host_mask(netmask):
+    return ~netmask & 0xffffffff
 
-def is_network_address(ip):
-    return ((ip & 0x000000ff) == 0x0)
+
+def is_subnet_broadcast(ip, netmask):
+    '''
+    Returns True if ip is the broadcast address of its subnet. /31 and
+    /32 subnets have no broadcast address (RFC 3021).
+    '''
+    host_mask = _host_mask(netmask)
+    return host_mask > 1 and ((ip & host_mask) == host_mask)
+
+
+def is_network_address(ip, netmask):
+    '''
+    Returns True if ip is the network address of its subnet. /31 and
+    /32 subnets have no network address (RFC 3021).
+    '''
+    host_mask = _host_mask(netmask)
+    return host_mask > 1 and ((ip & host_mask) == 0)
 
 
 def is_ipv6_global_unicast(ip):
@@ -164,3 +201,130 @@ def is_valid_broadcast_addr(start_ip, netmask, broadcast_ip):
     if (broadcast_ip == expected_broadcast):
         return True
     return False
+
+
+IP_TYPE_NONE = -2
+IP_TYPE_INVALID = -1
+IP_TYPE_IPV4 = 0
+IP_TYPE_IPV6 = 1
+
+
+class _cached_property(object):
+    '''
+    Property computed on the first access and then stored in the
+    instance.
+    '''
+    def __init__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+
+    def __get__(self, obj, cls):
+        if obj is None:
+            return self
+        value = obj.__dict__[self.func.__name__] = self.func(obj)
+        return value
+
+
+class IPAddress(object):
+    '''
+    IP address parsed once from its text form. ip_type has the values
+    of ip_type() and value is the address as an integer, or None if the
+    address is not valid. The classifications are computed on first
+    use.
+    '''
+    def __init__(self, ip):
+        self.ip = ip
+        self.value = None
+        if ip is None:
+            self.ip_type = IP_TYPE_NONE
+            return
+
+        try:
+            self.value = struct.unpack(
+                "!I", socket.inet_pton(socket.AF_INET, ip))[0]
+            self.ip_type = IP_TYPE_IPV4
+        except socket.error:
+            try:
+                high, low = struct.unpack(
+                    "!QQ", socket.inet_pton(socket.AF_INET6, ip))
+                self.value = (high << 64) | low
+                self.ip_type = IP_TYPE_IPV6
+            except:
+                self.ip_type = IP_TYPE_INVALID
+
+    def __str__(self):
+        return str(self.ip)
+
+    @property
+    def is_ipv4(self):
+        return self.ip_type == IP_TYPE_IPV4
+
+    @property
+    def is_ipv6(self):
+        return self.ip_type == IP_TYPE_IPV6
+
+    @_cached_property
+    def is_loopback(self):
+        if self.is_ipv4:
+            return is_loopback_ipv4(self.value)
+        return self.is_ipv6 and in6_is_addr_loopback(self.value)
+
+    @_cached_property
+    def is_multicast(self):
+        if self.is_ipv4:
+            return is_multicast_ipv4(self.value)
+        return self.is_ipv6 and in6_is_addr_multicast(self.value)
+
+    @_cached_property
+    def is_global_unicast(self):
+        return self.is_ipv6 and is_ipv6_global_unicast(self.value)
+
+    @_cached_property
+    def is_valid(self):
+        '''
+        Same as is_valid_ip_address() without a netmask, an IPv4 address
+        ending in .0 or .255 is not valid.
+        '''
+        if self.is_ipv4:
+            return is_valid_ipv4(self.value)
+        return self.is_global_unicast
+
+    def is_subnet_broadcast(self, netmask):
+        return self.is_ipv4 and is_subnet_broadcast(self.value, netmask.value)
+
+    def is_network_address(self, netmask):
+        return self.is_ipv4 and is_network_address(self.value, netmask.value)
+
+    def is_valid_host(self, netmask=None):
+        '''
+        Same as is_valid_ip_address(). An IPv4 address is checked against
+        the subnet of the netmask, so with a netmask shorter than /24 it
+        may end in .0 or .255.
+        '''
+        if netmask is None or not self.is_ipv4:
+            return self.is_valid
+        return is_valid_ipv4(self.value, netmask.value)
+
+    @_cached_property
+    def is_valid_netmask(self):
+        '''
+        Same as is_valid_netmask() for an IPv4 address.
+        '''
+        if not self.is_ipv4:
+            return False
+        host_bits = (~self.value + 1) & 0xffffffff
+        return (host_bits & (host_bits - 1)) == 0
+
+    def network(self, netmask):
+        '''
+        Returns the network of an IPv4 address and netmask, as an
+        integer.
+        '''
+        return self.value & netmask.value
+
+    def broadcast(self, netmask):
+        '''
+        Returns the broadcast address of an IPv4 address and netmask,
+        as an integer.
+        '''
+        return (self.value | ~netmask.value) & 0xffffffff
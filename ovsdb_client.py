@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# (C) Copyright 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License..
+
+'''
+NOTES:
+ - Minimal OVSDB JSON-RPC client (RFC 7047). It sends transactions
+   straight to the ovsdb-server socket and parses the reply, which is
+   much cheaper than running ovsdb-client or syncing a python IDL when
+   only a few rows have to be written.
+ - Replies are split into messages by tracking the nesting depth of the
+   JSON brackets and braces outside strings. Every received byte is
+   scanned once and each complete message is decoded once by the json
+   module, so large replies are parsed in linear time.
+'''
+
+import json
+import re
+import socket
+from collections import deque
+
+# OPS_TODO: Need to pull this from the build env
+def_db = 'unix:/var/run/openvswitch/db.sock'
+
+# Characters which delimit the JSON messages
+JSON_DELIMITERS_RE = re.compile(r'[][{}"\\]')
+
+
+class OVSDBClientError(Exception):
+    pass
+
+
+class OVSDBClient(object):
+    def __init__(self, remote=def_db, timeout=5.0):
+        '''
+        remote is an OVSDB remote in unix:PATH or tcp:IP:PORT form.
+        The connection is opened on the first transaction and kept open
+        until close() is called.
+        '''
+        self.remote = remote
+        self.timeout = timeout
+        self.sock = None
+        self.next_id = 0
+        self.__reset_parser()
+
+    def __reset_parser(self):
+        self.msgs = deque()
+        self.chunks = []
+        self.depth = 0
+        self.in_string = False
+        self.skip = 0
+
+    def connect(self):
+        if self.remote.startswith('unix:'):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            address = self.remote[len('unix:'):]
+        elif self.remote.startswith('tcp:'):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            host, port = self.remote[len('tcp:'):].rsplit(':', 1)
+            address = (host, int(port))
+        else:
+            raise OVSDBClientError("unsupported remote %s" % (self.remote))
+
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(address)
+        except socket.error as e:
+            sock.close()
+            raise OVSDBClientError("connection to %s failed: %s"
+                                   % (self.remote, e))
+
+        self.sock = sock
+        self.__reset_parser()
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def __send(self, msg):
+        self.sock.sendall(json.dumps(msg))
+
+    def __parse(self, data):
+        '''
+        Scans received data for the end of the current message and
+        decodes the messages it completes. The scan state is kept across
+        calls, so a message can span any number of recv() calls.
+        '''
+        start = 0
+        for match in JSON_DELIMITERS_RE.finditer(data):
+            pos = match.start()
+            if pos < self.skip:
+                # Escaped character of a string
+                continue
+
+            char = match.group()
+            if self.in_string:
+                if char == '\\':
+                    self.skip = pos + 2
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '[{':
+                self.depth += 1
+            elif char in ']}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self.chunks.append(data[start:pos + 1])
+                    self.msgs.append(json.loads("".join(self.chunks)))
+                    self.chunks = []
+                    start = pos + 1
+
+        if start < len(data):
+            self.chunks.append(data[start:])
+        self.skip = max(self.skip - len(data), 0)
+
+    def __recv(self):
+        '''
+        Returns the next JSON-RPC message received from the server.
+        '''
+        while not self.msgs:
+            data = self.sock.recv(65536)
+            if not data:
+                self.close()
+                raise OVSDBClientError("connection to %s closed"
+                                       % (self.remote))
+            try:
+                self.__parse(data)
+            except ValueError as e:
+                self.close()
+                raise OVSDBClientError("invalid message from %s: %s"
+                                       % (self.remote, e))
+
+        return self.msgs.popleft()
+
+    def request(self, method, params):
+        '''
+        Sends a JSON-RPC request and returns its result.
+        '''
+        if self.sock is None:
+            self.connect()
+
+        self.next_id += 1
+        request_id = self.next_id
+
+        try:
+            self.__send({"method": method, "params": params,
+                         "id": request_id})
+
+            while True:
+                msg = self.__recv()
+                if msg.get("method") == "echo":
+                    self.__send({"result": msg.get("params"), "error": None,
+                                 "id": msg.get("id")})
+                elif msg.get("id") == request_id:
+                    break
+        except socket.error as e:
+            self.close()
+            raise OVSDBClientError("request to %s failed: %s"
+                                   % (self.remote, e))
+
+        if msg.get("error") is not None:
+            raise OVSDBClientError("%s" % (msg["error"]))
+
+        return msg.get("result")
+
+    def transact(self, db, ops):
+        '''
+        Executes the operations in a single transaction and returns the
+        list of operation results. Raises OVSDBClientError if the
+        transaction failed.
+        '''
+        results = self.request("transact", [db] + list(ops))
+
+        for result in results:
+            if result is not None and "error" in result:
+                raise OVSDBClientError("%s: %s"
+                                       % (result["error"],
+                                          result.get("details", "")))
+
+        return results
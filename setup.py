@@ -18,7 +18,14 @@ from setuptools import setup
 setup(
     name='ops_dhcp_tftp',
     version='1.0',
-    py_modules=['ops_dhcp_tftp', 'dhcp_leases', 'dhcp_lease_db'],
+    py_modules=['ops_dhcp_tftp', 'dhcp_leases', 'dhcp_lease_db',
+                'dhcp_tftp_config', 'dnsmasq_supervisor',
+                'dhcp_lease_service', 'dhcp_lease_reaper',
+                'dhcp_lease_snapshot', 'dhcp_leases_client',
+                'ovsdb_client'],
+    # dnsmasq runs the lease client for every lease event, so it is
+    # installed as a plain script without the console_scripts launcher
+    scripts=['dhcp_leases_client.py'],
     entry_points={
         'console_scripts': ['ops_dhcp_tftp = ops_dhcp_tftp:main',
                             'dhcp_leases = dhcp_leases:main']
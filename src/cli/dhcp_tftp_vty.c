@@ -31,6 +31,7 @@
 #include <sys/stat.h>
 #include <sys/types.h>
 #include <inttypes.h>
+#include <strings.h>
 
 #include <readline/readline.h>
 #include <readline/history.h>
@@ -55,6 +56,23 @@ extern struct ovsdb_idl *idl;
 
 #define DHCP_LEASE_SCRIPT "/usr/bin/dhcp_leases"
 
+/* Characters allowed in the filters passed to the DHCP leases script */
+#define DHCP_LEASE_FILTER_CHARS "abcdefghijklmnopqrstuvwxyz" \
+                                "ABCDEFGHIJKLMNOPQRSTUVWXYZ" \
+                                "0123456789.:-/_*?[]"
+
+/*
+ * Filters of the show dhcp-server leases command, in the order of the
+ * keyword arguments of the command and named as the options of the
+ * DHCP leases script.
+ */
+static const char *dhcp_lease_filters[] = {
+    "mac", "ip", "hostname", "expiring-before", "limit", "offset"
+};
+
+#define DHCP_LEASE_FILTERS \
+    (sizeof(dhcp_lease_filters) / sizeof(dhcp_lease_filters[0]))
+
 static struct cmd_node dhcp_server_node =
 {
   DHCP_SERVER_NODE,
@@ -239,9 +257,29 @@ bool is_valid_broadcast_addr(char *start_ip,char *netmask,char *broadcast_ip)
     }
 }
 
-static int show_dhcp_leases(void)
+/*
+ * The filter value is passed on the command line of the DHCP leases
+ * script run by popen(), so only the characters of MAC addresses,
+ * IP addresses, hostnames and hostname patterns are accepted.
+ */
+static bool is_lease_filter_valid(const char *value)
+{
+    return (strlen(value) > 0 &&
+            strspn(value, DHCP_LEASE_FILTER_CHARS) == strlen(value));
+}
+
+/*
+ * Shows the DHCP leases. If values is not NULL, it holds the value of
+ * each filter of dhcp_lease_filters, or NULL for the filters which are
+ * not given, and only the leases matching all the filters are shown.
+ * The leases are filtered by the DHCP leases script, so the whole
+ * leases DB is not read here.
+ */
+static int show_dhcp_leases(const char **values)
 {
-    char cmd_buff[256];
+    char cmd_buff[1024];
+    size_t cmd_len;
+    size_t i;
     char time[256], mac_addr[256], ip_addr[256];
     char hostname[256], client_id[1024];
     FILE *leasestream;
@@ -251,8 +289,28 @@ static int show_dhcp_leases(void)
     int length;
     bool print_header = 1;
 
-    strcpy(cmd_buff, DHCP_LEASE_SCRIPT);
-    strcat(cmd_buff, " show");
+    cmd_len = snprintf(cmd_buff, sizeof(cmd_buff), "%s show",
+                       DHCP_LEASE_SCRIPT);
+
+    for (i = 0; values != NULL && i < DHCP_LEASE_FILTERS; i++) {
+        if (values[i] == NULL) {
+            continue;
+        }
+
+        if (!is_lease_filter_valid(values[i])) {
+            vty_out(vty, "Invalid %s filter.%s", dhcp_lease_filters[i],
+                    VTY_NEWLINE);
+            return CMD_ERR_NOTHING_TODO;
+        }
+
+        cmd_len += snprintf(cmd_buff + cmd_len, sizeof(cmd_buff) - cmd_len,
+                            " --%s '%s'", dhcp_lease_filters[i], values[i]);
+        if (cmd_len >= sizeof(cmd_buff)) {
+            vty_out(vty, "DHCP leases filters are too long.%s",
+                    VTY_NEWLINE);
+            return CMD_ERR_NOTHING_TODO;
+        }
+    }
 
     leasestream = popen(cmd_buff, "r");
 
@@ -1746,19 +1804,90 @@ static int dhcp_server_add_option(dhcp_srv_option_params_t *option_params)
 }
 
 
+static bool dhcp_server_static_host_has_mac(
+                    const struct ovsrec_dhcpsrv_static_host *row,
+                    const char *mac_address)
+{
+    size_t i;
+
+    for (i = 0; i < row->n_mac_addresses; i++) {
+        if (strcasecmp(row->mac_addresses[i], mac_address) == 0) {
+            return true;
+        }
+    }
+
+    return false;
+}
+
+/*
+ * Returns the static host already configured with the IP address, one
+ * of the MAC addresses, the client-id or the hostname of the new static
+ * host, or NULL. The conflicting column and value are returned in
+ * column and value. All the columns are checked in a single pass over
+ * the static hosts.
+ */
+static const struct ovsrec_dhcpsrv_static_host *
+dhcp_server_static_host_conflict(
+                    const struct ovsrec_dhcp_server *dhcp_server_row,
+                    dhcp_srv_static_host_params_t *static_host_params,
+                    char **mac_list, int num_macs,
+                    const char **column, const char **value)
+{
+    const struct ovsrec_dhcpsrv_static_host *row = NULL;
+    size_t i;
+    int j;
+
+    for (i = 0; i < dhcp_server_row->n_static_hosts; i++) {
+        row = dhcp_server_row->static_hosts[i];
+        if (strcmp(row->ip_address, static_host_params->ip_address) == 0) {
+            *column = "IP address";
+            *value = static_host_params->ip_address;
+            return row;
+        }
+
+        if (static_host_params->client_id != NULL &&
+            row->client_id != NULL &&
+            strcmp(row->client_id, static_host_params->client_id) == 0) {
+            *column = "client-id";
+            *value = static_host_params->client_id;
+            return row;
+        }
+
+        if (static_host_params->client_hostname != NULL &&
+            row->client_hostname != NULL &&
+            strcmp(row->client_hostname,
+                   static_host_params->client_hostname) == 0) {
+            *column = "hostname";
+            *value = static_host_params->client_hostname;
+            return row;
+        }
+
+        for (j = 0; j < num_macs; j++) {
+            if (dhcp_server_static_host_has_mac(row, mac_list[j])) {
+                *column = "MAC address";
+                *value = mac_list[j];
+                return row;
+            }
+        }
+    }
+
+    return NULL;
+}
+
 static int dhcp_server_add_static_host(
                             dhcp_srv_static_host_params_t *static_host_params)
 {
     const struct ovsrec_vrf *vrf_row = NULL;
     struct ovsrec_dhcp_server *dhcp_server_row = NULL;
     struct ovsrec_dhcpsrv_static_host *dhcpsrv_static_host_row = NULL;
-    struct ovsrec_dhcpsrv_static_host *dhcpsrv_static_host_temp = NULL;
+    const struct ovsrec_dhcpsrv_static_host *dhcpsrv_static_host_temp = NULL;
     struct ovsdb_idl_txn *status_txn = NULL;
     struct ovsrec_dhcpsrv_static_host **d_static_host = NULL;
     size_t i;
-    char *tags, *token, *macs;
-    char **set_tags, **mac_list;
-    int num_tags, num_macs;
+    char *tags, *token, *macs = NULL;
+    char **set_tags, **mac_list = NULL;
+    int num_tags, num_macs = 0;
+    const char *conflict_column, *conflict_value;
 
     enum ovsdb_idl_txn_status status;
 
@@ -1781,40 +1910,6 @@ static int dhcp_server_add_static_host(
             return CMD_OVSDB_FAILURE;
     }
 
-    if (!vrf_row->dhcp_server) {
-        dhcp_server_row = ovsrec_dhcp_server_insert(status_txn);
-        ovsrec_vrf_set_dhcp_server(vrf_row, dhcp_server_row);
-    } else {
-        dhcp_server_row = vrf_row->dhcp_server;
-        for (i = 0; i < dhcp_server_row->n_static_hosts; i++) {
-            dhcpsrv_static_host_temp = dhcp_server_row->static_hosts[i];
-            if (strcmp(dhcpsrv_static_host_temp->ip_address,
-                       static_host_params->ip_address) == 0) {
-                vty_out(vty, "Static host with IP address \"%s\" is "
-                             "already configured. "
-                             "Please use different IP address or delete the "
-                             "existing config and reconfigure.%s",
-                              static_host_params->ip_address, VTY_NEWLINE);
-                VLOG_ERR( "Static host with IP address \"%s\" is "
-                          "already configured.",
-                           static_host_params->ip_address);
-                cli_do_config_abort(status_txn);
-                return (CMD_SUCCESS);
-            }
-        }
-
-    }
-
-    dhcpsrv_static_host_row = ovsrec_dhcpsrv_static_host_insert(status_txn);
-    ovsrec_dhcpsrv_static_host_set_ip_address(dhcpsrv_static_host_row,
-                                      static_host_params->ip_address);
-    ovsrec_dhcpsrv_static_host_set_client_hostname(dhcpsrv_static_host_row,
-                                      static_host_params->client_hostname);
-    ovsrec_dhcpsrv_static_host_set_client_id(dhcpsrv_static_host_row,
-                                       static_host_params->client_id);
-    ovsrec_dhcpsrv_static_host_set_lease_duration(dhcpsrv_static_host_row,
-                                  &static_host_params->lease_duration, 1);
-
     if (static_host_params->mac_addresses != NULL) {
         macs=(char *)xmalloc(strlen(static_host_params->mac_addresses)+1);
         /*
@@ -1850,7 +1945,48 @@ static int dhcp_server_add_static_host(
             num_macs++;
             token=strtok(NULL, ",");
         }
+    }
 
+    if (!vrf_row->dhcp_server) {
+        dhcp_server_row = ovsrec_dhcp_server_insert(status_txn);
+        ovsrec_vrf_set_dhcp_server(vrf_row, dhcp_server_row);
+    } else {
+        dhcp_server_row = vrf_row->dhcp_server;
+        dhcpsrv_static_host_temp = dhcp_server_static_host_conflict(
+                                        dhcp_server_row, static_host_params,
+                                        mac_list, num_macs,
+                                        &conflict_column, &conflict_value);
+        if (dhcpsrv_static_host_temp != NULL) {
+            vty_out(vty, "Static host with %s \"%s\" is already "
+                         "configured for IP address \"%s\". "
+                         "Please use different %s or delete the "
+                         "existing config and reconfigure.%s",
+                          conflict_column, conflict_value,
+                          dhcpsrv_static_host_temp->ip_address,
+                          conflict_column, VTY_NEWLINE);
+            VLOG_ERR( "Static host with %s \"%s\" is already "
+                      "configured for IP address \"%s\".",
+                       conflict_column, conflict_value,
+                       dhcpsrv_static_host_temp->ip_address);
+            free(mac_list);
+            free(macs);
+            cli_do_config_abort(status_txn);
+            return (CMD_SUCCESS);
+        }
+
+    }
+
+    dhcpsrv_static_host_row = ovsrec_dhcpsrv_static_host_insert(status_txn);
+    ovsrec_dhcpsrv_static_host_set_ip_address(dhcpsrv_static_host_row,
+                                      static_host_params->ip_address);
+    ovsrec_dhcpsrv_static_host_set_client_hostname(dhcpsrv_static_host_row,
+                                      static_host_params->client_hostname);
+    ovsrec_dhcpsrv_static_host_set_client_id(dhcpsrv_static_host_row,
+                                       static_host_params->client_id);
+    ovsrec_dhcpsrv_static_host_set_lease_duration(dhcpsrv_static_host_row,
+                                  &static_host_params->lease_duration, 1);
+
+    if (mac_list != NULL) {
         ovsrec_dhcpsrv_static_host_set_mac_addresses(dhcpsrv_static_host_row,
                                                        mac_list, num_macs);
         free(mac_list);
@@ -2397,7 +2533,32 @@ DEFUN(cli_dhcp_leases_show,
       "Show DHCP leases maintained by DHCP server.\n"
       )
 {
-    return show_dhcp_leases();
+    return show_dhcp_leases(NULL);
+}
+
+DEFUN(cli_dhcp_leases_show_filter,
+      cli_dhcp_leases_show_filter_cmd,
+      "show dhcp-server leases {mac WORD | ip WORD | hostname WORD | "
+      "expiring-before <0-2147483647> | limit <0-2147483647> | "
+      "offset <0-2147483647>}",
+      SHOW_STR
+      "Display DHCP Server Configuration\n"
+      "Show DHCP leases maintained by DHCP server.\n"
+      "Show the leases of the MAC addresses starting with a prefix\n"
+      "MAC address prefix\n"
+      "Show the leases of an IP address, range (A-B) or subnet (A/LEN)\n"
+      "IP address, range or subnet\n"
+      "Show the leases of the hostnames matching a pattern\n"
+      "Hostname pattern\n"
+      "Show the leases expiring before a time, except infinite leases\n"
+      "Time in seconds since the epoch\n"
+      "Show at most a number of leases, ordered by MAC address\n"
+      "Number of leases\n"
+      "Skip a number of leases, ordered by MAC address\n"
+      "Number of leases\n"
+      )
+{
+    return show_dhcp_leases(argv);
 }
 
 DEFUN(cli_show_tftp_server,
@@ -3705,6 +3866,7 @@ cli_post_init(void)
     install_element (TFTP_SERVER_NODE, &config_exit_cmd);
     install_element (TFTP_SERVER_NODE, &config_end_cmd);
     install_element (ENABLE_NODE, &cli_dhcp_leases_show_cmd);
+    install_element (ENABLE_NODE, &cli_dhcp_leases_show_filter_cmd);
 
     install_element(DHCP_SERVER_NODE, &cli_dhcp_server_range_add_cmd);
     install_element(DHCP_SERVER_NODE, &cli_dhcp_server_range_delete_cmd);
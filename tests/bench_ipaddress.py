@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Microbenchmark of the address checks of the DHCPSrv_Range validation,
+   with the string functions of opsplugins/ipaddress.py which parse the
+   addresses at every call and with the IPAddress value type which
+   parses them once. Run it with python bench_ipaddress.py.
+'''
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'opsplugins'))
+
+import ipaddress
+
+RANGES = [('10.%d.%d.10' % (i // 256, i % 256),
+           '10.%d.%d.200' % (i // 256, i % 256),
+           '255.255.255.0',
+           '10.%d.%d.255' % (i // 256, i % 256)) for i in range(5000)]
+
+
+def check_range_strings(start_ip, end_ip, netmask, broadcast):
+    '''
+    Address checks of a range as done with the string functions.
+    '''
+    if not ipaddress.is_valid_ip_address(start_ip, netmask):
+        return False
+    if not ipaddress.is_valid_ip_address(end_ip, netmask):
+        return False
+    if ipaddress.ip_type(start_ip) != ipaddress.ip_type(end_ip):
+        return False
+    if not ipaddress.is_valid_netmask(netmask):
+        return False
+    if ipaddress.ip_type(start_ip) == 0 and \
+       not ipaddress.is_valid_net(start_ip, end_ip, netmask):
+        return False
+    if ipaddress.ip_type(start_ip) == 1:
+        return False
+    if ipaddress.ip_type(start_ip) == 0 and \
+       not ipaddress.is_valid_broadcast_addr(start_ip, netmask, broadcast):
+        return False
+    return True
+
+
+def check_range_addresses(start_ip, end_ip, netmask, broadcast):
+    '''
+    Address checks of a range as done with IPAddress.
+    '''
+    start_ip = ipaddress.IPAddress(start_ip)
+    end_ip = ipaddress.IPAddress(end_ip)
+    netmask = ipaddress.IPAddress(netmask)
+    broadcast = ipaddress.IPAddress(broadcast)
+    if not start_ip.is_valid_host(netmask) or \
+       not end_ip.is_valid_host(netmask):
+        return False
+    if start_ip.ip_type != end_ip.ip_type:
+        return False
+    if not netmask.is_valid_netmask:
+        return False
+    if start_ip.network(netmask) != end_ip.network(netmask):
+        return False
+    if start_ip.is_ipv6:
+        return False
+    if start_ip.broadcast(netmask) != broadcast.value:
+        return False
+    return True
+
+
+def bench(check_range):
+    for address_range in RANGES:
+        assert check_range(*address_range)
+
+
+def main():
+    for name, check_range in (('string functions', check_range_strings),
+                              ('IPAddress', check_range_addresses)):
+        secs = min(timeit.repeat(lambda: bench(check_range),
+                                 repeat=5, number=1))
+        print("%-16s %d ranges in %.1f msecs (%.2f usecs per range)"
+              % (name, len(RANGES), secs * 1000,
+                 secs * 1000000 / len(RANGES)))
+
+
+if __name__ == '__main__':
+    main()
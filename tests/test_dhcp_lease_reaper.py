@@ -0,0 +1,191 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Unit tests of the expired lease reaper, with the lease DB and its
+   IDL faked by objects holding the lease rows and the expiry heap.
+   Run them with py.test tests/test_dhcp_lease_reaper.py.
+'''
+
+import heapq
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import ovs.db.idl
+import dhcp_lease_reaper
+from dhcp_lease_db import DHCP_LEASES_TABLE
+from dhcp_lease_reaper import DHCPLeaseReaper
+
+NOW = 1700000000
+
+
+class FakeRow(object):
+    def __init__(self, mac_address, expiry_time):
+        self.mac_address = mac_address
+        self.expiry_time = str(expiry_time)
+
+
+class FakeTable(object):
+    def __init__(self):
+        self.rows = {}
+
+
+class FakeIdl(object):
+    def __init__(self):
+        self.tables = {DHCP_LEASES_TABLE: FakeTable()}
+        self.expiry_heap = []
+
+
+class FakeLeaseDB(object):
+    def __init__(self):
+        self.idl = FakeIdl()
+        self.status = ovs.db.idl.Transaction.SUCCESS
+        self.batches = []
+
+    @property
+    def rows(self):
+        return self.idl.tables[DHCP_LEASES_TABLE].rows
+
+    def add_lease(self, row_uuid, mac_address, expiry_time):
+        self.rows[row_uuid] = FakeRow(mac_address, expiry_time)
+        heapq.heappush(self.idl.expiry_heap, (expiry_time, row_uuid))
+
+    def delete_expired_leases(self, leases):
+        self.batches.append(leases)
+        if self.status != ovs.db.idl.Transaction.SUCCESS:
+            return 0, self.status
+
+        for mac_address, expiry_time in leases:
+            for row_uuid, row in self.rows.items():
+                if row.mac_address == mac_address and \
+                   row.expiry_time == expiry_time:
+                    del self.rows[row_uuid]
+        return len(leases), self.status
+
+
+class FakePoller(object):
+    def __init__(self):
+        self.timers = []
+
+    def timer_wait(self, msecs):
+        self.timers.append(msecs)
+
+
+def set_time(monkeypatch, now):
+    monkeypatch.setattr(dhcp_lease_reaper.time, "time", lambda: now)
+
+
+def test_reaper_expiry_order(monkeypatch):
+    set_time(monkeypatch, NOW)
+    dhcp_leases = FakeLeaseDB()
+    dhcp_leases.add_lease(1, "aa:bb:cc:dd:ee:01", NOW - 10)
+    dhcp_leases.add_lease(2, "aa:bb:cc:dd:ee:02", NOW + 60)
+    dhcp_leases.add_lease(3, "aa:bb:cc:dd:ee:03", NOW - 30)
+    dhcp_leases.add_lease(4, "aa:bb:cc:dd:ee:04", NOW)
+
+    reaper = DHCPLeaseReaper(dhcp_leases)
+    assert reaper.next_expiry_time() == NOW - 30
+
+    reaper.run()
+    assert dhcp_leases.batches == [[("aa:bb:cc:dd:ee:03", str(NOW - 30)),
+                                     ("aa:bb:cc:dd:ee:01", str(NOW - 10)),
+                                     ("aa:bb:cc:dd:ee:04", str(NOW))]]
+    assert sorted(dhcp_leases.rows) == [2]
+    assert reaper.stats['leases_reaped'] == 3
+    assert reaper.next_expiry_time() == NOW + 60
+
+    # The reaper wakes up at the next expiry
+    poller = FakePoller()
+    reaper.wait(poller)
+    assert poller.timers == [60000]
+
+
+def test_reaper_batches(monkeypatch):
+    set_time(monkeypatch, NOW)
+    dhcp_leases = FakeLeaseDB()
+    for i in range(5):
+        dhcp_leases.add_lease(i, "aa:bb:cc:dd:ee:%02x" % (i), NOW - 10 + i)
+
+    reaper = DHCPLeaseReaper(dhcp_leases, batch_size=2)
+    reaper.run()
+    assert [len(leases) for leases in dhcp_leases.batches] == [2, 2, 1]
+    assert dhcp_leases.rows == {}
+    assert reaper.next_expiry_time() is None
+
+
+def test_reaper_stale_heap_entries(monkeypatch):
+    set_time(monkeypatch, NOW)
+    dhcp_leases = FakeLeaseDB()
+    dhcp_leases.add_lease(1, "aa:bb:cc:dd:ee:01", NOW - 10)
+    dhcp_leases.add_lease(2, "aa:bb:cc:dd:ee:02", NOW - 20)
+
+    # Lease 1 was renewed and lease 2 removed since they were pushed
+    dhcp_leases.add_lease(1, "aa:bb:cc:dd:ee:01", NOW + 60)
+    del dhcp_leases.rows[2]
+
+    reaper = DHCPLeaseReaper(dhcp_leases)
+    assert reaper.next_expiry_time() == NOW + 60
+    reaper.run()
+    assert dhcp_leases.batches == []
+    assert dhcp_leases.idl.expiry_heap == [(NOW + 60, 1)]
+
+
+def test_reaper_infinite_lease(monkeypatch):
+    set_time(monkeypatch, NOW)
+    dhcp_leases = FakeLeaseDB()
+    dhcp_leases.rows[1] = FakeRow("aa:bb:cc:dd:ee:01", 0)
+
+    reaper = DHCPLeaseReaper(dhcp_leases)
+    reaper.run()
+    assert reaper.next_expiry_time() is None
+
+    poller = FakePoller()
+    reaper.wait(poller)
+    assert poller.timers == []
+
+
+def test_reaper_retry(monkeypatch):
+    set_time(monkeypatch, NOW)
+    dhcp_leases = FakeLeaseDB()
+    dhcp_leases.add_lease(1, "aa:bb:cc:dd:ee:01", NOW - 10)
+    dhcp_leases.status = ovs.db.idl.Transaction.ERROR
+
+    reaper = DHCPLeaseReaper(dhcp_leases)
+    reaper.run()
+    assert len(dhcp_leases.batches) == 1
+    assert reaper.stats['lease_reaper_errors'] == 1
+
+    # The failed leases are put back in the heap and retried after
+    # RETRY_INTERVAL
+    assert dhcp_leases.idl.expiry_heap == [(NOW - 10, 1)]
+    poller = FakePoller()
+    reaper.wait(poller)
+    assert poller.timers == [dhcp_lease_reaper.RETRY_INTERVAL * 1000]
+
+    dhcp_leases.status = ovs.db.idl.Transaction.SUCCESS
+    set_time(monkeypatch, NOW + dhcp_lease_reaper.RETRY_INTERVAL - 1)
+    reaper.run()
+    assert len(dhcp_leases.batches) == 1
+
+    set_time(monkeypatch, NOW + dhcp_lease_reaper.RETRY_INTERVAL)
+    reaper.run()
+    assert len(dhcp_leases.batches) == 2
+    assert dhcp_leases.rows == {}
+    assert reaper.stats['leases_reaped'] == 1
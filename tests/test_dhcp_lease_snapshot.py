@@ -0,0 +1,248 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Unit tests of the lease snapshot record format and of the loading,
+   appending and compaction of the snapshot file. Run them with
+   py.test tests/test_dhcp_lease_snapshot.py.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+import dhcp_lease_snapshot
+from dhcp_lease_db import dhcp_lease_from_values
+from dhcp_lease_snapshot import DHCPLeaseSnapshot
+from dhcp_lease_snapshot import LEASE_RECORD
+from dhcp_lease_snapshot import RECORD_DELETE
+from dhcp_lease_snapshot import RECORD_LEASE
+from dhcp_lease_snapshot import SNAPSHOT_HEADER
+from dhcp_lease_snapshot import pack_lease_record
+from dhcp_lease_snapshot import unpack_lease_record
+
+LEASE1 = dhcp_lease_from_values("1700000000", "aa:bb:cc:dd:ee:01",
+                                "10.0.0.1", "host1", "01:aa:bb:cc:dd:ee:01")
+LEASE2 = dhcp_lease_from_values("1700000100", "aa:bb:cc:dd:ee:02",
+                                "2001:db8::2", "*", "*")
+LEASE3 = dhcp_lease_from_values("*", "00:01:00:01:1c:39:cf:88",
+                                "*", "host3", "*")
+
+
+def snapshot_sorted(snapshot):
+    return sorted(snapshot.leases(), key=lambda lease: lease.mac_address)
+
+
+def record_size(op, lease):
+    return len(pack_lease_record(op, lease))
+
+
+def test_record_round_trip():
+    for lease in (LEASE1, LEASE2, LEASE3):
+        record = pack_lease_record(RECORD_LEASE, lease)
+        assert len(record) == LEASE_RECORD.size + \
+            sum(LEASE_RECORD.unpack_from(record)[-3:])
+        assert unpack_lease_record(record) == (RECORD_LEASE, lease)
+
+    record = pack_lease_record(RECORD_DELETE, LEASE1)
+    assert unpack_lease_record("x" * 8 + record, 8) == \
+        (RECORD_DELETE, LEASE1)
+
+
+def test_record_long_fields():
+    # Long hostnames and client ids are stored as is
+    lease = dhcp_lease_from_values("1700000000", "aa:bb:cc:dd:ee:01",
+                                   "10.0.0.1", "h" * 255,
+                                   ":".join(["ab"] * 255))
+    assert unpack_lease_record(pack_lease_record(RECORD_LEASE, lease)) == \
+        (RECORD_LEASE, lease)
+
+
+def test_record_truncated():
+    record = pack_lease_record(RECORD_LEASE, LEASE1)
+    assert unpack_lease_record(record[:LEASE_RECORD.size - 1]) is None
+    assert unpack_lease_record(record[:-1]) is None
+
+
+def test_record_corrupted():
+    record = pack_lease_record(RECORD_LEASE, LEASE1)
+    corrupted = record[:-1] + chr(ord(record[-1]) ^ 1)
+    assert unpack_lease_record(corrupted) is None
+
+    # Unknown op
+    corrupted = chr(3) + record[1:]
+    assert unpack_lease_record(corrupted) is None
+
+
+def test_snapshot_append_and_load(tmpdir):
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    assert not snapshot.load()
+
+    snapshot.reconcile([LEASE1])
+    snapshot.set_lease(LEASE2)
+    snapshot.set_lease(LEASE3)
+    snapshot.delete_lease(LEASE3.mac_address)
+    snapshot.delete_lease("aa:bb:cc:dd:ee:09")
+    snapshot.close()
+
+    assert os.path.getsize(path) == SNAPSHOT_HEADER.size + \
+        record_size(RECORD_LEASE, LEASE1) + \
+        record_size(RECORD_LEASE, LEASE2) + \
+        record_size(RECORD_LEASE, LEASE3) + \
+        record_size(RECORD_DELETE, dhcp_lease_from_values(
+            "*", LEASE3.mac_address, "*", "*", "*"))
+
+    snapshot = DHCPLeaseSnapshot(path)
+    assert snapshot.load()
+    assert snapshot_sorted(snapshot) == [LEASE1, LEASE2]
+    assert snapshot.stats['lease_snapshot_records'] == 4
+    snapshot.close()
+
+
+def test_snapshot_unchanged_lease_not_appended(tmpdir):
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    snapshot.reconcile([LEASE1])
+    snapshot.set_lease(LEASE1)
+    snapshot.close()
+
+    assert os.path.getsize(path) == SNAPSHOT_HEADER.size + \
+        record_size(RECORD_LEASE, LEASE1)
+
+
+def test_snapshot_torn_record_truncated(tmpdir):
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    snapshot.reconcile([LEASE1, LEASE2])
+    snapshot.close()
+
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(pack_lease_record(RECORD_LEASE, LEASE3)[:-1])
+
+    snapshot = DHCPLeaseSnapshot(path)
+    assert snapshot.load()
+    assert snapshot_sorted(snapshot) == [LEASE1, LEASE2]
+    assert os.path.getsize(path) == size
+
+    # New records are appended after the last valid record
+    snapshot.set_lease(LEASE3)
+    snapshot.close()
+
+    snapshot = DHCPLeaseSnapshot(path)
+    assert snapshot.load()
+    assert snapshot_sorted(snapshot) == [LEASE3, LEASE1, LEASE2]
+    snapshot.close()
+
+
+def test_snapshot_corrupted_record_truncated(tmpdir):
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    snapshot.reconcile([LEASE1])
+    snapshot.set_lease(LEASE2)
+    snapshot.set_lease(LEASE3)
+    snapshot.close()
+
+    # Corrupt the record of LEASE2, the records after it are dropped
+    offset = SNAPSHOT_HEADER.size + record_size(RECORD_LEASE, LEASE1) + \
+        record_size(RECORD_LEASE, LEASE2) - 1
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(chr(ord(byte) ^ 1))
+
+    snapshot = DHCPLeaseSnapshot(path)
+    assert snapshot.load()
+    assert snapshot_sorted(snapshot) == [LEASE1]
+    assert os.path.getsize(path) == SNAPSHOT_HEADER.size + \
+        record_size(RECORD_LEASE, LEASE1)
+    snapshot.close()
+
+
+def test_snapshot_invalid_header(tmpdir):
+    path = tmpdir.join("dhcp_leases.snap")
+    path.write(SNAPSHOT_HEADER.pack("DHCPLSN0", LEASE_RECORD.size))
+    assert not DHCPLeaseSnapshot(str(path)).load()
+
+    path.write(SNAPSHOT_HEADER.pack(dhcp_lease_snapshot.SNAPSHOT_MAGIC, 1))
+    assert not DHCPLeaseSnapshot(str(path)).load()
+
+    path.write("DHCP")
+    assert not DHCPLeaseSnapshot(str(path)).load()
+
+
+def test_snapshot_reconcile(tmpdir):
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    snapshot.reconcile([LEASE1, LEASE2])
+    assert snapshot.stats['lease_snapshot_reconciles'] == 1
+
+    # The file is not rewritten when the snapshot matches the leases
+    snapshot.reconcile([LEASE2, LEASE1])
+    assert snapshot.stats['lease_snapshot_reconciles'] == 1
+
+    snapshot.reconcile([LEASE3])
+    assert snapshot.stats['lease_snapshot_reconciles'] == 2
+    snapshot.close()
+
+    assert os.path.getsize(path) == SNAPSHOT_HEADER.size + \
+        record_size(RECORD_LEASE, LEASE3)
+    snapshot = DHCPLeaseSnapshot(path)
+    assert snapshot.load()
+    assert snapshot_sorted(snapshot) == [LEASE3]
+    snapshot.close()
+
+
+def test_snapshot_compact(tmpdir, monkeypatch):
+    monkeypatch.setattr(dhcp_lease_snapshot, "COMPACT_MIN_RECORDS", 4)
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    snapshot.reconcile([LEASE1])
+
+    for expiry_time in range(1700000001, 1700000008):
+        snapshot.set_lease(dhcp_lease_from_values(
+            str(expiry_time), LEASE1.mac_address, "10.0.0.1", "host1",
+            "01:aa:bb:cc:dd:ee:01"))
+
+    # The stale records of the MAC were dropped by the compaction
+    assert snapshot.stats['lease_snapshot_compactions'] == 1
+    assert snapshot.stats['lease_snapshot_records'] < 7
+    snapshot.close()
+
+    snapshot = DHCPLeaseSnapshot(path)
+    assert snapshot.load()
+    assert [lease.expiry_time for lease in snapshot.leases()] == \
+        [1700000007]
+    snapshot.close()
+
+
+def test_snapshot_lease_not_recorded(tmpdir):
+    path = str(tmpdir.join("dhcp_leases.snap"))
+    snapshot = DHCPLeaseSnapshot(path)
+    snapshot.reconcile([LEASE1])
+    assert snapshot.loaded
+
+    # A lease which does not fit in a record disables the snapshot
+    snapshot.set_lease(dhcp_lease_from_values(
+        "1700000000", LEASE2.mac_address, "10.0.0.2",
+        "h" * (dhcp_lease_snapshot.LEASE_RECORD_MAX_FIELD + 1), "*"))
+    assert not snapshot.loaded
+    assert snapshot.fd is None
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Unit tests of the filters and of the paging of the dhcp_leases show
+   command. Run them with py.test tests/test_dhcp_leases_show.py.
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..'))
+
+from dhcp_lease_db import CLIENT_HOSTNAME
+from dhcp_lease_db import IP_ADDR
+from dhcp_lease_db import MAC_ADDR
+from dhcp_lease_db import dhcp_lease_from_values
+from dhcp_leases import dhcp_leases_show_entries
+from dhcp_leases import dhcp_leases_show_filter
+from dhcp_leases import parse_dhcp_leases_show_args
+
+LEASES = [
+    dhcp_lease_from_values("1700000300", "aa:bb:cc:dd:ee:03", "10.0.0.3",
+                           "printer", "*"),
+    dhcp_lease_from_values("1700000100", "aa:bb:cc:dd:ee:01", "10.0.0.1",
+                           "host1", "*"),
+    dhcp_lease_from_values("1700000200", "AA:BB:CC:00:00:02", "10.0.1.2",
+                           "host2", "*"),
+    dhcp_lease_from_values("*", "00:01:00:01:1c:39:cf:88", "2001:db8::4",
+                           "*", "*"),
+]
+
+
+def show(argv, dhcp_leases=LEASES):
+    args = parse_dhcp_leases_show_args(argv)
+    where, match = dhcp_leases_show_filter(args)
+    return [dhcp_lease.mac_address for dhcp_lease in
+            dhcp_leases_show_entries(dhcp_leases, match, args)]
+
+
+def test_show_no_filter():
+    args = parse_dhcp_leases_show_args([])
+    assert dhcp_leases_show_filter(args)[0] == []
+    assert show([]) == [dhcp_lease.mac_address for dhcp_lease in LEASES]
+
+
+def test_show_mac_filter():
+    assert show(["--mac", "aa:bb:cc:dd"]) == ["aa:bb:cc:dd:ee:03",
+                                              "aa:bb:cc:dd:ee:01"]
+    assert show(["--mac", "AA:BB:CC:00"]) == ["aa:bb:cc:00:00:02"]
+    assert show(["--mac", "00:01:00:01"]) == ["00:01:00:01:1c:39:cf:88"]
+
+    # Only a full MAC address is selected by ovsdb-server
+    args = parse_dhcp_leases_show_args(["--mac", "aa:bb:cc:dd"])
+    assert dhcp_leases_show_filter(args)[0] == []
+    args = parse_dhcp_leases_show_args(["--mac", "AA:BB:CC:DD:EE:01"])
+    assert dhcp_leases_show_filter(args)[0] == \
+        [[MAC_ADDR, "==", "aa:bb:cc:dd:ee:01"]]
+
+
+def test_show_ip_filter():
+    assert show(["--ip", "10.0.0.1"]) == ["aa:bb:cc:dd:ee:01"]
+    assert show(["--ip", "10.0.0.2-10.0.1.2"]) == ["aa:bb:cc:dd:ee:03",
+                                                   "aa:bb:cc:00:00:02"]
+    assert show(["--ip", "10.0.0.0/24"]) == ["aa:bb:cc:dd:ee:03",
+                                             "aa:bb:cc:dd:ee:01"]
+    assert show(["--ip", "2001:db8::/64"]) == ["00:01:00:01:1c:39:cf:88"]
+
+    args = parse_dhcp_leases_show_args(["--ip", "10.0.0.1"])
+    assert dhcp_leases_show_filter(args)[0] == [[IP_ADDR, "==", "10.0.0.1"]]
+    args = parse_dhcp_leases_show_args(["--ip", "10.0.0.0/24"])
+    assert dhcp_leases_show_filter(args)[0] == []
+
+
+@pytest.mark.parametrize("ip_filter", ["10.0.0", "10.0.0.0/33",
+                                       "10.0.0.2-10.0.0.1",
+                                       "10.0.0.1-2001:db8::1"])
+def test_show_invalid_ip_filter(ip_filter):
+    with pytest.raises(SystemExit):
+        parse_dhcp_leases_show_args(["--ip", ip_filter])
+
+
+def test_show_hostname_filter():
+    assert show(["--hostname", "host*"]) == ["aa:bb:cc:dd:ee:01",
+                                             "aa:bb:cc:00:00:02"]
+    assert show(["--hostname", "printer"]) == ["aa:bb:cc:dd:ee:03"]
+
+    args = parse_dhcp_leases_show_args(["--hostname", "printer"])
+    assert dhcp_leases_show_filter(args)[0] == \
+        [[CLIENT_HOSTNAME, "==", "printer"]]
+    args = parse_dhcp_leases_show_args(["--hostname", "host?"])
+    assert dhcp_leases_show_filter(args)[0] == []
+
+
+def test_show_expiring_before_filter():
+    # Leases without an expiry time never match
+    assert show(["--expiring-before", "1700000200"]) == ["aa:bb:cc:dd:ee:01"]
+    assert show(["--expiring-before", "1700000201", "--ip",
+                 "10.0.1.0/24"]) == ["aa:bb:cc:00:00:02"]
+
+    # Infinite leases, with a zero expiry time, never match either
+    infinite_lease = dhcp_lease_from_values("0", "aa:bb:cc:dd:ee:05",
+                                            "10.0.0.5", "host5", "*")
+    assert show(["--expiring-before", "1700000200"],
+                LEASES + [infinite_lease]) == ["aa:bb:cc:dd:ee:01"]
+
+
+def test_show_paging():
+    assert show(["--limit", "2"]) == ["00:01:00:01:1c:39:cf:88",
+                                      "aa:bb:cc:00:00:02"]
+    assert show(["--limit", "2", "--offset", "2"]) == ["aa:bb:cc:dd:ee:01",
+                                                       "aa:bb:cc:dd:ee:03"]
+    assert show(["--offset", "3"]) == ["aa:bb:cc:dd:ee:03"]
+    assert show(["--offset", "4"]) == []
+    assert show(["--limit", "0"]) == []
+
+    # The filters are applied before the paging
+    assert show(["--mac", "aa:bb", "--limit", "1", "--offset", "1"]) == \
+        ["aa:bb:cc:dd:ee:01"]
+
+
+def test_show_paging_generator():
+    # The leases selected from ovsdb-server are paged as they are read
+    assert show(["--limit", "1", "--offset", "1"],
+                iter(LEASES)) == ["aa:bb:cc:00:00:02"]
+
+
+@pytest.mark.parametrize("count", ["-1", "x"])
+def test_show_invalid_count(count):
+    with pytest.raises(SystemExit):
+        parse_dhcp_leases_show_args(["--limit", count])
+    with pytest.raises(SystemExit):
+        parse_dhcp_leases_show_args(["--offset", count])
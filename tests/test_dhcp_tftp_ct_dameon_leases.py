@@ -61,7 +61,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                         CLI - FAILED!'
 
         sleep(10)
-        dump_bash = s1.cmd("ps -ef | grep dnsmasq")
+        dump_bash = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump_bash
         lines = dump_bash.split('\n')
         for line in lines:
@@ -106,7 +106,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                         CLI - FAILED!'
 
         sleep(10)
-        dump_bash = s1.cmd("ps -ef | grep dnsmasq")
+        dump_bash = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.hosts")
         # print dump_bash
         lines = dump_bash.split('\n')
         for line in lines:
@@ -150,7 +150,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                 option name CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.opts")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -195,7 +195,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                         option number CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.opts")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -239,7 +239,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                 number CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -281,7 +281,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                 name CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -320,7 +320,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                 CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -354,11 +354,11 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                       CLI FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
-            if "--enable-tftp" in line:
+            if "enable-tftp" in line:
                 tftp_enabled_in_use = True
                 break
 
@@ -389,11 +389,11 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                 secure  mode CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
-            if "--tftp-secure" in line:
+            if "tftp-secure" in line:
                 tftp_secure_in_use = True
                 break
 
@@ -422,11 +422,11 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
         assert tftp_path is True, 'Test to add tftp path CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
-            if "--tftp-root=/tmp/" in line:
+            if "tftp-root=/tmp/" in line:
                 tftp_path_in_use = True
                 break
 
@@ -455,11 +455,11 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                        CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
-            if "--enable-tftp" in line:
+            if "enable-tftp" in line:
                 tftp_disabled_in_use = False
                 break
 
@@ -490,11 +490,11 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                                secure mode CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
-            if "--tftp-secure" in line:
+            if "tftp-secure" in line:
                 tftp_secure_disabled_in_use = False
                 break
 
@@ -533,7 +533,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                        configuration CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -581,7 +581,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                         configuration CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.hosts")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -627,7 +627,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                         option name CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.opts")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -670,7 +670,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                          option number CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.opts")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -714,7 +714,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                         number CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -756,7 +756,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                        name CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -795,7 +795,7 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
                                        CLI - FAILED!'
 
         sleep(10)
-        dump = s1.cmd("ps -ef | grep dnsmasq")
+        dump = s1.cmd("cat /var/run/dhcp_tftp/dnsmasq.conf")
         # print dump
         lines = dump.split('\n')
         for line in lines:
@@ -816,8 +816,8 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
 
         dhcp_leases_created = False
 
-        # os.environ["DNSMASQ_LEASE_EXPIRES"] = "1440976224"
-        s1.cmd("export DNSMASQ_LEASE_EXPIRES=1440976224")
+        # The lease expires in a day, the daemon reaps the expired leases
+        s1.cmd("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))")
 
         dump = s1.cmd("dhcp_leases add 11:22:33:44:55:66 10.0.0.100 test_s1")
         # print dump
@@ -846,8 +846,8 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
 
         dhcp_leases_modified = False
 
-        # os.environ["DNSMASQ_LEASE_EXPIRES"] = "1440976224"
-        s1.cmd("export DNSMASQ_LEASE_EXPIRES=1440976224")
+        # The lease expires in a day, the daemon reaps the expired leases
+        s1.cmd("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))")
 
         s1.cmd("dhcp_leases old 11:22:33:44:55:66 20.0.0.200 test_s1_new")
 
@@ -875,8 +875,8 @@ class dhcp_tftpDaemonLeasestest(OpsVsiTest):
 
         dhcp_leases_deleted = True
 
-        # os.environ["DNSMASQ_LEASE_EXPIRES"] = "1440976224"
-        s1.cmd("export DNSMASQ_LEASE_EXPIRES=1440976224")
+        # The lease expires in a day, the daemon reaps the expired leases
+        s1.cmd("export DNSMASQ_LEASE_EXPIRES=$(($(date +%s) + 86400))")
 
         s1.cmd("dhcp_leases del 11:22:33:44:55:66 20.0.0.200 test_s1_new")
 
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Unit tests of the DHCPSrv_Static_Host uniqueness index of the
+   opsplugins, with IDL rows faked by objects holding the column
+   values. Run them with py.test tests/test_dhcpsrv_host_index.py.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'opsplugins'))
+
+import dhcpsrvhostindex
+from dhcpsrvhostindex import DHCPSrvStaticHostIndex
+
+
+class FakeRow(object):
+    def __init__(self, uuid, ip_address, mac_addresses=None, client_id=None,
+                 client_hostname=None):
+        self.uuid = uuid
+        self.columns = {"ip_address": ip_address,
+                        "mac_addresses": mac_addresses or []}
+        if client_id is not None:
+            self.columns["client_id"] = [client_id]
+        if client_hostname is not None:
+            self.columns["client_hostname"] = [client_hostname]
+
+    def __getattr__(self, column):
+        try:
+            return self.__dict__["columns"][column]
+        except KeyError:
+            raise AttributeError(column)
+
+
+class FakeTable(object):
+    name = dhcpsrvhostindex.DHCPSRV_STATIC_HOST_TABLE
+
+    def __init__(self, rows):
+        self.rows = {}
+        for row in rows:
+            row._table = self
+            self.rows[row.uuid] = row
+
+
+class FakeIdl(object):
+    def __init__(self, *rows):
+        self.change_seqno = 1
+        self.tables = {dhcpsrvhostindex.DHCPSRV_STATIC_HOST_TABLE:
+                       FakeTable(rows)}
+
+    @property
+    def rows(self):
+        return self.tables[dhcpsrvhostindex.DHCPSRV_STATIC_HOST_TABLE].rows
+
+    def notify(self, event, row, updates=None):
+        pass
+
+    def commit(self, *rows, **kwargs):
+        '''
+        Inserts or modifies the rows and deletes the deleted row UUIDs
+        as the IDL does when a change is committed.
+        '''
+        table = self.tables[dhcpsrvhostindex.DHCPSRV_STATIC_HOST_TABLE]
+        for row in rows:
+            row._table = table
+            self.rows[row.uuid] = row
+            self.notify("update", row)
+        for row_uuid in kwargs.get("deleted", ()):
+            self.notify("delete", self.rows.pop(row_uuid))
+        self.change_seqno += 1
+
+
+def test_static_host_keys():
+    row = FakeRow(1, "10.0.0.1", ["AA:BB:CC:DD:EE:01", "aa:bb:cc:dd:ee:02"],
+                  client_id="id1", client_hostname="host1")
+    assert dhcpsrvhostindex.static_host_keys(row) == [
+        ("ip_address", "10.0.0.1"),
+        ("mac_addresses", "aa:bb:cc:dd:ee:01"),
+        ("mac_addresses", "aa:bb:cc:dd:ee:02"),
+        ("client_id", "id1"),
+        ("client_hostname", "host1")]
+    assert dhcpsrvhostindex.static_host_column_keys(row.columns) == \
+        dhcpsrvhostindex.static_host_keys(row)
+
+
+def test_find_conflict():
+    idl = FakeIdl(FakeRow(1, "10.0.0.1", ["aa:bb:cc:dd:ee:01"],
+                          client_id="id1", client_hostname="host1"))
+    index = DHCPSrvStaticHostIndex(idl)
+
+    assert index.find_conflict(FakeRow(2, "10.0.0.2")) is None
+
+    column, value, row = index.find_conflict(FakeRow(3, "10.0.0.1"))
+    assert (column, value, row.uuid) == ("ip_address", "10.0.0.1", 1)
+
+    # MAC addresses are compared in lower case
+    column, value, row = index.find_conflict(
+        FakeRow(4, "10.0.0.4", ["AA:BB:CC:DD:EE:01"]))
+    assert (column, value, row.uuid) == \
+        ("mac_addresses", "aa:bb:cc:dd:ee:01", 1)
+
+    column, value, row = index.find_conflict(
+        FakeRow(5, "10.0.0.5", client_id="id1"))
+    assert (column, value, row.uuid) == ("client_id", "id1", 1)
+
+    column, value, row = index.find_conflict(
+        FakeRow(6, "10.0.0.6", client_hostname="host1"))
+    assert (column, value, row.uuid) == ("client_hostname", "host1", 1)
+
+    # The row itself is not reported
+    assert index.find_conflict(idl.rows[1]) is None
+
+
+def test_find_conflict_pending_rows():
+    idl = FakeIdl()
+    index = DHCPSrvStaticHostIndex(idl)
+
+    # Rows validated before they are committed are checked against
+    # each other
+    row = FakeRow(1, "10.0.0.1", ["aa:bb:cc:dd:ee:01"])
+    assert index.find_conflict(row) is None
+    idl.rows[1] = row
+
+    column, value, other_row = index.find_conflict(
+        FakeRow(2, "10.0.0.2", ["aa:bb:cc:dd:ee:01"]))
+    assert (column, value, other_row.uuid) == \
+        ("mac_addresses", "aa:bb:cc:dd:ee:01", 1)
+
+    # A row validated again is indexed with its new keys
+    row.columns["mac_addresses"] = ["aa:bb:cc:dd:ee:03"]
+    assert index.find_conflict(row) is None
+    assert index.find_conflict(
+        FakeRow(2, "10.0.0.2", ["aa:bb:cc:dd:ee:01"])) is None
+
+
+def test_find_row_stale_entries():
+    row = FakeRow(1, "10.0.0.1", ["aa:bb:cc:dd:ee:01"])
+    idl = FakeIdl(row, FakeRow(2, "10.0.0.2"))
+    index = DHCPSrvStaticHostIndex(idl)
+
+    # The row changed since it was indexed, its stale keys are dropped
+    # and its current keys indexed
+    row.columns["ip_address"] = "10.0.0.3"
+    assert index.find_row(("ip_address", "10.0.0.1")) is None
+    assert ("ip_address", "10.0.0.1") not in index.index
+    assert index.find_row(("ip_address", "10.0.0.3")) is row
+
+    # The row was removed since it was indexed
+    del idl.rows[2]
+    assert index.find_row(("ip_address", "10.0.0.2")) is None
+    assert 2 not in index.row_keys
+
+
+def test_dhcpsrv_static_host_index_update():
+    idl = FakeIdl(FakeRow(1, "10.0.0.1"), FakeRow(2, "10.0.0.2"))
+    index = dhcpsrvhostindex.dhcpsrv_static_host_index(idl)
+    assert dhcpsrvhostindex.dhcpsrv_static_host_index(idl) is index
+
+    # The committed changes are applied to the same index
+    row = FakeRow(1, "10.0.0.1")
+    row.columns["ip_address"] = "10.0.0.11"
+    idl.commit(row, FakeRow(3, "10.0.0.3"), deleted=[2])
+    assert dhcpsrvhostindex.dhcpsrv_static_host_index(idl) is index
+    assert index.row_keys == {1: [("ip_address", "10.0.0.11")],
+                              3: [("ip_address", "10.0.0.3")]}
+    assert index.find_row(("ip_address", "10.0.0.3")).uuid == 3
+    assert index.find_row(("ip_address", "10.0.0.1")) is None
+    assert index.find_row(("ip_address", "10.0.0.2")) is None
+
+
+def test_dhcpsrv_static_host_index_pending_row_dropped():
+    idl = FakeIdl()
+    index = dhcpsrvhostindex.dhcpsrv_static_host_index(idl)
+
+    # A row validated in a transaction which was not committed is
+    # dropped at the next change of the IDL
+    assert index.find_conflict(FakeRow(1, "10.0.0.1")) is None
+    assert 1 in index.row_keys
+    idl.commit(FakeRow(2, "10.0.0.2"))
+    dhcpsrvhostindex.dhcpsrv_static_host_index(idl)
+    assert sorted(index.row_keys) == [2]
+
+
+def test_dhcpsrv_static_host_index_resync():
+    idl = FakeIdl(FakeRow(1, "10.0.0.1"))
+    index = dhcpsrvhostindex.dhcpsrv_static_host_index(idl)
+
+    # The IDL replaces the rows dict when it resyncs the table
+    idl.tables[dhcpsrvhostindex.DHCPSRV_STATIC_HOST_TABLE] = \
+        FakeTable([FakeRow(2, "10.0.0.2")])
+    idl.change_seqno += 1
+    assert dhcpsrvhostindex.dhcpsrv_static_host_index(idl) is index
+    assert sorted(index.row_keys) == [2]
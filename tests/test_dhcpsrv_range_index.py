@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Unit tests of the DHCPSrv_Range interval index of the opsplugins,
+   with IDL rows faked by objects holding the column values. Run them
+   with py.test tests/test_dhcpsrv_range_index.py.
+'''
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'opsplugins'))
+
+import ipaddress
+import dhcpsrvrangeindex
+from dhcpsrvrangeindex import DHCPSrvRangeIndex
+
+
+class FakeRow(object):
+    def __init__(self, uuid, start_ip, end_ip=None):
+        self.uuid = uuid
+        self.columns = {"start_ip_address": start_ip}
+        if end_ip is not None:
+            self.columns["end_ip_address"] = [end_ip]
+
+    def __getattr__(self, column):
+        try:
+            return self.__dict__["columns"][column]
+        except KeyError:
+            raise AttributeError(column)
+
+
+class FakeTable(object):
+    name = dhcpsrvrangeindex.DHCPSRV_RANGE_TABLE
+
+    def __init__(self, rows):
+        self.rows = {}
+        for row in rows:
+            row._table = self
+            self.rows[row.uuid] = row
+
+
+class FakeIdl(object):
+    def __init__(self, *rows):
+        self.change_seqno = 1
+        self.tables = {dhcpsrvrangeindex.DHCPSRV_RANGE_TABLE:
+                       FakeTable(rows)}
+
+    @property
+    def rows(self):
+        return self.tables[dhcpsrvrangeindex.DHCPSRV_RANGE_TABLE].rows
+
+    def add(self, row):
+        self.rows[row.uuid] = row
+
+    def notify(self, event, row, updates=None):
+        pass
+
+    def commit(self, *rows, **kwargs):
+        '''
+        Inserts or modifies the rows and deletes the deleted row UUIDs
+        as the IDL does when a change is committed.
+        '''
+        for row in rows:
+            row._table = self.tables[dhcpsrvrangeindex.DHCPSRV_RANGE_TABLE]
+            self.rows[row.uuid] = row
+            self.notify("update", row)
+        for row_uuid in kwargs.get("deleted", ()):
+            self.notify("delete", self.rows.pop(row_uuid))
+        self.change_seqno += 1
+
+
+def uuids(rows):
+    return [row.uuid for row in rows]
+
+
+def interval(start_ip, end_ip):
+    return dhcpsrvrangeindex.address_interval(ipaddress.IPAddress(start_ip),
+                                              ipaddress.IPAddress(end_ip))
+
+
+def test_range_interval():
+    assert dhcpsrvrangeindex.range_interval(
+        FakeRow(1, "10.0.0.10", "10.0.0.20")) == \
+        (dhcpsrvrangeindex.IPV4, 0x0a00000a, 0x0a000014)
+    assert dhcpsrvrangeindex.range_interval(FakeRow(1, "10.0.0.10")) == \
+        (dhcpsrvrangeindex.IPV4, 0x0a00000a, 0x0a00000a)
+    assert dhcpsrvrangeindex.range_interval(
+        FakeRow(1, "10.0.0.10", "2001:db8::1")) is None
+    assert dhcpsrvrangeindex.range_interval(FakeRow(1, "bad")) is None
+
+
+def test_find_ranges_overlapping():
+    idl = FakeIdl(FakeRow(1, "10.0.0.10", "10.0.0.20"),
+                  FakeRow(2, "10.0.1.10", "10.0.1.20"),
+                  FakeRow(3, "2001:db8::10", "2001:db8::20"))
+    index = DHCPSrvRangeIndex(idl)
+
+    rows = index.find_ranges(*interval("10.0.0.15", "10.0.0.30"))
+    assert uuids(rows) == [1]
+
+    rows = index.find_ranges(*interval("10.0.1.1", "10.0.1.10"))
+    assert uuids(rows) == [2]
+
+    rows = index.find_ranges(*interval("2001:db8::1", "2001:db8::10"))
+    assert uuids(rows) == [3]
+
+    # The row itself is not reported
+    assert index.find_ranges(*interval("10.0.0.15", "10.0.0.30"),
+                             row_uuid=1) == []
+
+
+def test_find_ranges_nested():
+    # The long range starts first and the nested range is kept aside
+    idl = FakeIdl(FakeRow(1, "10.0.0.1", "10.0.0.200"),
+                  FakeRow(2, "10.0.0.10", "10.0.0.20"))
+    index = DHCPSrvRangeIndex(idl)
+
+    rows = index.find_ranges(*interval("10.0.0.100", "10.0.0.110"))
+    assert uuids(rows) == [1]
+
+    rows = index.find_ranges(*interval("10.0.0.100", "10.0.0.110"),
+                             row_uuid=1)
+    assert rows == []
+
+
+def test_find_ranges_adjacent():
+    idl = FakeIdl(FakeRow(1, "10.0.0.10", "10.0.0.20"))
+    index = DHCPSrvRangeIndex(idl)
+
+    assert index.find_ranges(*interval("10.0.0.21", "10.0.0.30")) == []
+    assert index.find_ranges(*interval("10.0.0.1", "10.0.0.9")) == []
+    rows = index.find_ranges(*interval("10.0.0.20", "10.0.0.30"))
+    assert uuids(rows) == [1]
+    rows = index.find_ranges(*interval("10.0.0.1", "10.0.0.10"))
+    assert uuids(rows) == [1]
+
+
+def test_find_ranges_other_family():
+    idl = FakeIdl(FakeRow(1, "0.0.0.1", "0.0.0.20"))
+    index = DHCPSrvRangeIndex(idl)
+
+    assert index.find_ranges(*interval("::1", "::20")) == []
+
+
+def test_find_ranges_stale_entry():
+    row = FakeRow(1, "10.0.0.10", "10.0.0.20")
+    idl = FakeIdl(row, FakeRow(2, "10.0.0.30", "10.0.0.40"))
+    index = DHCPSrvRangeIndex(idl)
+
+    # The indexed range of row 1 is stale, it is re-indexed with its
+    # current range when it is found
+    row.columns["start_ip_address"] = "10.0.0.50"
+    row.columns["end_ip_address"] = ["10.0.0.60"]
+    rows = index.find_ranges(*interval("10.0.0.15", "10.0.0.35"))
+    assert uuids(rows) == [2]
+
+    # The new range of the row is indexed once it is validated
+    assert index.find_overlap(row) is None
+    rows = index.find_ranges(*interval("10.0.0.55", "10.0.0.56"))
+    assert uuids(rows) == [1]
+
+    del idl.rows[2]
+    assert index.find_ranges(*interval("10.0.0.30", "10.0.0.35")) == []
+
+
+def test_find_overlap_pending_rows():
+    idl = FakeIdl(FakeRow(1, "10.0.0.10", "10.0.0.20"))
+    index = DHCPSrvRangeIndex(idl)
+
+    overlap = index.find_overlap(FakeRow(2, "10.0.0.20", "10.0.0.30"))
+    assert overlap.uuid == 1
+
+    # Rows validated before they are committed are checked against
+    # each other
+    row = FakeRow(3, "10.0.0.30", "10.0.0.40")
+    assert index.find_overlap(row) is None
+    idl.add(row)
+    overlap = index.find_overlap(FakeRow(4, "10.0.0.35", "10.0.0.50"))
+    assert overlap.uuid == 3
+
+    # A pending row validated again with a new range is not reported
+    # with its previous range
+    row.columns["start_ip_address"] = "10.0.0.100"
+    row.columns["end_ip_address"] = ["10.0.0.110"]
+    assert index.find_overlap(row) is None
+    assert index.find_overlap(FakeRow(4, "10.0.0.35", "10.0.0.50")) is None
+
+
+def test_find_overlap_pending_row_removed():
+    idl = FakeIdl()
+    index = DHCPSrvRangeIndex(idl)
+
+    # A pending row which was never committed is dropped
+    assert index.find_overlap(FakeRow(1, "10.0.0.10", "10.0.0.20")) is None
+    assert index.find_overlap(FakeRow(2, "10.0.0.15", "10.0.0.25")) is None
+
+
+def test_find_ranges_overlapping_rows():
+    # Overlapping ranges configured without the validation are kept
+    # aside and still found
+    idl = FakeIdl(FakeRow(1, "10.0.0.1", "10.0.0.100"),
+                  FakeRow(2, "10.0.0.50", "10.0.0.150"),
+                  FakeRow(3, "10.0.0.200", "10.0.0.210"))
+    index = DHCPSrvRangeIndex(idl)
+    assert sorted(index.overlapping) == [2]
+
+    rows = index.find_ranges(*interval("10.0.0.120", "10.0.0.130"))
+    assert uuids(rows) == [2]
+    rows = index.find_ranges(*interval("10.0.0.60", "10.0.0.70"))
+    assert sorted(uuids(rows)) == [1, 2]
+    assert index.find_ranges(*interval("10.0.0.160", "10.0.0.199")) == []
+
+
+def test_dhcpsrv_range_index_update():
+    idl = FakeIdl(FakeRow(1, "10.0.0.10", "10.0.0.20"),
+                  FakeRow(2, "10.0.1.10", "10.0.1.20"))
+    index = dhcpsrvrangeindex.dhcpsrv_range_index(idl)
+    assert dhcpsrvrangeindex.dhcpsrv_range_index(idl) is index
+
+    # The committed changes are applied to the same index
+    idl.commit(FakeRow(1, "10.0.0.30", "10.0.0.40"),
+               FakeRow(3, "10.0.2.10", "10.0.2.20"), deleted=[2])
+    assert dhcpsrvrangeindex.dhcpsrv_range_index(idl) is index
+    assert index.entries[dhcpsrvrangeindex.IPV4] == [
+        (0x0a00001e, 0x0a000028, 1), (0x0a00020a, 0x0a000214, 3)]
+    assert index.find_ranges(*interval("10.0.0.15", "10.0.0.16")) == []
+    assert index.find_ranges(*interval("10.0.1.15", "10.0.1.16")) == []
+    rows = index.find_ranges(*interval("10.0.2.15", "10.0.2.16"))
+    assert uuids(rows) == [3]
+
+
+def test_dhcpsrv_range_index_pending_row_dropped():
+    idl = FakeIdl()
+    index = dhcpsrvrangeindex.dhcpsrv_range_index(idl)
+
+    # A row validated in a transaction which was not committed is
+    # dropped at the next change of the IDL
+    assert index.find_overlap(FakeRow(1, "10.0.0.10", "10.0.0.20")) is None
+    assert 1 in index.intervals
+    idl.commit(FakeRow(2, "10.0.1.10", "10.0.1.20"))
+    dhcpsrvrangeindex.dhcpsrv_range_index(idl)
+    assert sorted(index.intervals) == [2]
+
+
+def test_dhcpsrv_range_index_resync():
+    idl = FakeIdl(FakeRow(1, "10.0.0.10", "10.0.0.20"))
+    index = dhcpsrvrangeindex.dhcpsrv_range_index(idl)
+
+    # The IDL replaces the rows dict when it resyncs the table
+    idl.tables[dhcpsrvrangeindex.DHCPSRV_RANGE_TABLE] = \
+        FakeTable([FakeRow(2, "10.0.1.10", "10.0.1.20")])
+    idl.change_seqno += 1
+    assert dhcpsrvrangeindex.dhcpsrv_range_index(idl) is index
+    assert sorted(index.intervals) == [2]
+    rows = index.find_ranges(*interval("10.0.1.15", "10.0.1.16"))
+    assert uuids(rows) == [2]
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# Copyright (C) 2016 Hewlett Packard Enterprise Development LP
+# All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+# http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+'''
+NOTES:
+ - Unit tests of the address checks of opsplugins/ipaddress.py, for the
+   string functions and the IPAddress value type. Run them with
+   py.test tests/test_ipaddress.py.
+'''
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                '..', 'opsplugins'))
+
+import ipaddress
+from ipaddress import IPAddress
+
+
+@pytest.mark.parametrize("ip, ip_type, value", [
+    ("10.0.0.1", ipaddress.IP_TYPE_IPV4, 0x0a000001),
+    ("2001:db8::1", ipaddress.IP_TYPE_IPV6, 0x20010db8 << 96 | 1),
+    ("10.0.0", ipaddress.IP_TYPE_INVALID, None),
+    (None, ipaddress.IP_TYPE_NONE, None),
+])
+def test_ip_address_parse(ip, ip_type, value):
+    address = IPAddress(ip)
+    assert address.ip_type == ip_type == ipaddress.ip_type(ip)
+    assert address.value == value
+    assert str(address) == str(ip)
+
+
+@pytest.mark.parametrize("ip, valid", [
+    ("10.0.0.1", True),
+    ("192.168.1.100", True),
+    ("0.0.0.0", False),
+    ("127.0.0.1", False),
+    ("224.0.0.1", False),
+    ("240.0.0.1", False),
+    ("255.255.255.255", False),
+    # Without a netmask, addresses ending in .0 or .255 are rejected
+    ("10.0.0.0", False),
+    ("10.0.0.255", False),
+    ("10.0.1.255", False),
+    ("2001:db8::1", True),
+    ("::", False),
+    ("::1", False),
+    ("fe80::1", False),
+    ("fec0::1", False),
+    ("ff02::1", False),
+    ("10.0.0", False),
+])
+def test_is_valid(ip, valid):
+    assert IPAddress(ip).is_valid == valid
+    assert IPAddress(ip).is_valid_host() == valid
+    assert ipaddress.is_valid_ip_address(ip) == valid
+
+
+@pytest.mark.parametrize("ip, netmask, valid", [
+    ("10.0.0.1", "255.255.255.0", True),
+    ("10.0.0.0", "255.255.255.0", False),
+    ("10.0.0.255", "255.255.255.0", False),
+    # Addresses ending in .0 or .255 inside a larger subnet
+    ("10.0.0.255", "255.255.254.0", True),
+    ("10.0.1.0", "255.255.254.0", True),
+    ("10.0.1.255", "255.255.254.0", False),
+    # /31 and /32 subnets have no network or broadcast address
+    ("10.0.0.0", "255.255.255.254", True),
+    ("10.0.0.1", "255.255.255.254", True),
+    ("10.0.0.1", "255.255.255.255", True),
+    ("127.0.0.1", "255.255.255.0", False),
+    ("255.255.255.255", "255.255.254.0", False),
+    ("2001:db8::", "255.255.255.0", True),
+])
+def test_is_valid_host(ip, netmask, valid):
+    assert IPAddress(ip).is_valid_host(IPAddress(netmask)) == valid
+    assert ipaddress.is_valid_ip_address(ip, netmask) == valid
+
+
+@pytest.mark.parametrize("netmask, valid", [
+    ("255.255.255.0", True),
+    ("255.255.254.0", True),
+    ("255.255.255.255", True),
+    ("255.255.255.254", True),
+    ("0.0.0.0", True),
+    ("255.255.0.255", False),
+    ("255.255.255.1", False),
+])
+def test_is_valid_netmask(netmask, valid):
+    assert IPAddress(netmask).is_valid_netmask == valid
+    assert ipaddress.is_valid_netmask(netmask) == valid
+
+
+def test_is_valid_netmask_ipv6():
+    assert not IPAddress("ffff::").is_valid_netmask
+
+
+@pytest.mark.parametrize("ip, netmask, network, broadcast", [
+    ("10.0.0.10", "255.255.255.0", "10.0.0.0", "10.0.0.255"),
+    ("10.0.1.10", "255.255.254.0", "10.0.0.0", "10.0.1.255"),
+    ("10.0.0.1", "255.255.255.254", "10.0.0.0", "10.0.0.1"),
+    ("10.0.0.1", "255.255.255.255", "10.0.0.1", "10.0.0.1"),
+])
+def test_network_broadcast(ip, netmask, network, broadcast):
+    address = IPAddress(ip)
+    netmask = IPAddress(netmask)
+    assert address.network(netmask) == IPAddress(network).value
+    assert address.broadcast(netmask) == IPAddress(broadcast).value
+    assert ipaddress.is_valid_broadcast_addr(ip, str(netmask), broadcast)
+
+
+def test_is_valid_net():
+    assert ipaddress.is_valid_net("10.0.0.1", "10.0.1.254", "255.255.254.0")
+    assert not ipaddress.is_valid_net("10.0.0.1", "10.0.1.254",
+                                      "255.255.255.0")
+    assert IPAddress("10.0.0.1").network(IPAddress("255.255.254.0")) == \
+        IPAddress("10.0.1.254").network(IPAddress("255.255.254.0"))